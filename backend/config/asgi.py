@@ -2,6 +2,7 @@
 ASGI config for config project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Server-sent request events are served on the same application.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
@@ -13,4 +14,14 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported after Django is set up, the stream uses the ORM
+from procurement.streaming import EVENT_STREAM_PATH, event_stream  # noqa: E402
+
+
+async def application(scope, receive, send):
+    # CORS preflights go to Django, where CorsMiddleware answers them
+    if scope['type'] == 'http' and scope['path'] == EVENT_STREAM_PATH and scope['method'] != 'OPTIONS':
+        return await event_stream(scope, receive, send)
+    return await django_application(scope, receive, send)
@@ -15,6 +15,7 @@ import os
 from dotenv import load_dotenv
 from datetime import timedelta
 import dj_database_url
+from corsheaders.defaults import default_headers
 
 load_dotenv()
 
@@ -55,6 +56,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'procurement.metrics.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',  # Add WhiteNoise
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -171,11 +173,15 @@ AUTH_USER_MODEL = 'procurement.User'
 # REST Framework Configuration
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'procurement.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
+    'DEFAULT_RENDERER_CLASSES': (
+        'procurement.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 10,
 }
@@ -187,8 +193,14 @@ SIMPLE_JWT = {
     'ROTATE_REFRESH_TOKENS': False,
     'BLACKLIST_AFTER_ROTATION': True,
     'AUTH_HEADER_TYPES': ('Bearer',),
+    'TOKEN_OBTAIN_SERIALIZER': 'procurement.serializers.RoleTokenObtainPairSerializer',
+    'TOKEN_REFRESH_SERIALIZER': 'procurement.serializers.RoleTokenRefreshSerializer',
 }
 
+# Users resolved from access tokens are cached per process for this long (seconds)
+AUTH_USER_CACHE_TTL = int(os.getenv('AUTH_USER_CACHE_TTL', '60'))
+AUTH_USER_CACHE_SIZE = int(os.getenv('AUTH_USER_CACHE_SIZE', '10000'))
+
 # CORS Settings
 # In production, restrict to specific origins
 if DEBUG:
@@ -199,10 +211,128 @@ else:
         "https://your-custom-domain.com",  # Update with your actual domain
     ]
 CORS_ALLOW_CREDENTIALS = True
+CORS_ALLOW_HEADERS = (*default_headers, 'idempotency-key')
+CORS_EXPOSE_HEADERS = ('idempotent-replayed', 'retry-after')
 
 # Media Files Configuration
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Document downloads use signed URLs valid for this many seconds
+DOCUMENT_URL_MAX_AGE = int(os.getenv('DOCUMENT_URL_MAX_AGE', '900'))
+# When set (e.g. '/protected-media/'), a front server that sends X-Sendfile-Type: X-Accel-Redirect
+# streams documents itself (see frontend/nginx.conf)
+DOCUMENT_ACCEL_REDIRECT_PREFIX = os.getenv('DOCUMENT_ACCEL_REDIRECT_PREFIX', '')
+
+# Document previews: thumbnail bounding boxes in pixels, pages rendered, background threads
+PREVIEW_SIZES = (128, 512, 1024)
+PREVIEW_PAGES = int(os.getenv('PREVIEW_PAGES', '1'))
+PREVIEW_WORKERS = int(os.getenv('PREVIEW_WORKERS', '2'))
+# Preview jobs queued or running at most; more are dropped until the preview is asked for again
+PREVIEW_QUEUE_SIZE = int(os.getenv('PREVIEW_QUEUE_SIZE', '100'))
+
+# Push events (server-sent events on the ASGI application)
+PUSH_EVENTS_POLL_INTERVAL = float(os.getenv('PUSH_EVENTS_POLL_INTERVAL', '1.0'))
+PUSH_EVENTS_KEEPALIVE = float(os.getenv('PUSH_EVENTS_KEEPALIVE', '20'))
+# Tickets from /api/events/ticket/ open a stream for this many seconds
+PUSH_EVENTS_TICKET_MAX_AGE = int(os.getenv('PUSH_EVENTS_TICKET_MAX_AGE', '30'))
+PUSH_EVENTS_QUEUE_SIZE = 100
+PUSH_EVENTS_RETENTION_MINUTES = int(os.getenv('PUSH_EVENTS_RETENTION_MINUTES', '60'))
+PUSH_EVENTS_PRUNE_EVERY = 300  # polls
+
+# Logging: one JSON object per line on stdout
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'json': {'()': 'procurement.logs.JSONFormatter'},
+    },
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler', 'formatter': 'json'},
+    },
+    'root': {'handlers': ['console'], 'level': os.getenv('LOG_LEVEL', 'INFO')},
+    'loggers': {
+        'django': {'handlers': ['console'], 'level': os.getenv('DJANGO_LOG_LEVEL', 'WARNING'), 'propagate': False},
+    },
+}
+
+# Idempotency-Key responses are replayed for this many hours
+IDEMPOTENCY_KEY_TTL = int(os.getenv('IDEMPOTENCY_KEY_TTL', '24'))
+# A key still in progress after this many seconds is considered abandoned
+IDEMPOTENCY_LOCK_TIMEOUT = int(os.getenv('IDEMPOTENCY_LOCK_TIMEOUT', '300'))
+
+# Limits on the actions that process documents (create with a proforma, approve, submit_receipt).
+# Token buckets of "<requests>/<second|minute|hour|day>", per user and shared by each role.
+DOCUMENT_THROTTLE_USER_RATES = {
+    'staff': os.getenv('DOCUMENT_THROTTLE_STAFF_RATE', '30/hour'),
+    'approver-level-1': os.getenv('DOCUMENT_THROTTLE_APPROVER_RATE', '120/hour'),
+    'approver-level-2': os.getenv('DOCUMENT_THROTTLE_APPROVER_RATE', '120/hour'),
+    'finance': os.getenv('DOCUMENT_THROTTLE_FINANCE_RATE', '120/hour'),
+}
+DOCUMENT_THROTTLE_ROLE_RATES = {
+    'staff': os.getenv('DOCUMENT_THROTTLE_STAFF_ROLE_RATE', '600/hour'),
+    'approver-level-1': os.getenv('DOCUMENT_THROTTLE_APPROVER_ROLE_RATE', '600/hour'),
+    'approver-level-2': os.getenv('DOCUMENT_THROTTLE_APPROVER_ROLE_RATE', '600/hour'),
+    'finance': os.getenv('DOCUMENT_THROTTLE_FINANCE_ROLE_RATE', '600/hour'),
+}
+# Requests processing documents at the same time, across all workers
+EXTRACTION_SLOTS = int(os.getenv('EXTRACTION_SLOTS', '4'))
+# A slot held longer than this (seconds) is considered abandoned
+EXTRACTION_SLOT_LEASE = int(os.getenv('EXTRACTION_SLOT_LEASE', '300'))
+EXTRACTION_SLOT_RETRY_AFTER = int(os.getenv('EXTRACTION_SLOT_RETRY_AFTER', '5'))
+
+# Vendor matching: minimum trigram similarity (0-1) for a document's vendor
+# name to resolve to an existing vendor instead of creating a new one
+VENDOR_MATCH_THRESHOLD = float(os.getenv('VENDOR_MATCH_THRESHOLD', '0.6'))
+
+# Duplicate detection: minimum estimated similarity (0-1) of two proformas or
+# receipts for the later request to be flagged as a likely duplicate
+DUPLICATE_SIMILARITY_THRESHOLD = float(os.getenv('DUPLICATE_SIMILARITY_THRESHOLD', '0.8'))
+
+# Admin changelists count matching rows up to this many, instead of an exact COUNT(*)
+ADMIN_COUNT_LIMIT = int(os.getenv('ADMIN_COUNT_LIMIT', '10000'))
+
+# Approval routing: how often (seconds) each process checks whether the
+# routing rules changed and its compiled decision table must be rebuilt
+ROUTING_RULES_RECHECK = float(os.getenv('ROUTING_RULES_RECHECK', '5'))
+
+# Email, used for notification digests
+EMAIL_BACKEND = os.getenv('EMAIL_BACKEND', 'django.core.mail.backends.smtp.EmailBackend')
+EMAIL_HOST = os.getenv('EMAIL_HOST', 'localhost')
+EMAIL_PORT = int(os.getenv('EMAIL_PORT', '25'))
+EMAIL_HOST_USER = os.getenv('EMAIL_HOST_USER', '')
+EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD', '')
+EMAIL_USE_TLS = os.getenv('EMAIL_USE_TLS', 'False') == 'True'
+DEFAULT_FROM_EMAIL = os.getenv('DEFAULT_FROM_EMAIL', 'procurement@localhost')
+
+# Notifications: dotted path of the transport class sending digests, how long
+# (seconds) a user's notifications are collected into one digest, and how
+# many times a failing digest is retried
+NOTIFICATION_TRANSPORT = os.getenv('NOTIFICATION_TRANSPORT', 'procurement.notifications.EmailTransport')
+NOTIFICATION_DIGEST_WINDOW = int(os.getenv('NOTIFICATION_DIGEST_WINDOW', '300'))
+NOTIFICATION_MAX_ATTEMPTS = int(os.getenv('NOTIFICATION_MAX_ATTEMPTS', '5'))
+
+# Closed requests created this many months ago are moved to the archive tables
+ARCHIVE_AFTER_MONTHS = int(os.getenv('ARCHIVE_AFTER_MONTHS', '12'))
+
+# Currency conversion: amounts are also stored in this currency, and each
+# process rechecks for newly loaded exchange rates this often (seconds)
+FX_BASE_CURRENCY = os.getenv('FX_BASE_CURRENCY', 'USD')
+FX_RATES_RECHECK = float(os.getenv('FX_RATES_RECHECK', '60'))
+# Receipts in another currency than the PO match when their converted totals
+# are within this fraction of each other
+FX_MATCH_TOLERANCE = float(os.getenv('FX_MATCH_TOLERANCE', '0.02'))
+
+# Approval SLAs: hours each level has to approve, counted from the previous
+# level's deadline (the first from creation); overdue requests are escalated
+# to users with SLA_ESCALATION_ROLE by escalate_overdue
+APPROVAL_SLA_HOURS = {
+    'approver-level-1': float(os.getenv('APPROVAL_SLA_LEVEL_1_HOURS', '48')),
+    'approver-level-2': float(os.getenv('APPROVAL_SLA_LEVEL_2_HOURS', '48')),
+    'finance': float(os.getenv('APPROVAL_SLA_FINANCE_HOURS', '72')),
+}
+APPROVAL_SLA_DEFAULT_HOURS = float(os.getenv('APPROVAL_SLA_DEFAULT_HOURS', '48'))
+SLA_ESCALATION_ROLE = os.getenv('SLA_ESCALATION_ROLE', 'finance')
+
 # OpenAI API Key
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY', '')
@@ -1,7 +1,5 @@
 from django.contrib import admin
 from django.urls import path, include
-from django.conf import settings
-from django.conf.urls.static import static
 from django.http import JsonResponse
 from rest_framework.routers import DefaultRouter
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
@@ -9,7 +7,9 @@ from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
 from rest_framework import permissions
 
-from procurement.views import UserViewSet, PurchaseRequestViewSet, ApprovalViewSet
+from procurement.downloads import download_document
+from procurement.metrics import metrics_view
+from procurement.views import UserViewSet, PurchaseRequestViewSet, ApprovalViewSet, event_stream_ticket
 
 # Health check view
 def health_check(request):
@@ -40,6 +40,13 @@ urlpatterns = [
 
     # Health check endpoint
     path('health/', health_check, name='health_check'),
+    path('metrics/', metrics_view, name='metrics'),
+
+    # Signed document downloads; media files are never served without a signature
+    path('api/documents/<str:token>/', download_document, name='document_download'),
+
+    # Tickets for /api/events/stream/, which the ASGI application serves
+    path('api/events/ticket/', event_stream_ticket, name='event_stream_ticket'),
 
     # API URLs
     path('api/', include(router.urls)),
@@ -53,7 +60,3 @@ urlpatterns = [
     path('redoc/', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
     path('swagger.json', schema_view.without_ui(cache_timeout=0), name='schema-json'),
 ]
-
-# Serve media files in development
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -23,6 +23,8 @@ else:
     print('Superuser already exists')
 "
 
-# Start server
+# Start server: the ASGI application, which also serves /api/events/stream/
+# (runserver is WSGI only). --reload picks up edits in the mounted source.
 echo "Starting Django server..."
-python manage.py runserver 0.0.0.0:8000
+exec gunicorn config.asgi:application --bind 0.0.0.0:8000 --workers 2 \
+  --worker-class uvicorn.workers.UvicornWorker --reload
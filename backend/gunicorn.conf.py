@@ -0,0 +1,24 @@
+# Loaded automatically by gunicorn when started from this directory.
+#
+# PRELOAD_DOCUMENT_STACK controls when workers import the document libraries
+# (pdfplumber, pytesseract, PIL, openai):
+#   unset   on the first request that processes a document
+#   worker  right after each worker boots, before it takes traffic
+#   master  once in the master; forked workers share those pages
+import os
+
+preload = os.getenv('PRELOAD_DOCUMENT_STACK', '').lower()
+
+
+def on_starting(server):
+    if preload == 'master':
+        import openai  # noqa: F401
+        import pdfplumber  # noqa: F401
+        import pytesseract  # noqa: F401
+        from PIL import Image  # noqa: F401
+
+
+def post_worker_init(worker):
+    if preload in ('worker', 'master'):
+        from procurement.extraction import warm_up
+        worker.log.info('Document stack loaded in %.2fs', warm_up())
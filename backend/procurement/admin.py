@@ -1,6 +1,13 @@
+import json
+
+from django.conf import settings
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
-from .models import User, PurchaseRequest, Approval
+from django.core.paginator import Paginator
+from django.db import connection
+from django.utils.functional import cached_property
+from django.utils.html import format_html
+from .models import User, PurchaseRequest, Approval, RoutingRule, Vendor
 
 
 @admin.register(User)
@@ -18,18 +25,48 @@ class UserAdmin(BaseUserAdmin):
     )
 
 
+class EstimatedCountPaginator(Paginator):
+    """
+    Changelist paginator that never runs an unbounded COUNT(*).
+
+    Unfiltered lists on PostgreSQL use the planner's row estimate; anything
+    else is counted up to ADMIN_COUNT_LIMIT rows, and shows that many pages.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if connection.vendor == 'postgresql' and not queryset.query.where:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE relname = %s', [queryset.model._meta.db_table])
+                row = cursor.fetchone()
+            if row and row[0] > settings.ADMIN_COUNT_LIMIT:
+                return row[0]
+        return queryset.order_by()[:settings.ADMIN_COUNT_LIMIT].count()
+
+
 class ApprovalInline(admin.TabularInline):
     model = Approval
     extra = 0
     readonly_fields = ('approved_at',)
+    autocomplete_fields = ('approver',)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('approver')
 
 
 @admin.register(PurchaseRequest)
 class PurchaseRequestAdmin(admin.ModelAdmin):
     list_display = ('title', 'created_by', 'amount', 'status', 'created_at')
     list_filter = ('status', 'created_at')
-    search_fields = ('title', 'description', 'created_by__username')
-    readonly_fields = ('created_at', 'updated_at')
+    list_select_related = ('created_by',)
+    # Title and description substring searches use pg_trgm indexes on PostgreSQL, the
+    # exact username search the upper(username) index
+    search_fields = ('title', 'description', '=created_by__username')
+    readonly_fields = ('created_at', 'updated_at', 'document_data')
+    autocomplete_fields = ('created_by', 'proforma_vendor', 'receipt_vendor')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     inlines = [ApprovalInline]
 
     fieldsets = (
@@ -37,18 +74,59 @@ class PurchaseRequestAdmin(admin.ModelAdmin):
             'fields': ('title', 'description', 'amount', 'status', 'created_by')
         }),
         ('Documents', {
-            'fields': ('proforma', 'proforma_data', 'purchase_order', 'purchase_order_data',
-                      'receipt', 'receipt_data', 'receipt_validation')
+            'fields': ('proforma', 'proforma_vendor', 'purchase_order', 'receipt', 'receipt_vendor')
+        }),
+        ('Extracted data', {
+            'classes': ('collapse',),
+            'fields': ('document_data',)
         }),
         ('Timestamps', {
             'fields': ('created_at', 'updated_at')
         }),
     )
 
+    def get_queryset(self, request):
+        # The JSON document fields can be large; saving a deferred instance leaves them untouched
+        return super().get_queryset(request).defer(*PurchaseRequest.JSON_FIELDS)
+
+    @admin.display(description='Extracted data')
+    def document_data(self, obj):
+        if obj.pk is None:
+            return '-'
+        values = PurchaseRequest.objects.filter(pk=obj.pk).values(*PurchaseRequest.JSON_FIELDS).first() or {}
+        return format_html('<pre style="white-space: pre-wrap">{}</pre>', json.dumps(values, indent=2, default=str))
+
 
 @admin.register(Approval)
 class ApprovalAdmin(admin.ModelAdmin):
     list_display = ('purchase_request', 'approver', 'approved', 'approved_at')
     list_filter = ('approved', 'approved_at', 'approver__role')
-    search_fields = ('purchase_request__title', 'approver__username')
+    search_fields = ('^purchase_request__title', '=approver__username')
     readonly_fields = ('approved_at',)
+    autocomplete_fields = ('purchase_request', 'approver')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        # Approval.__str__ reads both relations; join them, minus the request's JSON fields
+        return super().get_queryset(request).select_related('purchase_request', 'approver').defer(
+            *(f'purchase_request__{field}' for field in PurchaseRequest.JSON_FIELDS)
+        )
+
+
+@admin.register(Vendor)
+class VendorAdmin(admin.ModelAdmin):
+    list_display = ('name', 'normalized_name', 'created_at')
+    search_fields = ('^name', '^normalized_name')
+    # The trigram index is built from normalized_name, so it is not edited by hand
+    readonly_fields = ('normalized_name', 'trigram_count', 'created_at')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+@admin.register(RoutingRule)
+class RoutingRuleAdmin(admin.ModelAdmin):
+    list_display = ('name', 'priority', 'department', 'min_amount', 'max_amount', 'levels', 'same_department', 'is_active')
+    list_filter = ('is_active', 'department')
+    list_editable = ('priority', 'is_active')
+    search_fields = ('name',)
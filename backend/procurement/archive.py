@@ -0,0 +1,67 @@
+"""
+Archive of closed purchase requests.
+
+Rejected requests, and approved ones whose receipt is in, are never written
+again. archive_requests moves those older than a few months, with their
+approvals, to archived_purchase_requests and archived_approvals, keeping
+their IDs, so purchase_requests and its indexes only hold live work. The
+API still serves archived requests (see PurchaseRequestViewSet.get_object
+and `?archived=true`).
+
+Nothing else changes hands: documents keep their blobs (gc_document_blobs
+counts archived references), duplicate signatures stay indexed, and audit
+events, notifications and push events refer to requests by plain ID. The
+change feed reports archived requests as deleted to everyone who could see
+them; clients fetch them from the archive if they need them again.
+"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+
+def closed_requests(months):
+    """Requests that are done with and were created more than `months` months (of 30 days) ago"""
+    from .models import PurchaseRequest
+
+    cutoff = timezone.now() - timedelta(days=30 * months)
+    return PurchaseRequest.objects.filter(created_at__lt=cutoff).filter(
+        Q(status='rejected') | (Q(status='approved') & Q(receipt__isnull=False) & ~Q(receipt=''))
+    )
+
+
+def _copy(model, archive_model, rows):
+    fields = [field.attname for field in model._meta.concrete_fields]
+    return [archive_model(**{field: getattr(row, field) for field in fields}) for row in rows]
+
+
+def archive_batch(queryset, batch_size):
+    """Move up to `batch_size` requests of `queryset` to the archive; returns how many were moved"""
+    from .models import ApprovalRoute, Approval, ArchivedApproval, ArchivedPurchaseRequest, PurchaseRequest
+    from .routing import routed_approvers
+    from .sync import mark_revoked
+
+    with transaction.atomic():
+        requests = list(queryset.select_for_update().order_by('pk')[:batch_size])
+        if not requests:
+            return 0
+        approvals = list(Approval.objects.filter(purchase_request__in=requests))
+        ArchivedPurchaseRequest.objects.bulk_create(_copy(PurchaseRequest, ArchivedPurchaseRequest, requests))
+        ArchivedApproval.objects.bulk_create(_copy(Approval, ArchivedApproval, approvals))
+
+        viewers = {request.pk: {request.created_by_id} for request in requests}
+        for request_id, approver_ids in routed_approvers(list(viewers)).items():
+            viewers[request_id] |= approver_ids
+        for approval in approvals:
+            viewers[approval.purchase_request_id].add(approval.approver_id)
+        mark_revoked(viewers)
+
+        # Raw deletes send no signals: the rows live on in the archive, so
+        # they must not leave per-row tombstones or release their documents
+        ApprovalRoute.objects.filter(purchase_request__in=requests)._raw_delete(ApprovalRoute.objects.db)
+        Approval.objects.filter(pk__in=[approval.pk for approval in approvals])._raw_delete(Approval.objects.db)
+        PurchaseRequest.objects.filter(pk__in=[request.pk for request in requests])._raw_delete(
+            PurchaseRequest.objects.db
+        )
+    return len(requests)
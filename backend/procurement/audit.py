@@ -0,0 +1,120 @@
+"""
+Append-only audit log of what happened to each purchase request.
+
+`record()` only buffers the event. The buffer belongs to the current
+transaction and is written with a single bulk insert once it commits, so an
+approval that touches the request, its approvals and its PO costs one
+extra INSERT, and a rolled back action leaves no trace. Outside a
+transaction events are written straight away.
+
+On PostgreSQL the audit_events table is partitioned by month on created_at
+(see migration 0010 and the create_audit_partitions command).
+"""
+import threading
+from datetime import timedelta
+from functools import partial
+
+from django.core.files import File
+from django.db import connection, transaction
+from django.utils import timezone
+
+
+_local = threading.local()
+
+PARENT_TABLE = 'audit_events'
+DEFAULT_PARTITION = 'audit_events_default'
+
+
+def _flush(events):
+    from .models import AuditEvent
+
+    pending = getattr(_local, 'pending', None)
+    if pending is not None and pending[0] is events:
+        _local.pending = None
+    if events:
+        AuditEvent.objects.bulk_create(events)
+
+
+def _current_buffer():
+    """The buffer whose flush is registered on the current transaction, started if needed"""
+    pending = getattr(_local, 'pending', None)
+    # A rolled back transaction drops its on_commit callbacks, and the buffer with them
+    if pending is not None and any(entry[1] is pending[1] for entry in connection.run_on_commit):
+        return pending[0]
+    buffer = []
+    flush = partial(_flush, buffer)
+    _local.pending = (buffer, flush)
+    transaction.on_commit(flush)
+    return buffer
+
+
+def record(purchase_request, event_type, actor=None, **data):
+    """Log `event_type` for `purchase_request` once the current transaction commits"""
+    from .models import AuditEvent
+
+    event = AuditEvent(
+        purchase_request_id=purchase_request.pk,
+        event_type=event_type,
+        actor_id=actor.pk if actor else None,
+        actor_username=actor.username if actor else '',
+        status=purchase_request.status,
+        data=data,
+        created_at=timezone.now(),
+    )
+    if not connection.in_atomic_block:
+        event.save()
+        return
+    _current_buffer().append(event)
+
+
+def _plain(value):
+    # Documents are logged by stored name
+    return (value.name or None) if isinstance(value, File) else value
+
+
+def snapshot(instance, fields):
+    """Current values of `fields`, to compare with after a save"""
+    return {field: _plain(getattr(instance, field)) for field in fields}
+
+
+def changes(before, instance):
+    """{field: [old, new]} for the fields of a snapshot that `instance` changed since"""
+    result = {}
+    for field, old in before.items():
+        new = _plain(getattr(instance, field))
+        if old != new:
+            result[field] = [old, new]
+    return result
+
+
+def month_start(value):
+    return value.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def next_month(value):
+    return month_start(month_start(value) + timedelta(days=32))
+
+
+def partition_name(month):
+    return f'{PARENT_TABLE}_{month:%Y_%m}'
+
+
+def create_partition(cursor, month):
+    """
+    Create the partition for `month` if it is missing, moving any rows that
+    already landed in the default partition into it. PostgreSQL only.
+    """
+    name, start, end = partition_name(month), month_start(month), next_month(month)
+    cursor.execute('SELECT to_regclass(%s)', [name])
+    if cursor.fetchone()[0] is not None:
+        return False
+    with transaction.atomic():
+        cursor.execute(f'CREATE TABLE {name} (LIKE {PARENT_TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)')
+        cursor.execute(
+            f'WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE created_at >= %s AND created_at < %s '
+            f'RETURNING *) INSERT INTO {name} SELECT * FROM moved', [start, end]
+        )
+        cursor.execute(
+            f'ALTER TABLE {PARENT_TABLE} ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)', [start, end]
+        )
+    return True
@@ -0,0 +1,105 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+
+ROLE_CLAIM = 'role'
+VERSION_CLAIM = 'ver'
+
+
+def add_user_claims(token, user):
+    """Stamp the claims CachedJWTAuthentication validates against"""
+    token[ROLE_CLAIM] = user.role
+    token[VERSION_CLAIM] = user.token_version
+    return token
+
+
+class UserCache:
+    """Small thread-safe LRU keyed by user ID, each entry expiring after `ttl` seconds"""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            user, expires = entry
+            if expires < time.monotonic():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return user
+
+    def set(self, user_id, user):
+        with self._lock:
+            self._entries[user_id] = (user, time.monotonic() + self.ttl)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+user_cache = UserCache(settings.AUTH_USER_CACHE_SIZE, settings.AUTH_USER_CACHE_TTL)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWT authentication that resolves users from an in-process cache.
+
+    Tokens carry the user's role and token_version. A cached user whose
+    version matches the token is returned without a query. A token newer
+    than the cache reloads the user, and a token older than the user is
+    refused, so a role, department or active flag change invalidates old
+    tokens. Other processes notice the change when a newer token arrives
+    or their entry expires (AUTH_USER_CACHE_TTL).
+
+    The cache holds field values, not User instances: each request gets a
+    fresh instance it can't share with other requests or threads.
+    """
+
+    def cached_user(self, user_id):
+        entry = user_cache.get(user_id)
+        if entry is None:
+            return None
+        db, values = entry
+        return self.user_model.from_db(db, [field.attname for field in self.user_model._meta.concrete_fields], values)
+
+    def cache_user(self, user_id, user):
+        values = tuple(getattr(user, field.attname) for field in self.user_model._meta.concrete_fields)
+        user_cache.set(user_id, (user._state.db, values))
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+        version = validated_token.get(VERSION_CLAIM)
+
+        user = self.cached_user(user_id)
+        if user is None or (version is not None and version > user.token_version):
+            user = super().get_user(validated_token)
+            self.cache_user(user_id, user)
+
+        if not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        if version is not None and version != user.token_version:
+            raise AuthenticationFailed(_("Token is outdated, please refresh it"), code="token_outdated")
+        return user
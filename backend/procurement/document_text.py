@@ -0,0 +1,98 @@
+"""
+Store of the full text extracted from each document.
+
+Text is kept once per distinct document content (the same SHA-256 digest
+the blob storage names files by), zlib-compressed, in its own table so the
+purchase_requests rows stay narrow. Each row records where every page
+starts and which extractor version produced it. Re-parsing a document, or
+rebuilding an index over documents, reads the text from here instead of
+running pdfplumber or OCR again, and search_text looks through it.
+
+Only the text moved off the request row. The structured data extracted
+from it (proforma_data, receipt_data, ...) stays on purchase_requests:
+every request representation carries it, list pages included, so a side
+table would cost a join or a prefetch on each read. PostgreSQL already
+keeps large jsonb values out of line (TOAST), so queries that don't
+select those columns don't read them; the admin defers them.
+"""
+import bisect
+import hashlib
+import zlib
+
+from django.utils import timezone
+
+from .storage import blob_digest
+
+
+COMPRESSION_LEVEL = 6
+
+
+def document_digest(field_file):
+    """Content digest of a stored document; read off the name for content-addressed files"""
+    digest = blob_digest(field_file.name)
+    if digest:
+        return digest
+    sha = hashlib.sha256()
+    with field_file.storage.open(field_file.name, 'rb') as handle:
+        for chunk in handle.chunks():
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def join_pages(pages):
+    """(text, page_offsets) for page texts, joined the way extraction always has"""
+    text, offsets = [], []
+    length = 0
+    for page in pages:
+        offsets.append(length)
+        if page:
+            text.append(page + '\n')
+            length += len(page) + 1
+    return ''.join(text), offsets
+
+
+def load_text(digest, min_version):
+    """The stored DocumentText for `digest` if it is at least `min_version`, else None"""
+    from .models import DocumentText
+
+    return DocumentText.objects.filter(digest=digest, extractor_version__gte=min_version).first()
+
+
+def store_text(digest, pages, extractor, version):
+    """Store the pages extracted from a document, replacing any older text"""
+    from .models import DocumentText
+
+    text, offsets = join_pages(pages)
+    DocumentText.objects.update_or_create(digest=digest, defaults={
+        'compressed_text': zlib.compress(text.encode(), COMPRESSION_LEVEL),
+        'page_offsets': offsets,
+        'char_count': len(text),
+        'extractor': extractor,
+        'extractor_version': version,
+        'extracted_at': timezone.now(),
+    })
+
+
+def search_text(query, digests=None, batch_size=200):
+    """
+    Yield (digest, page numbers from 1) for each stored document whose text
+    contains `query`, ignoring case; only among `digests` if given. The text
+    is compressed, so this reads every candidate row.
+    """
+    from .models import DocumentText
+
+    needle = query.casefold()
+    documents = DocumentText.objects.only('digest', 'compressed_text', 'page_offsets').order_by('digest')
+    if digests is not None:
+        documents = documents.filter(digest__in=digests)
+    for document in documents.iterator(chunk_size=batch_size):
+        text = document.text.casefold()
+        pages = []
+        start = text.find(needle)
+        while start != -1:
+            page = bisect.bisect_right(document.page_offsets, start)
+            if page not in pages:
+                pages.append(page)
+            start = text.find(needle, start + 1)
+        if pages:
+            yield document.digest, pages
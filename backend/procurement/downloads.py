@@ -0,0 +1,156 @@
+import math
+import mimetypes
+import os
+import re
+import time
+
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import default_storage
+from django.http import FileResponse, HttpResponse, Http404, StreamingHttpResponse
+from django.urls import reverse
+from django.views.decorators.http import require_http_methods
+
+from .models import PurchaseRequest
+from .storage import blob_digest
+
+
+DOCUMENT_FIELDS = PurchaseRequest.DOCUMENT_FIELDS
+
+_signer = signing.Signer(salt='procurement.downloads')
+_RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+_CHUNK_SIZE = 64 * 1024
+
+
+def sign_document(name, filename=None):
+    """
+    Signed path that serves the stored file `name` until it expires.
+
+    Expiry is rounded up to a whole minute so repeated calls hand out the same
+    URL for a while, which lets browsers reuse their cached copy.
+    """
+    expires = math.ceil((time.time() + settings.DOCUMENT_URL_MAX_AGE) / 60) * 60
+    payload = {'n': name, 'e': expires}
+    if filename:
+        payload['f'] = filename
+    token = _signer.sign_object(payload)
+    return reverse('document_download', kwargs={'token': token})
+
+
+def unsign_document(token):
+    """(stored name, download filename) for a valid, unexpired token, or (None, None)"""
+    try:
+        payload = _signer.unsign_object(token)
+    except signing.BadSignature:
+        return None, None
+    if payload.get('e', 0) < time.time():
+        return None, None
+    return payload.get('n'), payload.get('f')
+
+
+def document_url(value, request=None):
+    """Signed URL for a FieldFile, absolute when `request` is given"""
+    if not value:
+        return None
+    # Stored names are content digests; offer something readable instead
+    filename = f"{value.field.name}_{value.instance.pk}{os.path.splitext(value.name)[1]}"
+    url = sign_document(value.name, filename)
+    if request is not None:
+        return request.build_absolute_uri(url)
+    return url
+
+
+def parse_range(header, size):
+    """
+    (start, end) byte offsets for a single `Range` header, None to serve
+    everything, or False if unsatisfiable. Malformed headers, and several
+    ranges, are ignored as RFC 9110 allows.
+    """
+    match = _RANGE_RE.match(header.strip()) if header else None
+    if not match or not any(match.groups()):
+        return None
+    start, end = match.groups()
+    if not start:
+        # Suffix range: the last `end` bytes
+        length = int(end)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(start)
+    if end and int(end) < start:
+        # Not a valid range-spec at all
+        return None
+    if start >= size:
+        return False
+    return start, min(int(end), size - 1) if end else size - 1
+
+
+def _read_range(path, start, end):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+@require_http_methods(['GET', 'HEAD'])
+def download_document(request, token):
+    """
+    Serve a document from a signed URL without touching the database.
+
+    With DOCUMENT_ACCEL_REDIRECT_PREFIX set, and the request coming through
+    a front server that says it can (X-Sendfile-Type: X-Accel-Redirect, see
+    frontend/nginx.conf), that server performs the transfer and handles
+    ranges; otherwise the file is sent from here.
+    """
+    name, filename = unsign_document(token)
+    if not name:
+        raise Http404('Link is invalid or has expired')
+
+    try:
+        path = default_storage.path(name)
+    except SuspiciousFileOperation:
+        raise Http404('Document not found')
+    if not os.path.isfile(path):
+        raise Http404('Document not found')
+
+    # Content-addressed files never change, so their digest is a strong validator
+    digest = blob_digest(name)
+    etag = f'"{digest}"' if digest else None
+    if etag and etag in request.headers.get('If-None-Match', ''):
+        response = HttpResponse(status=304)
+        response['ETag'] = etag
+        return response
+
+    content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+    filename = filename or os.path.basename(name)
+
+    if settings.DOCUMENT_ACCEL_REDIRECT_PREFIX and request.headers.get('X-Sendfile-Type') == 'X-Accel-Redirect':
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = settings.DOCUMENT_ACCEL_REDIRECT_PREFIX + name
+    else:
+        size = os.path.getsize(path)
+        byte_range = parse_range(request.headers.get('Range'), size)
+        if byte_range is False:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+        if byte_range is None:
+            response = FileResponse(open(path, 'rb'), content_type=content_type)
+        else:
+            start, end = byte_range
+            response = StreamingHttpResponse(_read_range(path, start, end), status=206, content_type=content_type)
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+            response['Content-Length'] = str(end - start + 1)
+        response['Accept-Ranges'] = 'bytes'
+
+    if etag:
+        response['ETag'] = etag
+    response['Content-Disposition'] = f'inline; filename="{filename}"'
+    response['Cache-Control'] = f'private, max-age={settings.DOCUMENT_URL_MAX_AGE}'
+    return response
@@ -0,0 +1,140 @@
+"""
+Near-duplicate detection for proformas and receipts, with MinHash-LSH.
+
+The extracted text of a document is cut into word shingles and summarized
+by a MinHash signature of NUM_PERM values; the fraction of positions two
+signatures agree on estimates the Jaccard similarity of their shingle sets.
+Signatures are split into BANDS bands of ROWS values, and each band is
+hashed into an LSHBucket row. Documents sharing any bucket are candidates,
+so a lookup reads a handful of index entries instead of every past
+document; candidates are then scored on their full signatures against
+DUPLICATE_SIMILARITY_THRESHOLD.
+
+With 20 bands of 6 rows, a pair at 0.8 similarity shares a bucket with
+probability above 0.99, and one at 0.3 with probability under 0.02.
+Changing NUM_PERM, BANDS or ROWS needs `rebuild_duplicate_index --resign`.
+"""
+import hashlib
+import random
+import re
+import struct
+
+from django.conf import settings
+from django.db import transaction
+
+from .metrics import timed
+
+
+NUM_PERM = 120
+BANDS = 20
+ROWS = NUM_PERM // BANDS
+SHINGLE_SIZE = 3
+
+# Scored candidates per lookup; a bucket shared by many templated documents stays cheap
+MAX_CANDIDATES = 200
+# Duplicates kept on a request, best first
+MAX_FLAGGED = 10
+
+_PRIME = (1 << 61) - 1
+_rng = random.Random(0x5EED)
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+_SIGNATURE_FORMAT = f'<{NUM_PERM}Q'
+
+
+def shingles(text):
+    """Set of word SHINGLE_SIZE-grams of the normalized text"""
+    words = re.findall(r'[a-z0-9]+', (text or '').lower())
+    if len(words) < SHINGLE_SIZE:
+        return {' '.join(words)} if words else set()
+    return {' '.join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+
+def minhash(text):
+    """MinHash signature of the text, as a list of NUM_PERM ints; None when there is no text"""
+    hashes = [
+        int.from_bytes(hashlib.blake2b(shingle.encode(), digest_size=8).digest(), 'little')
+        for shingle in shingles(text)
+    ]
+    if not hashes:
+        return None
+    return [min([(a * value + b) % _PRIME for value in hashes]) for a, b in _PERMUTATIONS]
+
+
+def pack(signature):
+    return struct.pack(_SIGNATURE_FORMAT, *signature)
+
+
+def unpack(data):
+    return struct.unpack(_SIGNATURE_FORMAT, bytes(data))
+
+
+def similarity(first, second):
+    """Estimated Jaccard similarity of the documents behind two signatures"""
+    return sum(1 for a, b in zip(first, second) if a == b) / NUM_PERM
+
+
+def band_buckets(kind, signature):
+    """The LSH bucket of each band; proformas and receipts never share buckets"""
+    buckets = []
+    for band in range(BANDS):
+        rows = struct.pack(f'<{ROWS}Q', *signature[band * ROWS:(band + 1) * ROWS])
+        digest = hashlib.blake2b(f'{kind}:{band}:'.encode() + rows, digest_size=8).digest()
+        buckets.append(int.from_bytes(digest, 'little', signed=True))
+    return buckets
+
+
+def find_duplicates(purchase_request_id, kind, signature):
+    """Earlier requests whose `kind` document is likely the same, best first"""
+    from .models import DocumentSignature, LSHBucket
+
+    candidates = DocumentSignature.objects.filter(
+        kind=kind, purchase_request_id__lt=purchase_request_id,
+        pk__in=LSHBucket.objects.filter(bucket__in=band_buckets(kind, signature)).values('signature_id'),
+    ).order_by('-purchase_request_id').values_list('purchase_request_id', 'signature')[:MAX_CANDIDATES]
+
+    threshold = settings.DUPLICATE_SIMILARITY_THRESHOLD
+    duplicates = []
+    for request_id, other in candidates:
+        score = similarity(signature, unpack(other))
+        if score >= threshold:
+            duplicates.append({'id': request_id, 'kind': kind, 'similarity': round(score, 2)})
+    duplicates.sort(key=lambda duplicate: -duplicate['similarity'])
+    return duplicates[:MAX_FLAGGED]
+
+
+def merge_flags(existing, kind, duplicates):
+    """Replace the `kind` entries of a request's duplicate_candidates"""
+    kept = [duplicate for duplicate in existing or [] if duplicate.get('kind') != kind]
+    return sorted(kept + duplicates, key=lambda duplicate: -duplicate['similarity'])[:MAX_FLAGGED]
+
+
+def store_signature(purchase_request_id, kind, signature):
+    """Save a document's signature and its LSH buckets, replacing any previous one"""
+    from .models import DocumentSignature, LSHBucket
+
+    record, _ = DocumentSignature.objects.update_or_create(
+        purchase_request_id=purchase_request_id, kind=kind, defaults={'signature': pack(signature)}
+    )
+    LSHBucket.objects.filter(signature=record).delete()
+    LSHBucket.objects.bulk_create(
+        LSHBucket(bucket=bucket, signature=record) for bucket in band_buckets(kind, signature)
+    )
+    return record
+
+
+def index_document(purchase_request, kind, text, signature=None):
+    """
+    Add a request's document to the index and flag likely duplicates on the
+    request (in memory; the caller saves it). Pass `signature` if the minhash
+    of `text` was already computed.
+    """
+    with timed('duplicates'):
+        if signature is None:
+            signature = minhash(text)
+        if signature is None:
+            return []
+        with transaction.atomic():
+            duplicates = find_duplicates(purchase_request.pk, kind, signature)
+            store_signature(purchase_request.pk, kind, signature)
+        purchase_request.duplicate_candidates = merge_flags(purchase_request.duplicate_candidates, kind, duplicates)
+        return duplicates
@@ -0,0 +1,155 @@
+import asyncio
+import json
+import logging
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from .models import Approval, ApprovalRoute, PushEvent
+from .sync import queue_event
+
+logger = logging.getLogger(__name__)
+
+
+def publish_event(purchase_request, event_type, actor=None, **data):
+    """Queue a push event for `purchase_request`; it is delivered once the transaction commits"""
+    # Everyone the request is routed to, or who reviewed it
+    reviewer_ids = list(
+        ApprovalRoute.objects.filter(purchase_request=purchase_request).values_list('approver_id', flat=True)
+        .union(Approval.objects.filter(purchase_request=purchase_request).order_by().values_list('approver_id', flat=True))
+    )
+    queue_event(PushEvent(
+        event_type=event_type,
+        purchase_request_id=purchase_request.id,
+        owner_id=purchase_request.created_by_id,
+        status=purchase_request.status,
+        reviewer_ids=reviewer_ids,
+        data={
+            'title': purchase_request.title,
+            'actor_id': actor.id if actor else None,
+            **data,
+        },
+    ))
+
+
+def is_visible(user, event):
+    """Same role rules as PurchaseRequest.objects.visible_to, applied to an event snapshot"""
+    if user.role == 'staff':
+        return event.owner_id == user.id
+    if user.role in ['approver-level-1', 'approver-level-2']:
+        return user.id in event.reviewer_ids
+    return user.role == 'finance'
+
+
+def event_cursor(event):
+    return f"{event.change_seq}-{event.id}"
+
+
+def parse_event_cursor(value):
+    try:
+        change_seq, event_id = value.split('-', 1)
+        return int(change_seq), int(event_id)
+    except (AttributeError, ValueError):
+        return None
+
+
+def format_event(event):
+    """Encode `event` as a server-sent event frame"""
+    payload = json.dumps({
+        'type': event.event_type,
+        'request_id': event.purchase_request_id,
+        'status': event.status,
+        'created_at': event.created_at.isoformat(),
+        **event.data,
+    })
+    return f"id: {event_cursor(event)}\nevent: {event.event_type}\ndata: {payload}\n\n".encode()
+
+
+def fetch_events(after=None, limit=500):
+    """Events after the (change_seq, id) cursor `after`, oldest first"""
+    close_old_connections()
+    queryset = PushEvent.objects.all()
+    if after is not None:
+        change_seq, event_id = after
+        queryset = queryset.filter(change_seq__gte=change_seq).exclude(change_seq=change_seq, id__lte=event_id)
+    return list(queryset[:limit])
+
+
+def latest_event_cursor():
+    close_old_connections()
+    event = PushEvent.objects.order_by('-change_seq', '-id').first()
+    return (event.change_seq, event.id) if event else (0, 0)
+
+
+def prune_events():
+    close_old_connections()
+    cutoff = timezone.now() - timedelta(minutes=settings.PUSH_EVENTS_RETENTION_MINUTES)
+    PushEvent.objects.filter(created_at__lt=cutoff).delete()
+
+
+class Subscription:
+    def __init__(self, user):
+        self.user = user
+        self.queue = asyncio.Queue(maxsize=settings.PUSH_EVENTS_QUEUE_SIZE)
+        self.overflowed = False
+
+    def deliver(self, frame):
+        try:
+            self.queue.put_nowait(frame)
+        except asyncio.QueueFull:
+            # Slow consumer; its stream is closed and the client resumes with Last-Event-ID
+            self.overflowed = True
+
+
+class EventBroker:
+    """
+    Fans push events out to the streams held by this process.
+
+    A single poller per process reads new PushEvent rows, so events written
+    by any worker reach every subscriber without an external message broker.
+    """
+
+    def __init__(self):
+        self.subscribers = set()
+        self.poller = None
+
+    def subscribe(self, user):
+        subscription = Subscription(user)
+        self.subscribers.add(subscription)
+        if self.poller is None or self.poller.done():
+            self.poller = asyncio.get_running_loop().create_task(self.poll())
+        return subscription
+
+    def unsubscribe(self, subscription):
+        self.subscribers.discard(subscription)
+
+    def dispatch(self, events):
+        for event in events:
+            frame = format_event(event)
+            for subscription in list(self.subscribers):
+                if is_visible(subscription.user, event):
+                    subscription.deliver(frame)
+
+    async def poll(self):
+        cursor = await sync_to_async(latest_event_cursor)()
+        polls = 0
+        while self.subscribers:
+            await asyncio.sleep(settings.PUSH_EVENTS_POLL_INTERVAL)
+            try:
+                events = await sync_to_async(fetch_events)(cursor)
+                polls += 1
+                if polls % settings.PUSH_EVENTS_PRUNE_EVERY == 0:
+                    await sync_to_async(prune_events)()
+            except Exception:
+                logger.exception("Error polling push events")
+                continue
+
+            if events:
+                cursor = (events[-1].change_seq, events[-1].id)
+                self.dispatch(events)
+
+
+broker = EventBroker()
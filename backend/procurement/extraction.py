@@ -0,0 +1,48 @@
+"""
+Lazy access to the document-processing stack.
+
+pdfplumber, pytesseract, PIL and openai add a lot of import time and memory
+to every process, yet most requests, migrations and management commands
+never read a document. They are imported on first use through
+`document_stack()`, or ahead of time with `warm_up()` in workers that are
+going to need them (see gunicorn.conf.py).
+"""
+import threading
+import time
+from types import SimpleNamespace
+
+from django.conf import settings
+
+
+_stack = None
+_lock = threading.Lock()
+
+
+def document_stack():
+    """The imported document libraries, with the OpenAI key configured"""
+    global _stack
+    if _stack is None:
+        with _lock:
+            if _stack is None:
+                import openai
+                import pdfplumber
+                import pytesseract
+                from PIL import Image, ImageOps
+
+                if settings.OPENAI_API_KEY:
+                    openai.api_key = settings.OPENAI_API_KEY
+                _stack = SimpleNamespace(
+                    openai=openai, pdfplumber=pdfplumber, pytesseract=pytesseract, Image=Image, ImageOps=ImageOps,
+                )
+    return _stack
+
+
+def is_loaded():
+    return _stack is not None
+
+
+def warm_up():
+    """Load the document stack now; returns the seconds it took"""
+    started = time.perf_counter()
+    document_stack()
+    return time.perf_counter() - started
@@ -0,0 +1,114 @@
+"""
+Currency conversion.
+
+ExchangeRate holds dated rates to the base currency (FX_BASE_CURRENCY).
+Amounts are converted when they are written: PurchaseRequest.amount_base
+is the amount in the base currency at the rate of the request's creation
+date, so totals across currencies are a plain SUM.
+
+Each process caches the rates of a currency as sorted (dates, rates)
+arrays, so converting a batch of amounts costs a bisect per amount and at
+most one query for all the currencies not cached yet. The cache is dropped
+when the `fx_rates` counter moves (load_exchange_rates bumps it), checked at
+most every FX_RATES_RECHECK seconds.
+"""
+import datetime
+import threading
+import time
+from bisect import bisect_right
+from decimal import Decimal
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+
+VERSION_COUNTER = 'fx_rates'
+CENT = Decimal('0.01')
+
+_lock = threading.Lock()
+_rates = {}
+_version = None
+_checked_at = 0.0
+
+
+def base_currency():
+    return settings.FX_BASE_CURRENCY
+
+
+def _day(on):
+    if isinstance(on, datetime.datetime):
+        return timezone.localdate(on) if timezone.is_aware(on) else on.date()
+    return on or timezone.localdate()
+
+
+def _load(currencies):
+    """(dates, rates) per currency, loading the ones not cached in one query"""
+    from .models import ChangeSequence, ExchangeRate
+
+    global _version, _checked_at
+    with _lock:
+        if time.monotonic() - _checked_at >= settings.FX_RATES_RECHECK:
+            version = ChangeSequence.objects.filter(pk=VERSION_COUNTER).values_list('value', flat=True).first() or 0
+            if version != _version:
+                _rates.clear()
+                _version = version
+            _checked_at = time.monotonic()
+        missing = set(currencies) - _rates.keys()
+        if missing:
+            loaded = {currency: ([], []) for currency in missing}
+            rows = ExchangeRate.objects.filter(currency__in=missing).order_by('currency', 'rate_date')
+            for currency, rate_date, rate in rows.values_list('currency', 'rate_date', 'rate'):
+                loaded[currency][0].append(rate_date)
+                loaded[currency][1].append(rate)
+            _rates.update(loaded)
+        return {currency: _rates[currency] for currency in currencies}
+
+
+def rates_changed():
+    """Make every process reload its rates"""
+    from .models import ChangeSequence
+
+    global _checked_at
+    if not ChangeSequence.objects.filter(pk=VERSION_COUNTER).update(value=F('value') + 1):
+        ChangeSequence.objects.get_or_create(pk=VERSION_COUNTER, defaults={'value': 1})
+    _checked_at = 0.0
+
+
+def _lookup(table, day):
+    dates, rates = table
+    index = bisect_right(dates, day) - 1
+    return rates[index] if index >= 0 else None
+
+
+def rate(currency, on=None):
+    """Base currency units per unit of `currency` on `on` (the latest rate not after it), or None"""
+    currency = (currency or base_currency()).upper()
+    if currency == base_currency():
+        return Decimal(1)
+    return _lookup(_load([currency])[currency], _day(on))
+
+
+def has_rates(currency):
+    currency = (currency or base_currency()).upper()
+    return currency == base_currency() or bool(_load([currency])[currency][0])
+
+
+def to_base(amount, currency, on=None):
+    """`amount` of `currency` in the base currency, rounded to cents; None without a rate"""
+    return convert_many([(amount, currency, on)])[0]
+
+
+def convert_many(items):
+    """to_base for many (amount, currency, on) at once"""
+    items = [(amount, (currency or base_currency()).upper(), _day(on)) for amount, currency, on in items]
+    base = base_currency()
+    tables = _load({currency for _, currency, _ in items if currency != base})
+    converted = []
+    for amount, currency, day in items:
+        if amount is None or amount == '':
+            converted.append(None)
+            continue
+        factor = Decimal(1) if currency == base else _lookup(tables[currency], day)
+        converted.append(None if factor is None else (Decimal(str(amount)) * factor).quantize(CENT))
+    return converted
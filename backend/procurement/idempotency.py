@@ -0,0 +1,165 @@
+"""
+Idempotency-Key support for actions that must not run twice.
+
+The first request with a given key claims it in its own committed row, then
+runs the action and stores the response in the same transaction as the
+action's writes. A duplicate gets the stored response replayed, a 409 while
+the first is still running, or a 422 if it carries a different payload. Keys
+are per user and expire after IDEMPOTENCY_KEY_TTL hours.
+
+Successful responses embed signed document URLs that expire long before the
+key does, so views with a `replay_data(object_id)` method rebuild the payload
+of the object the response described instead of replaying the stored one.
+"""
+import functools
+import hashlib
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+
+
+def request_fingerprint(request):
+    """
+    Hash of what the request asks for. Uploaded files are hashed by content,
+    since a browser retrying a multipart form picks a new boundary.
+    """
+    digest = hashlib.sha256(f'{request.method} {request.path}'.encode())
+    data = request.data
+    items = data.lists() if hasattr(data, 'lists') else ((key, [value]) for key, value in data.items())
+    for key, values in sorted(items):
+        for value in values:
+            digest.update(f'\0{key}='.encode())
+            if isinstance(value, UploadedFile):
+                for chunk in value.chunks():
+                    digest.update(chunk)
+                value.seek(0)
+            else:
+                digest.update(repr(value).encode())
+    return digest.hexdigest()
+
+
+def claim_key(user, key, fingerprint):
+    """The (record, claimed) pair for `key`; claimed is True when this request may run"""
+    now = timezone.now()
+    expires_at = now + timedelta(hours=settings.IDEMPOTENCY_KEY_TTL)
+    try:
+        with transaction.atomic():
+            record = IdempotencyKey.objects.create(
+                user=user, key=key, fingerprint=fingerprint, locked_at=now, expires_at=expires_at
+            )
+        return record, True
+    except IntegrityError:
+        pass
+
+    record = IdempotencyKey.objects.filter(user=user, key=key).first()
+    if record is None:
+        # Pruned in between; start over
+        return claim_key(user, key, fingerprint)
+
+    # An expired key, or a claim whose worker died, may be taken over by exactly one request
+    stale = now - timedelta(seconds=settings.IDEMPOTENCY_LOCK_TIMEOUT)
+    if record.expires_at < now or (record.status == 'in_progress' and record.locked_at < stale):
+        taken = IdempotencyKey.objects.filter(
+            pk=record.pk, status=record.status, locked_at=record.locked_at
+        ).update(
+            fingerprint=fingerprint, status='in_progress', response_status=None, response_data=None,
+            locked_at=now, expires_at=expires_at,
+        )
+        if taken:
+            record.refresh_from_db()
+            return record, True
+        record.refresh_from_db()
+    return record, False
+
+
+def has_outcome(request):
+    """
+    True when the request's Idempotency-Key was already used: the stored
+    response is replayed, or the request is refused, without running the
+    action. Expired keys and abandoned claims can be taken over, so they
+    don't count.
+    """
+    key = request.headers.get(HEADER)
+    if not key or len(key) > MAX_KEY_LENGTH or not request.user.is_authenticated:
+        return False
+    now = timezone.now()
+    record = IdempotencyKey.objects.filter(user=request.user, key=key, expires_at__gte=now).first()
+    if record is None:
+        return False
+    stale = now - timedelta(seconds=settings.IDEMPOTENCY_LOCK_TIMEOUT)
+    return record.status == 'completed' or record.locked_at >= stale
+
+
+def idempotent(view_method):
+    """
+    Make a viewset action honour the Idempotency-Key header.
+
+    Goes outside @transaction.atomic, so the claim is visible to concurrent
+    duplicates before the action starts. Nested calls (reject calls approve)
+    run under the outer claim.
+    """
+    @functools.wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key or getattr(request, 'idempotency_key', None) is not None:
+            return view_method(self, request, *args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return Response(
+                {'detail': f'{HEADER} must be at most {MAX_KEY_LENGTH} characters'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        fingerprint = request_fingerprint(request)
+        record, claimed = claim_key(request.user, key, fingerprint)
+        if record.fingerprint != fingerprint:
+            return Response(
+                {'detail': f'{HEADER} was already used for a different request'},
+                status=status.HTTP_422_UNPROCESSABLE_ENTITY
+            )
+        if not claimed:
+            if record.status == 'completed':
+                data = None
+                if record.object_id is not None and hasattr(self, 'replay_data'):
+                    data = self.replay_data(record.object_id)
+                if data is None:
+                    data = record.response_data
+                response = Response(data, status=record.response_status)
+                response['Idempotent-Replayed'] = 'true'
+                return response
+            response = Response(
+                {'detail': f'A request with this {HEADER} is still being processed'},
+                status=status.HTTP_409_CONFLICT
+            )
+            response['Retry-After'] = '1'
+            return response
+
+        request.idempotency_key = record
+        try:
+            # The stored response commits or rolls back together with the action's writes
+            with transaction.atomic():
+                response = view_method(self, request, *args, **kwargs)
+                if response.status_code < 500:
+                    succeeded = response.status_code < 300 and isinstance(response.data, dict)
+                    IdempotencyKey.objects.filter(pk=record.pk).update(
+                        status='completed', response_status=response.status_code,
+                        response_data=response.data, object_id=response.data.get('id') if succeeded else None,
+                    )
+        except Exception:
+            IdempotencyKey.objects.filter(pk=record.pk, status='in_progress').delete()
+            raise
+        if response.status_code >= 500:
+            IdempotencyKey.objects.filter(pk=record.pk, status='in_progress').delete()
+        return response
+
+    return wrapper
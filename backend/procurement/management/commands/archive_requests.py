@@ -0,0 +1,31 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from procurement.archive import archive_batch, closed_requests
+
+
+class Command(BaseCommand):
+    help = 'Move closed requests older than --months, with their approvals, to the archive tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months', type=int, default=None,
+                            help='Archive closed requests created longer ago (default ARCHIVE_AFTER_MONTHS)')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        months = settings.ARCHIVE_AFTER_MONTHS if options['months'] is None else options['months']
+        closed = closed_requests(months)
+        if options['dry_run']:
+            self.stdout.write(f'[dry run] {closed.count()} requests would be archived')
+            return
+
+        archived = 0
+        while True:
+            # Each batch commits on its own; archived rows drop out of `closed`
+            moved = archive_batch(closed, options['batch_size'])
+            if not moved:
+                break
+            archived += moved
+            self.stdout.write(f'{archived} requests archived')
+        self.stdout.write(self.style.SUCCESS(f'Archived {archived} requests closed over {months} months ago'))
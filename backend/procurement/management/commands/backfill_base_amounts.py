@@ -0,0 +1,60 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from procurement.fx import base_currency, convert_many
+from procurement.models import ArchivedPurchaseRequest, PurchaseRequest
+from procurement.sync import next_change_seq
+
+
+class Command(BaseCommand):
+    help = ('Fill in the currency and base currency amount of requests that have none, e.g. ones created '
+            'before a rate for their currency was loaded')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--all', action='store_true', help='Recompute every request, e.g. after correcting rates')
+
+    def handle(self, *args, **options):
+        for model in (PurchaseRequest, ArchivedPurchaseRequest):
+            pending = model.objects.all()
+            if not options['all']:
+                pending = pending.filter(amount_base__isnull=True)
+            pending = pending.only('pk', 'amount', 'currency', 'amount_base', 'created_at')
+
+            last_pk, updated, unconverted = 0, 0, 0
+            while True:
+                batch = list(pending.filter(pk__gt=last_pk).order_by('pk')[:options['batch_size']])
+                if not batch:
+                    break
+                last_pk = batch[-1].pk
+
+                # Amounts predating currencies were entered in the base currency
+                converted = convert_many(
+                    (row.amount, row.currency or base_currency(), row.created_at) for row in batch
+                )
+                changed = []
+                for row, amount_base in zip(batch, converted):
+                    unconverted += amount_base is None
+                    if (row.currency, row.amount_base) != (row.currency or base_currency(), amount_base):
+                        row.currency = row.currency or base_currency()
+                        row.amount_base = amount_base
+                        changed.append(row)
+                if not changed:
+                    continue
+
+                with transaction.atomic():
+                    fields = ['currency', 'amount_base']
+                    if model is PurchaseRequest:
+                        # Both are part of the synced representation
+                        seq = next_change_seq(len(changed)) - len(changed)
+                        for row in changed:
+                            seq += 1
+                            row.change_seq = seq
+                        fields.append('change_seq')
+                    model.objects.bulk_update(changed, fields)
+                updated += len(changed)
+                self.stdout.write(f'{model._meta.db_table}: {updated} updated')
+
+            self.stdout.write(self.style.SUCCESS(
+                f'{model._meta.db_table}: updated {updated} requests, {unconverted} still without a rate'
+            ))
@@ -0,0 +1,73 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+
+from procurement.models import PurchaseRequest
+from procurement.sync import next_change_seq
+from procurement.vendors import normalize_vendor_name, resolve_vendor, vendor_name_from
+
+
+class Command(BaseCommand):
+    help = 'Resolve the vendor names in already extracted proformas and receipts to vendor IDs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--all', action='store_true', help='Re-resolve requests that already have vendors')
+
+    def handle(self, *args, **options):
+        pending = PurchaseRequest.objects.exclude(proforma_data__isnull=True, receipt_data__isnull=True)
+        if not options['all']:
+            pending = pending.filter(
+                Q(proforma_vendor__isnull=True, proforma_data__isnull=False)
+                | Q(receipt_vendor__isnull=True, receipt_data__isnull=False)
+            )
+
+        # Many requests share a vendor; resolve each normalized name once
+        resolved = {}
+
+        def vendor_id(data):
+            name = vendor_name_from(data)
+            normalized = normalize_vendor_name(name)
+            if not normalized:
+                return None
+            if normalized not in resolved:
+                vendor = resolve_vendor(name)
+                resolved[normalized] = vendor.pk if vendor else None
+            return resolved[normalized]
+
+        last_pk, updated = 0, 0
+        while True:
+            batch = list(
+                pending.filter(pk__gt=last_pk).order_by('pk')
+                .only('pk', 'proforma_data', 'receipt_data', 'proforma_vendor', 'receipt_vendor')[:options['batch_size']]
+            )
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+
+            changed = []
+            for purchase_request in batch:
+                proforma_vendor_id = vendor_id(purchase_request.proforma_data)
+                receipt_vendor_id = vendor_id(purchase_request.receipt_data)
+                if (proforma_vendor_id, receipt_vendor_id) != (purchase_request.proforma_vendor_id,
+                                                               purchase_request.receipt_vendor_id):
+                    purchase_request.proforma_vendor_id = proforma_vendor_id
+                    purchase_request.receipt_vendor_id = receipt_vendor_id
+                    changed.append(purchase_request)
+            if not changed:
+                continue
+
+            with transaction.atomic():
+                # The vendor IDs are part of the synced representation
+                seq = next_change_seq(len(changed)) - len(changed)
+                for purchase_request in changed:
+                    seq += 1
+                    purchase_request.change_seq = seq
+                PurchaseRequest.objects.bulk_update(
+                    changed, ['proforma_vendor', 'receipt_vendor', 'change_seq']
+                )
+            updated += len(changed)
+            self.stdout.write(f'{updated} requests updated')
+
+        vendors = len({pk for pk in resolved.values() if pk})
+        self.stdout.write(self.style.SUCCESS(f'Updated {updated} requests across {vendors} vendors'))
@@ -0,0 +1,109 @@
+import statistics
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from procurement.models import User, PurchaseRequest, Approval
+from procurement.renderers import FastJSONRenderer
+from procurement.serializers import PurchaseRequestSerializer, PurchaseRequestReadSerializer
+
+
+def build_purchase_requests(count, approvals_per_request=2, items_per_proforma=20):
+    """Build unsaved purchase requests with prefetched approvals, so no database is needed"""
+    now = timezone.now()
+    roles = ['approver-level-1', 'approver-level-2']
+    staff = [
+        User(id=i, username=f'staff{i}', email=f'staff{i}@example.com',
+             first_name='Staff', last_name=str(i), role='staff', department='Operations')
+        for i in range(1, 11)
+    ]
+    approvers = [
+        User(id=100 + i, username=f'approver{i}', email=f'approver{i}@example.com',
+             first_name='Approver', last_name=str(i), role=roles[i % 2])
+        for i in range(approvals_per_request)
+    ]
+
+    purchase_requests = []
+    for i in range(1, count + 1):
+        purchase_request = PurchaseRequest(
+            id=i,
+            title=f'Request {i}',
+            description='Office equipment for the new team ' * 4,
+            amount=Decimal('1250.50') + i,
+            status='pending',
+            created_by=staff[i % len(staff)],
+            created_at=now - timedelta(days=i),
+            updated_at=now,
+            proforma=f'proformas/quote_{i}.pdf',
+            proforma_data={
+                'vendor': 'Acme Supplies Ltd',
+                'currency': 'USD',
+                'items': [
+                    {'name': f'Item {n}', 'quantity': n, 'unit_price': 9.99, 'total': n * 9.99}
+                    for n in range(items_per_proforma)
+                ],
+            },
+        )
+        approvals = [
+            Approval(id=i * 10 + n, purchase_request=purchase_request, approver=approver,
+                     approved=True, comments='Looks good', approved_at=now)
+            for n, approver in enumerate(approvers)
+        ]
+        # Same shape Django's prefetch_related leaves behind
+        queryset = Approval.objects.all()
+        queryset._result_cache = approvals
+        queryset._prefetch_done = True
+        purchase_request._prefetched_objects_cache = {'approvals': queryset}
+        purchase_requests.append(purchase_request)
+    return purchase_requests
+
+
+def measure(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the DRF and fast purchase request serialization and JSON rendering paths'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[10, 100, 1000])
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        drf_renderer = JSONRenderer()
+        fast_renderer = FastJSONRenderer()
+
+        self.stdout.write(f"{'rows':>6} {'stage':<10} {'drf ms':>10} {'fast ms':>10} {'speedup':>8}")
+        for rows in options['rows']:
+            purchase_requests = build_purchase_requests(rows)
+
+            drf_data = PurchaseRequestSerializer(purchase_requests, many=True).data
+            fast_data = PurchaseRequestReadSerializer(purchase_requests, many=True).data
+            if drf_renderer.render(drf_data) != fast_renderer.render(fast_data):
+                self.stderr.write(self.style.ERROR(f'Payload mismatch at {rows} rows'))
+                return
+
+            stages = (
+                ('serialize',
+                 lambda: PurchaseRequestSerializer(purchase_requests, many=True).data,
+                 lambda: PurchaseRequestReadSerializer(purchase_requests, many=True).data),
+                ('render',
+                 lambda: drf_renderer.render(drf_data),
+                 lambda: fast_renderer.render(fast_data)),
+            )
+            for stage, drf_func, fast_func in stages:
+                drf_time = measure(drf_func, options['repeat'])
+                fast_time = measure(fast_func, options['repeat'])
+                self.stdout.write(
+                    f'{rows:>6} {stage:<10} {drf_time * 1000:>10.2f} {fast_time * 1000:>10.2f} '
+                    f'{drf_time / fast_time:>7.1f}x'
+                )
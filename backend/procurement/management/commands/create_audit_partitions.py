@@ -0,0 +1,28 @@
+from datetime import timezone as dt_timezone
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+
+from procurement.audit import create_partition, month_start, next_month, partition_name
+
+
+class Command(BaseCommand):
+    help = 'Create the monthly audit_events partitions up to a few months ahead (PostgreSQL only); run it monthly'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months', type=int, default=3, help='Months ahead of the current one')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            self.stdout.write(f'audit_events is not partitioned on {connection.vendor}, nothing to do')
+            return
+
+        month = month_start(timezone.now().astimezone(dt_timezone.utc))
+        with connection.cursor() as cursor:
+            for _ in range(options['months'] + 1):
+                if create_partition(cursor, month):
+                    self.stdout.write(self.style.SUCCESS(f'Created {partition_name(month)}'))
+                else:
+                    self.stdout.write(f'{partition_name(month)} already exists')
+                month = next_month(month)
@@ -0,0 +1,44 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from procurement.models import Notification
+from procurement.notifications import dispatch
+
+
+class Command(BaseCommand):
+    help = ('Send the notification outbox as per-user digests; run it every minute or so, '
+            'or keep it running with --loop')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--window', type=int, default=None,
+                            help='Seconds to collect a user\'s notifications into one digest '
+                                 '(default NOTIFICATION_DIGEST_WINDOW)')
+        parser.add_argument('--batch-size', type=int, default=100, help='Users per batch')
+        parser.add_argument('--loop', action='store_true', help='Keep dispatching every --interval seconds')
+        parser.add_argument('--interval', type=float, default=30)
+        parser.add_argument('--keep-days', type=int, default=30, help='Delete notifications sent longer ago')
+
+    def handle(self, *args, **options):
+        window = settings.NOTIFICATION_DIGEST_WINDOW if options['window'] is None else options['window']
+        while True:
+            started = time.perf_counter()
+            digests, notifications, left = dispatch(window, options['batch_size'])
+            elapsed = time.perf_counter() - started
+            if digests or left or not options['loop']:
+                self.stdout.write(
+                    f'Sent {digests} digests ({notifications} notifications) in {elapsed:.2f}s, '
+                    f'{digests / elapsed if elapsed else 0:.1f} digests/s; {left} users left for the next run'
+                )
+
+            pruned, _ = Notification.objects.filter(
+                sent_at__lt=timezone.now() - timedelta(days=options['keep_days'])
+            ).delete()
+            if pruned:
+                self.stdout.write(f'Pruned {pruned} sent notifications')
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from procurement.sla import escalate_batch, overdue
+
+
+class Command(BaseCommand):
+    help = ('Escalate pending requests past their approval deadline to the approvers and SLA_ESCALATION_ROLE; '
+            'run it every few minutes, or keep it running with --loop')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200)
+        parser.add_argument('--loop', action='store_true', help='Keep scanning every --interval seconds')
+        parser.add_argument('--interval', type=float, default=300)
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            count = overdue().filter(escalated_at__isnull=True).count()
+            self.stdout.write(f'[dry run] {count} overdue requests would be escalated')
+            return
+
+        while True:
+            started = time.perf_counter()
+            escalated = 0
+            while True:
+                # Each batch commits on its own; escalated rows drop out of the scan
+                done = escalate_batch(options['batch_size'])
+                if not done:
+                    break
+                escalated += done
+            if escalated or not options['loop']:
+                self.stdout.write(f'Escalated {escalated} overdue requests in {time.perf_counter() - started:.2f}s')
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
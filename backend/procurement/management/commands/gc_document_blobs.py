@@ -0,0 +1,100 @@
+import os
+from collections import Counter
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from procurement.models import ArchivedPurchaseRequest, DocumentBlob, DocumentText, PurchaseRequest
+from procurement.previews import evict_previews
+from procurement.storage import BLOB_DIR, BLOB_TMP_DIR, blob_digest
+
+
+class Command(BaseCommand):
+    help = 'Recount document blob references and delete blobs no request uses'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--grace-hours', type=float, default=24,
+            help='Keep unreferenced blobs younger than this (uploads still being saved)'
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(hours=options['grace_hours'])
+        batch_size = options['batch_size']
+        dry_run = options['dry_run']
+
+        # Incremental counts can drift (queryset updates, crashes); recount from the requests
+        counted_at = timezone.now()
+        references = Counter()
+        for model in (PurchaseRequest, ArchivedPurchaseRequest):
+            names = model.objects.values_list(*PurchaseRequest.DOCUMENT_FIELDS)
+            for row in names.iterator(chunk_size=batch_size):
+                references.update(filter(None, map(blob_digest, row)))
+
+        fixed = 0
+        # Blobs uploaded since the recount started may have references it missed
+        blobs = DocumentBlob.objects.filter(last_uploaded_at__lt=counted_at).only('digest', 'ref_count')
+        for blob in blobs.iterator(chunk_size=batch_size):
+            if blob.ref_count != references[blob.digest]:
+                fixed += self.save_count(blob, references[blob.digest], dry_run)
+
+        removed = 0
+        orphans = DocumentBlob.objects.filter(ref_count=0, last_uploaded_at__lt=cutoff).values_list('digest', flat=True)
+        for digest in orphans.iterator(chunk_size=batch_size):
+            removed += self.remove_orphan(digest, cutoff, dry_run)
+
+        # Files left behind by saves that never registered a blob, and abandoned temp files
+        stray = 0
+        known = set(DocumentBlob.objects.values_list('digest', flat=True))
+        root = default_storage.path(BLOB_DIR)
+        tmp_root = default_storage.path(BLOB_TMP_DIR)
+        for directory, _, files in os.walk(root):
+            for filename in files:
+                path = os.path.join(directory, filename)
+                if os.path.getmtime(path) > cutoff.timestamp():
+                    continue
+                in_tmp = os.path.commonpath([path, tmp_root]) == tmp_root
+                digest = blob_digest(os.path.relpath(path, default_storage.location))
+                if in_tmp or digest not in known:
+                    # An upload registers the blob, then touches or rewrites its file
+                    if not in_tmp and DocumentBlob.objects.filter(digest=digest).exists():
+                        continue
+                    if not dry_run:
+                        os.remove(path)
+                    stray += 1
+
+        prefix = '[dry run] ' if dry_run else ''
+        self.stdout.write(self.style.SUCCESS(
+            f'{prefix}Fixed {fixed} reference counts, removed {removed} orphaned blobs and {stray} stray files'
+        ))
+
+    def save_count(self, blob, count, dry_run):
+        """Correct the reference count of `blob`, unless a save changed it since it was read"""
+        if dry_run:
+            return 1
+        return DocumentBlob.objects.filter(pk=blob.pk, ref_count=blob.ref_count).update(ref_count=count)
+
+    def remove_orphan(self, digest, cutoff, dry_run):
+        """
+        Delete an unreferenced blob, its file, previews and text. The row is
+        locked and checked again first: a request may have taken it, or an
+        upload of the same bytes revived it, since it was listed. Uploads
+        take the same lock before relying on the file.
+        """
+        with transaction.atomic():
+            blob = DocumentBlob.objects.select_for_update().filter(
+                pk=digest, ref_count=0, last_uploaded_at__lt=cutoff
+            ).first()
+            if blob is None:
+                return 0
+            if not dry_run:
+                blob.delete()
+                DocumentText.objects.filter(digest=digest).delete()
+                default_storage.delete(blob.name)
+                evict_previews(blob.name)
+        return 1
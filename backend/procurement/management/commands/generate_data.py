@@ -0,0 +1,308 @@
+import random
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from procurement.models import User, PurchaseRequest, Approval, ApprovalRoute
+from procurement.fx import convert_many
+from procurement.routing import route_requests
+from procurement.sla import apply as apply_sla
+from procurement.storage import update_blob_references
+from procurement.sync import next_change_seq
+
+
+ROLE_SHARES = (
+    ('staff', 0.7),
+    ('approver-level-1', 0.1),
+    ('approver-level-2', 0.1),
+    ('finance', 0.1),
+)
+
+VENDORS = [
+    'Acme Supplies', 'Globex Trading', 'Initech Office', 'Umbrella Logistics', 'Stark Components',
+    'Wayne Hardware', 'Hooli Cloud', 'Soylent Catering', 'Vandelay Industries', 'Wonka Facilities',
+    'Cyberdyne Systems', 'Tyrell Electronics', 'Oscorp Labs', 'Gringotts Finance', 'Dunder Paper',
+]
+ITEMS = [
+    ('Laptop', 900, 1800), ('Monitor', 150, 450), ('Office chair', 120, 600), ('Desk', 200, 900),
+    ('Printer paper (box)', 20, 45), ('Toner cartridge', 40, 120), ('Network switch', 150, 1200),
+    ('Software licence', 50, 2500), ('Projector', 400, 1500), ('Headset', 30, 250),
+    ('Catering (per head)', 10, 40), ('Courier service', 15, 300), ('Server rack', 800, 4000),
+]
+CURRENCIES = ['USD', 'USD', 'USD', 'EUR', 'RWF']
+DEPARTMENTS = ['Operations', 'Engineering', 'Finance', 'Sales', 'Facilities', 'HR', 'Marketing']
+
+
+def synthetic_pdf(lines):
+    """A minimal one-page PDF with `lines` of real text, so extraction works on it"""
+    def escape(text):
+        return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+    stream = 'BT /F1 11 Tf 50 790 Td 15 TL ' + ' '.join(f'({escape(line)}) Tj T*' for line in lines) + ' ET'
+    objects = [
+        '<< /Type /Catalog /Pages 2 0 R >>',
+        '<< /Type /Pages /Kids [3 0 R] /Count 1 >>',
+        '<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Contents 4 0 R '
+        '/Resources << /Font << /F1 5 0 R >> >> >>',
+        f'<< /Length {len(stream)} >>\nstream\n{stream}\nendstream',
+        '<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>',
+    ]
+    pdf = b'%PDF-1.4\n'
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(pdf))
+        pdf += f'{number} 0 obj\n{body}\nendobj\n'.encode('latin-1')
+    xref = len(pdf)
+    pdf += f'xref\n0 {len(objects) + 1}\n0000000000 65535 f \n'.encode()
+    pdf += b''.join(f'{offset:010d} 00000 n \n'.encode() for offset in offsets)
+    pdf += f'trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n'.encode()
+    return pdf
+
+
+@contextmanager
+def explicit_timestamps(model):
+    """Let bulk_create keep the created_at/updated_at values we set instead of now()"""
+    fields = [field for field in model._meta.concrete_fields
+              if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class Command(BaseCommand):
+    help = 'Bulk-generate synthetic users, purchase requests, approvals and documents for load testing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200, help='Users to create, split across all roles')
+        parser.add_argument('--requests', type=int, default=10000)
+        parser.add_argument('--documents', type=int, default=100,
+                            help='Distinct synthetic quotes; requests share them like real duplicates')
+        parser.add_argument('--days', type=int, default=365, help='Spread creation dates over this many days')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--password', default='loadtest', help='Password of every generated user')
+        parser.add_argument('--prefix', default='load', help='Username prefix of generated users')
+        parser.add_argument('--seed', type=int, help='Random seed, for reproducible data')
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        started = time.perf_counter()
+
+        if options['users']:
+            self.create_users(options['users'], options['prefix'], options['password'])
+
+        by_role = {role: list(User.objects.filter(role=role, is_active=True).values_list('id', flat=True))
+                   for role, _ in ROLE_SHARES}
+        missing = [role for role in ('staff', 'approver-level-1', 'approver-level-2') if not by_role[role]]
+        if missing and options['requests']:
+            raise CommandError(f"No users with role {', '.join(missing)}; pass --users")
+
+        if options['requests']:
+            templates = self.create_documents(options['documents'])
+            self.create_requests(options['requests'], by_role, templates, options['days'], options['batch_size'])
+
+        self.stdout.write(self.style.SUCCESS(f'Done in {time.perf_counter() - started:.1f}s'))
+
+    def create_users(self, count, prefix, password):
+        # Hashing is deliberately slow; every generated user shares one hash
+        password_hash = make_password(password)
+        offset = User.objects.filter(username__startswith=f'{prefix}-').count()
+        roles = [role for role, _ in ROLE_SHARES]
+        shares = [share for _, share in ROLE_SHARES]
+        # Every role is present, so the generated requests can be approved
+        assigned = roles[:count] + self.random.choices(roles, shares, k=max(count - len(roles), 0))
+        users = [
+            User(
+                username=f'{prefix}-{role}-{i}',
+                email=f'{prefix}-{i}@example.com',
+                first_name=role.split('-')[0].title(),
+                last_name=str(i),
+                role=role,
+                department=self.random.choice(DEPARTMENTS),
+                password=password_hash,
+            )
+            for i, role in enumerate(assigned, start=offset)
+        ]
+        User.objects.bulk_create(users, batch_size=1000)
+        self.stdout.write(f'Created {len(users)} users')
+
+    def create_documents(self, count):
+        """Store `count` quote templates as PDFs (proforma, PO, receipt) and return them"""
+        storage = PurchaseRequest._meta.get_field('proforma').storage
+        templates = []
+        for i in range(count):
+            vendor = self.random.choice(VENDORS)
+            currency = self.random.choice(CURRENCIES)
+            items = []
+            for name, low, high in self.random.sample(ITEMS, self.random.randint(1, 5)):
+                quantity = self.random.randint(1, 20)
+                unit_price = round(self.random.uniform(low, high), 2)
+                items.append({'name': name, 'quantity': quantity, 'unit_price': unit_price,
+                              'total': round(quantity * unit_price, 2)})
+            total = round(sum(item['total'] for item in items), 2)
+            item_lines = [f"{item['name']}: {item['quantity']} x {item['unit_price']} = {item['total']}"
+                          for item in items]
+
+            proforma = synthetic_pdf(
+                [f'PROFORMA INVOICE Q-{i:05d}', vendor, f'Currency: {currency}', ''] + item_lines
+                + ['', f'Total: {currency} {total}', 'Payment terms: 30 days net', 'Delivery: 2 weeks']
+            )
+            receipt = synthetic_pdf(
+                [f'RECEIPT R-{i:05d}', f'Seller: {vendor}', ''] + item_lines + ['', f'Total paid: {currency} {total}']
+            )
+            purchase_order = '\n'.join(['PURCHASE ORDER', f'Vendor: {vendor}'] + item_lines
+                                       + [f'TOTAL: {currency} {total}']).encode()
+            templates.append({
+                'vendor': vendor,
+                'currency': currency,
+                'items': items,
+                'total': total,
+                'proforma': storage.save(f'proformas/quote_{i}.pdf', ContentFile(proforma)),
+                'receipt': storage.save(f'receipts/receipt_{i}.pdf', ContentFile(receipt)),
+                'purchase_order': storage.save(f'purchase_orders/po_{i}.txt', ContentFile(purchase_order)),
+            })
+        self.stdout.write(f'Stored {count} synthetic quotes')
+        return templates
+
+    def build_request(self, template, created_by, created_at):
+        status = self.random.choices(['pending', 'approved', 'rejected'], [0.4, 0.45, 0.15])[0]
+        # Amounts mostly track the quote, with the odd fat-fingered one
+        amount = template['total'] * (1 if self.random.random() < 0.9 else self.random.uniform(0.5, 3))
+        purchase_request = PurchaseRequest(
+            title=f"{template['items'][0]['name']} from {template['vendor']}",
+            description=f"Purchase of {len(template['items'])} item(s) for the team",
+            amount=Decimal(str(round(amount, 2))),
+            currency=template['currency'],
+            status=status,
+            created_by_id=created_by,
+            created_at=created_at,
+            updated_at=created_at,
+            proforma=template['proforma'],
+            proforma_data={
+                'vendor': template['vendor'],
+                'items': template['items'],
+                'total_amount': template['total'],
+                'currency': template['currency'],
+                'payment_terms': '30 days net',
+                'delivery_terms': '2 weeks',
+            },
+        )
+        if status == 'rejected':
+            purchase_request.rejection_reason = self.random.choice(
+                ['Over budget', 'Duplicate request', 'Use the preferred vendor', 'Not needed this quarter']
+            )
+        return purchase_request
+
+    def build_approvals(self, purchase_request, by_role):
+        """Approvals consistent with the request status"""
+        status = purchase_request.status
+        at = purchase_request.created_at
+        decisions = []
+        if status == 'approved':
+            decisions = [('approver-level-1', True), ('approver-level-2', True)]
+        elif status == 'rejected':
+            decisions = self.random.choice([
+                [('approver-level-1', False)],
+                [('approver-level-1', True), ('approver-level-2', False)],
+            ])
+        elif self.random.random() < 0.4:
+            decisions = [('approver-level-1', True)]
+
+        approvals = []
+        for role, approved in decisions:
+            at += timedelta(hours=self.random.uniform(1, 72))
+            approvals.append(Approval(
+                purchase_request=purchase_request,
+                approver_id=self.random.choice(by_role[role]),
+                approved=approved,
+                comments='' if approved else purchase_request.rejection_reason,
+                approved_at=at,
+            ))
+        purchase_request.updated_at = at
+        return approvals
+
+    def finish_approved(self, purchase_request, template, number):
+        purchase_request.purchase_order = template['purchase_order']
+        purchase_request.purchase_order_data = {
+            'po_number': f"PO-{number}-{purchase_request.created_at:%Y%m%d}",
+            'request_title': purchase_request.title,
+            'vendor': template['vendor'],
+            'items': template['items'],
+            'total_amount': float(purchase_request.amount),
+            'currency': template['currency'],
+            'status': 'issued',
+        }
+        if self.random.random() < 0.6:
+            matches = purchase_request.amount == Decimal(str(template['total']))
+            purchase_request.receipt = template['receipt']
+            purchase_request.receipt_data = {
+                'seller': template['vendor'],
+                'items': template['items'],
+                'total_amount': template['total'],
+                'currency': template['currency'],
+            }
+            purchase_request.receipt_validation = {
+                'status': 'validated' if matches else 'discrepancy_found',
+                'discrepancies': [] if matches else [{'field': 'total_amount', 'message': 'Amount mismatch'}],
+                'matches': ['Vendor name matches'],
+            }
+
+    def create_requests(self, count, by_role, templates, days, batch_size):
+        now = timezone.now()
+        created = 0
+        departments = dict(User.objects.filter(pk__in=by_role['staff']).values_list('id', 'department'))
+        role_of = {user_id: role for role, user_ids in by_role.items() for user_id in user_ids}
+        with explicit_timestamps(PurchaseRequest):
+            while created < count:
+                size = min(batch_size, count - created)
+                with transaction.atomic():
+                    templates_used = [self.random.choice(templates) for _ in range(size)]
+                    requests = [
+                        self.build_request(
+                            template,
+                            self.random.choice(by_role['staff']),
+                            now - timedelta(seconds=self.random.uniform(0, days * 86400)),
+                        )
+                        for template in templates_used
+                    ]
+                    approvals_by_request = [self.build_approvals(pr, by_role) for pr in requests]
+                    for offset, (purchase_request, template) in enumerate(zip(requests, templates_used)):
+                        if purchase_request.status == 'approved':
+                            self.finish_approved(purchase_request, template, created + offset + 1)
+
+                    approvals = [approval for group in approvals_by_request for approval in group]
+                    converted = convert_many((pr.amount, pr.currency, pr.created_at) for pr in requests)
+                    for purchase_request, amount_base in zip(requests, converted):
+                        purchase_request.amount_base = amount_base
+                    routes = route_requests(requests, departments)
+                    for purchase_request, group in zip(requests, approvals_by_request):
+                        if purchase_request.status == 'pending':
+                            apply_sla(purchase_request, {role_of[approval.approver_id] for approval in group})
+                    # Stamp everything into the change feed, in one reserved range
+                    last_seq = next_change_seq(len(requests) + len(approvals))
+                    seq = last_seq - len(requests) - len(approvals)
+                    for purchase_request in requests:
+                        seq += 1
+                        purchase_request.change_seq = seq
+                    PurchaseRequest.objects.bulk_create(requests)
+                    for approval in approvals:
+                        seq += 1
+                        approval.change_seq = seq
+                    Approval.objects.bulk_create(approvals)
+                    ApprovalRoute.objects.bulk_create(routes)
+
+                    update_blob_references([], [name for pr in requests for name in pr.document_names()])
+
+                created += size
+                self.stdout.write(f'{created}/{count} requests')
@@ -0,0 +1,45 @@
+import csv
+from datetime import date
+from decimal import Decimal, InvalidOperation
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from procurement.fx import base_currency, rates_changed
+from procurement.models import ExchangeRate
+
+
+class Command(BaseCommand):
+    help = ('Load dated exchange rates from a CSV file with currency,date,rate[,source] rows, where rate is '
+            'base currency units per unit of currency; existing rates for the same day are replaced')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--source', default='', help='Source recorded for rows without one')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        rates = []
+        with open(options['path'], newline='') as handle:
+            for line, row in enumerate(csv.reader(handle), start=1):
+                if not row or row[0].strip().lower() == 'currency':
+                    continue
+                try:
+                    currency, day, rate = row[0].strip().upper(), date.fromisoformat(row[1].strip()), Decimal(row[2])
+                except (IndexError, ValueError, InvalidOperation):
+                    raise CommandError(f'Line {line}: expected currency,YYYY-MM-DD,rate')
+                if len(currency) != 3 or rate <= 0:
+                    raise CommandError(f'Line {line}: bad currency or rate')
+                if currency == base_currency():
+                    continue
+                source = row[3].strip() if len(row) > 3 else options['source']
+                rates.append(ExchangeRate(currency=currency, rate_date=day, rate=rate, source=source))
+
+        with transaction.atomic():
+            ExchangeRate.objects.bulk_create(
+                rates, batch_size=options['batch_size'],
+                update_conflicts=True, unique_fields=['currency', 'rate_date'], update_fields=['rate', 'source'],
+            )
+            rates_changed()
+        currencies = len({rate.currency for rate in rates})
+        self.stdout.write(self.style.SUCCESS(f'Loaded {len(rates)} rates for {currencies} currencies'))
@@ -0,0 +1,186 @@
+import http.client
+import json
+import math
+import random
+import threading
+import time
+from collections import defaultdict
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+from procurement.models import User
+
+
+# name -> (roles allowed to run it, default weight)
+SCENARIOS = {
+    'list': (('staff', 'approver-level-1', 'approver-level-2', 'finance'), 40),
+    'list_pending': (('approver-level-1', 'approver-level-2'), 15),
+    'retrieve': (('staff', 'approver-level-1', 'approver-level-2', 'finance'), 25),
+    'changes': (('staff', 'approver-level-1', 'approver-level-2', 'finance'), 10),
+    'create': (('staff',), 5),
+    'approve': (('approver-level-1', 'approver-level-2'), 4),
+    'reject': (('approver-level-1',), 1),
+}
+
+
+def parse_mix(value):
+    """'list=50,retrieve=30' -> {'list': 50, 'retrieve': 30}"""
+    mix = {}
+    for part in filter(None, value.split(',')):
+        name, _, weight = part.partition('=')
+        if name not in SCENARIOS:
+            raise CommandError(f"Unknown scenario '{name}', choose from {', '.join(SCENARIOS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0
+    return sorted_values[min(int(len(sorted_values) * fraction), len(sorted_values) - 1)]
+
+
+class Client:
+    """Keep-alive JSON client for one worker thread"""
+
+    def __init__(self, host, port):
+        self.host, self.port = host, port
+        self.connection = None
+
+    def request(self, method, path, token=None, body=None):
+        headers = {'Accept': 'application/json'}
+        if token:
+            headers['Authorization'] = f'Bearer {token}'
+        if body is not None:
+            body = json.dumps(body)
+            headers['Content-Type'] = 'application/json'
+        for attempt in range(2):
+            if self.connection is None:
+                self.connection = http.client.HTTPConnection(self.host, self.port, timeout=60)
+            try:
+                self.connection.request(method, path, body=body, headers=headers)
+                response = self.connection.getresponse()
+                return response.status, response.read()
+            except (http.client.HTTPException, OSError):
+                # Server closed the kept-alive connection; reconnect once
+                self.connection.close()
+                self.connection = None
+                if attempt:
+                    raise
+
+
+class Command(BaseCommand):
+    help = 'Replay a mix of role-based API traffic against a running server and report latency per endpoint'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000')
+        parser.add_argument('--duration', type=float, default=30, help='Seconds to run')
+        parser.add_argument('--concurrency', type=int, default=8, help='Worker threads')
+        parser.add_argument('--mix', type=parse_mix, help='Scenario weights, e.g. list=50,retrieve=30,approve=5')
+        parser.add_argument('--prefix', default='load', help='Username prefix of the users generate_data created')
+        parser.add_argument('--password', default='loadtest')
+        parser.add_argument('--users-per-role', type=int, default=5)
+        parser.add_argument('--seed', type=int)
+
+    def handle(self, *args, **options):
+        url = urlsplit(options['url'])
+        if url.scheme != 'http':
+            raise CommandError('Only plain http URLs are supported')
+        self.host, self.port = url.hostname, url.port or 80
+        self.random = random.Random(options['seed'])
+        mix = options['mix'] or {name: weight for name, (_, weight) in SCENARIOS.items()}
+
+        sessions = self.log_in(options['prefix'], options['password'], options['users_per_role'])
+        mix = {name: weight for name, weight in mix.items()
+               if weight > 0 and any(sessions.get(role) for role in SCENARIOS[name][0])}
+        if not mix:
+            raise CommandError(f"No users named {options['prefix']}-* could log in; run generate_data first")
+
+        self.samples = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self.lock = threading.Lock()
+        deadline = time.monotonic() + options['duration']
+        workers = [
+            threading.Thread(target=self.work, args=(mix, sessions, deadline, random.Random(self.random.random())))
+            for _ in range(options['concurrency'])
+        ]
+        started = time.monotonic()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.report(time.monotonic() - started)
+
+    def log_in(self, prefix, password, per_role):
+        """Tokens and a pool of visible request ids for a few users of each role"""
+        client = Client(self.host, self.port)
+        sessions = defaultdict(list)
+        for role in ('staff', 'approver-level-1', 'approver-level-2', 'finance'):
+            usernames = User.objects.filter(username__startswith=f'{prefix}-', role=role, is_active=True) \
+                .order_by('?').values_list('username', flat=True)[:per_role]
+            for username in usernames:
+                status, body = client.request('POST', '/api/token/', body={'username': username, 'password': password})
+                if status != 200:
+                    self.stderr.write(f'Could not log in as {username}: {status}')
+                    continue
+                token = json.loads(body)['access']
+                # Approvers get pending requests, which they can act on
+                query = '?status=pending' if role.startswith('approver') else ''
+                status, body = client.request('GET', f'/api/requests/{query}', token)
+                page = json.loads(body) if status == 200 else {'count': 0, 'results': []}
+                ids = [item['id'] for item in page['results']]
+                # List pages past the last one are 404s; approvers only saw pending requests, a lower bound
+                pages = math.ceil(page['count'] / len(ids)) if ids else 1
+                sessions[role].append({'token': token, 'ids': ids, 'pages': min(pages, 5)})
+        return sessions
+
+    def work(self, mix, sessions, deadline, rng):
+        client = Client(self.host, self.port)
+        names, weights = list(mix), list(mix.values())
+        while time.monotonic() < deadline:
+            name = rng.choices(names, weights)[0]
+            roles = [role for role in SCENARIOS[name][0] if sessions.get(role)]
+            session = rng.choice(sessions[rng.choice(roles)])
+            method, path, body = self.build(name, session, rng)
+            started = time.perf_counter()
+            try:
+                status, _ = client.request(method, path, session['token'], body)
+            except (http.client.HTTPException, OSError):
+                status = 'error'
+            elapsed = time.perf_counter() - started
+            with self.lock:
+                self.samples[name].append(elapsed)
+                self.statuses[name][status] += 1
+
+    def build(self, name, session, rng):
+        request_id = rng.choice(session['ids']) if session['ids'] else 0
+        if name == 'list':
+            return 'GET', f'/api/requests/?page={rng.randint(1, session["pages"])}', None
+        if name == 'list_pending':
+            return 'GET', '/api/requests/?status=pending', None
+        if name == 'retrieve':
+            return 'GET', f'/api/requests/{request_id}/', None
+        if name == 'changes':
+            return 'GET', '/api/requests/changes/?since=0&limit=100', None
+        if name == 'create':
+            return 'POST', '/api/requests/', {
+                'title': 'Load test request', 'description': 'Generated by loadtest',
+                'amount': f'{rng.uniform(10, 5000):.2f}',
+            }
+        if name == 'approve':
+            return 'PATCH', f'/api/requests/{request_id}/approve/', {'approved': True}
+        return 'PATCH', f'/api/requests/{request_id}/reject/', {'comments': 'Load test'}
+
+    def report(self, elapsed):
+        total = sum(len(samples) for samples in self.samples.values())
+        self.stdout.write(f'{total} requests in {elapsed:.1f}s, {total / elapsed:.1f} req/s\n')
+        self.stdout.write(f"{'endpoint':<14}{'count':>8}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}  statuses")
+        for name in sorted(self.samples):
+            samples = sorted(self.samples[name])
+            statuses = ' '.join(f'{status}:{count}' for status, count in sorted(self.statuses[name].items(), key=str))
+            self.stdout.write(
+                f'{name:<14}{len(samples):>8}{len(samples) / elapsed:>9.1f}'
+                f'{percentile(samples, 0.5) * 1000:>9.1f}{percentile(samples, 0.95) * 1000:>9.1f}'
+                f'{percentile(samples, 0.99) * 1000:>9.1f}  {statuses}'
+            )
@@ -0,0 +1,105 @@
+import asyncio
+import resource
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+from procurement.streaming import EVENT_STREAM_PATH
+
+
+def read_rss_kb(pid):
+    try:
+        with open(f'/proc/{pid}/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+
+class Command(BaseCommand):
+    help = 'Hold many idle event stream connections against a running ASGI server'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help='Base URL of the ASGI server')
+        parser.add_argument('--token', required=True, help='JWT access token used by every connection')
+        parser.add_argument('--connections', type=int, default=2000)
+        parser.add_argument('--hold', type=float, default=30, help='Seconds to keep the connections open')
+        parser.add_argument('--ramp', type=int, default=200, help='Connections opened concurrently')
+        parser.add_argument('--server-pid', type=int, help='Report the RSS of this server process')
+
+    def handle(self, *args, **options):
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if options['connections'] + 100 > soft:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (min(options['connections'] + 100, hard), hard))
+
+        url = urlsplit(options['url'])
+        if url.scheme != 'http':
+            raise CommandError('Only plain http URLs are supported')
+        asyncio.run(self.run(url.hostname, url.port or 80, options))
+
+    async def run(self, host, port, options):
+        request = (
+            f"GET {EVENT_STREAM_PATH} HTTP/1.1\r\n"
+            f"Host: {host}\r\n"
+            f"Authorization: Bearer {options['token']}\r\n"
+            f"Accept: text/event-stream\r\n\r\n"
+        ).encode()
+        stats = {'connected': 0, 'failed': 0, 'bytes': 0}
+        stop = asyncio.Event()
+        semaphore = asyncio.Semaphore(options['ramp'])
+        rss_before = read_rss_kb(options['server_pid']) if options['server_pid'] else None
+
+        async def hold_connection():
+            async with semaphore:
+                try:
+                    reader, writer = await asyncio.open_connection(host, port)
+                    writer.write(request)
+                    await writer.drain()
+                    status_line = await reader.readline()
+                except OSError:
+                    stats['failed'] += 1
+                    return
+                if b' 200 ' not in status_line:
+                    stats['failed'] += 1
+                    writer.close()
+                    return
+                stats['connected'] += 1
+
+            while not stop.is_set():
+                try:
+                    chunk = await asyncio.wait_for(reader.read(4096), timeout=1)
+                except asyncio.TimeoutError:
+                    continue
+                if not chunk:
+                    stats['connected'] -= 1
+                    stats['failed'] += 1
+                    return
+                stats['bytes'] += len(chunk)
+            writer.close()
+
+        started = time.perf_counter()
+        tasks = [asyncio.create_task(hold_connection()) for _ in range(options['connections'])]
+        while stats['connected'] + stats['failed'] < options['connections']:
+            await asyncio.sleep(0.1)
+        ramp_time = time.perf_counter() - started
+        self.stdout.write(
+            f"{stats['connected']} connected, {stats['failed']} failed in {ramp_time:.1f}s"
+        )
+
+        await asyncio.sleep(options['hold'])
+        self.stdout.write(
+            f"{stats['connected']} still open after {options['hold']:.0f}s, {stats['bytes']} bytes received"
+        )
+        if rss_before is not None:
+            rss_after = read_rss_kb(options['server_pid'])
+            per_connection = (rss_after - rss_before) / max(stats['connected'], 1)
+            self.stdout.write(
+                f"server RSS {rss_before / 1024:.1f} MiB -> {rss_after / 1024:.1f} MiB "
+                f"({per_connection:.1f} KiB per connection)"
+            )
+
+        stop.set()
+        await asyncio.gather(*tasks, return_exceptions=True)
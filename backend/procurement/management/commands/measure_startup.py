@@ -0,0 +1,56 @@
+import json
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+
+# Runs in a fresh interpreter: what a worker does before serving its first request
+PROBE = """
+import json, os, resource, sys, time
+started = time.perf_counter()
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+import django
+django.setup()
+from django.urls import get_resolver
+get_resolver().url_patterns
+ready = time.perf_counter() - started
+warm = None
+if {warm!r}:
+    from procurement.extraction import warm_up
+    warm = warm_up()
+print(json.dumps({{
+    'seconds': ready,
+    'warm_up_seconds': warm,
+    'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    'document_stack': [name for name in ('pdfplumber', 'pytesseract', 'PIL', 'openai') if name in sys.modules],
+}}))
+"""
+
+
+class Command(BaseCommand):
+    help = 'Measure how long a fresh process takes to load the project, and its peak memory'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5)
+        parser.add_argument('--warm-up', action='store_true', help='Also load the document stack, as a preloading worker does')
+
+    def handle(self, *args, **options):
+        results = []
+        for _ in range(options['runs']):
+            output = subprocess.run(
+                [sys.executable, '-c', PROBE.format(warm=options['warm_up'])],
+                cwd=settings.BASE_DIR, capture_output=True, text=True, check=True,
+            ).stdout
+            results.append(json.loads(output.strip().splitlines()[-1]))
+
+        startup = statistics.median(result['seconds'] for result in results)
+        rss = statistics.median(result['max_rss_kb'] for result in results)
+        self.stdout.write(f"startup {startup * 1000:.0f} ms, peak RSS {rss / 1024:.1f} MiB "
+                          f"(median of {len(results)} runs)")
+        if options['warm_up']:
+            warm = statistics.median(result['warm_up_seconds'] for result in results)
+            self.stdout.write(f"document stack warm-up {warm * 1000:.0f} ms")
+        self.stdout.write(f"document libraries loaded: {', '.join(results[-1]['document_stack']) or 'none'}")
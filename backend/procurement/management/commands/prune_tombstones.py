@@ -0,0 +1,29 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from procurement.models import ChangeSequence, Tombstone
+from procurement.sync import PRUNED_COUNTER
+
+
+class Command(BaseCommand):
+    help = 'Delete old change feed tombstones; clients with older cursors must resync'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30, help='Keep tombstones newer than this')
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        expired = Tombstone.objects.filter(deleted_at__lt=cutoff)
+        watermark = expired.aggregate(value=Max('change_seq'))['value']
+        if watermark is None:
+            self.stdout.write('No tombstones to prune')
+            return
+
+        deleted, _ = expired.delete()
+        ChangeSequence.objects.update_or_create(pk=PRUNED_COUNTER, defaults={'value': watermark})
+        self.stdout.write(self.style.SUCCESS(f'Pruned {deleted} tombstones up to sequence {watermark}'))
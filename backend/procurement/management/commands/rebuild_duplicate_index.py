@@ -0,0 +1,100 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from procurement.duplicates import band_buckets, find_duplicates, merge_flags, minhash, pack, unpack
+from procurement.models import DocumentSignature, LSHBucket, PurchaseRequest
+from procurement.sync import next_change_seq
+from procurement.utils import extract_document_text
+
+
+class Command(BaseCommand):
+    help = 'Sign unindexed proformas and receipts, rebuild the LSH buckets and optionally re-flag duplicates'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--resign', action='store_true',
+                            help='Re-read every document, e.g. after changing the signature parameters')
+        parser.add_argument('--flag', action='store_true',
+                            help='Recompute duplicate_candidates on every indexed request')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        self.sign_documents(batch_size, options['resign'])
+        self.rebuild_buckets(batch_size)
+        if options['flag']:
+            self.flag_duplicates(batch_size)
+
+    def batches(self, queryset, batch_size):
+        last_pk = 0
+        while True:
+            batch = list(queryset.filter(pk__gt=last_pk).order_by('pk')[:batch_size])
+            if not batch:
+                return
+            last_pk = batch[-1].pk
+            yield batch
+
+    def sign_documents(self, batch_size, resign):
+        signed, skipped = 0, 0
+        for kind in ('proforma', 'receipt'):
+            documents = PurchaseRequest.objects.exclude(**{kind: ''}).exclude(**{f'{kind}__isnull': True})
+            if not resign:
+                documents = documents.exclude(document_signatures__kind=kind)
+            for batch in self.batches(documents.only('pk', kind), batch_size):
+                signatures = []
+                for purchase_request in batch:
+                    try:
+                        signature = minhash(extract_document_text(getattr(purchase_request, kind)))
+                    except (OSError, ValueError):
+                        signature = None
+                    if signature is None:
+                        skipped += 1
+                        continue
+                    signatures.append(DocumentSignature(
+                        purchase_request=purchase_request, kind=kind, signature=pack(signature)
+                    ))
+                with transaction.atomic():
+                    DocumentSignature.objects.filter(
+                        kind=kind, purchase_request__in=[signature.purchase_request for signature in signatures]
+                    ).delete()
+                    DocumentSignature.objects.bulk_create(signatures)
+                signed += len(signatures)
+                self.stdout.write(f'{signed} documents signed')
+        self.stdout.write(f'Signed {signed} documents, skipped {skipped} without readable text')
+
+    def rebuild_buckets(self, batch_size):
+        LSHBucket.objects.all().delete()
+        indexed = 0
+        for batch in self.batches(DocumentSignature.objects.only('pk', 'kind', 'signature'), batch_size):
+            LSHBucket.objects.bulk_create(
+                (LSHBucket(bucket=bucket, signature_id=record.pk)
+                 for record in batch for bucket in band_buckets(record.kind, unpack(record.signature))),
+                batch_size=batch_size,
+            )
+            indexed += len(batch)
+        self.stdout.write(self.style.SUCCESS(f'Indexed {indexed} signatures'))
+
+    def flag_duplicates(self, batch_size):
+        indexed = PurchaseRequest.objects.filter(pk__in=DocumentSignature.objects.values('purchase_request_id'))
+        flagged = 0
+        for batch in self.batches(indexed.only('pk', 'duplicate_candidates'), batch_size):
+            signatures = DocumentSignature.objects.filter(purchase_request__in=batch) \
+                .values_list('purchase_request_id', 'kind', 'signature')
+            candidates = {purchase_request.pk: purchase_request.duplicate_candidates for purchase_request in batch}
+            for request_id, kind, signature in signatures:
+                duplicates = find_duplicates(request_id, kind, unpack(signature))
+                candidates[request_id] = merge_flags(candidates[request_id], kind, duplicates)
+
+            changed = [purchase_request for purchase_request in batch
+                       if candidates[purchase_request.pk] != purchase_request.duplicate_candidates]
+            if not changed:
+                continue
+            with transaction.atomic():
+                # duplicate_candidates is part of the synced representation
+                seq = next_change_seq(len(changed)) - len(changed)
+                for purchase_request in changed:
+                    seq += 1
+                    purchase_request.duplicate_candidates = candidates[purchase_request.pk]
+                    purchase_request.change_seq = seq
+                PurchaseRequest.objects.bulk_update(changed, ['duplicate_candidates', 'change_seq'])
+            flagged += sum(1 for purchase_request in changed if purchase_request.duplicate_candidates)
+        self.stdout.write(self.style.SUCCESS(f'{flagged} requests flagged with likely duplicates'))
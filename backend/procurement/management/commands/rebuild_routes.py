@@ -0,0 +1,63 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from procurement.models import ApprovalRoute, PurchaseRequest, User
+from procurement.routing import revoke_unrouted, route_requests, routed_approvers
+from procurement.sla import apply_many as apply_sla
+from procurement.sync import next_change_seq
+
+
+class Command(BaseCommand):
+    help = ('Re-route every pending request under the current routing rules and approvers; '
+            'run it after deploying routing, or after changing rules or approver roles')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        departments = dict(User.objects.values_list('id', 'department'))
+        pending = PurchaseRequest.objects.filter(status='pending').only(
+            'pk', 'amount', 'amount_base', 'status', 'created_by', 'created_at', 'approval_levels',
+            'sla_deadlines', 'sla_due_at', 'escalated_at'
+        )
+
+        last_pk, routed, relevelled = 0, 0, 0
+        while True:
+            batch = list(pending.filter(pk__gt=last_pk).order_by('pk')[:options['batch_size']])
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+
+            levels = {purchase_request.pk: purchase_request.approval_levels for purchase_request in batch}
+            deadlines = {purchase_request.pk: purchase_request.sla_deadlines for purchase_request in batch}
+            routes = route_requests(batch, departments)
+            apply_sla(batch)
+            changed = [
+                purchase_request for purchase_request in batch
+                if purchase_request.approval_levels != levels[purchase_request.pk]
+                or purchase_request.sla_deadlines != deadlines[purchase_request.pk]
+            ]
+            after = {}
+            for route in routes:
+                after.setdefault(route.purchase_request.pk, set()).add(route.approver_id)
+            with transaction.atomic():
+                before = routed_approvers([purchase_request.pk for purchase_request in batch])
+                ApprovalRoute.objects.filter(purchase_request__in=batch).delete()
+                ApprovalRoute.objects.bulk_create(routes)
+                revoke_unrouted(before, after)
+                if changed:
+                    # approval_levels and sla_due_at are part of the synced representation
+                    seq = next_change_seq(len(changed)) - len(changed)
+                    for purchase_request in changed:
+                        seq += 1
+                        purchase_request.change_seq = seq
+                    PurchaseRequest.objects.bulk_update(changed, [
+                        'approval_levels', 'sla_deadlines', 'sla_due_at', 'escalated_at', 'change_seq'
+                    ])
+            routed += len(batch)
+            relevelled += len(changed)
+            self.stdout.write(f'{routed} requests routed')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Routed {routed} pending requests, {relevelled} with changed approval levels or deadlines'
+        ))
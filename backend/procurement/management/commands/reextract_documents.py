@@ -0,0 +1,64 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+
+from procurement.models import PurchaseRequest
+from procurement.utils import extract_document_text, extract_proforma_data, validate_receipt
+
+
+class Command(BaseCommand):
+    help = ('Fill the document text store for proformas and receipts, and optionally re-parse their '
+            'extracted data from the stored text')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--kind', choices=['proforma', 'receipt'], action='append',
+                            help='Only this kind of document (repeatable); default both')
+        parser.add_argument('--ocr', action='store_true',
+                            help='Run text extraction again even for documents with current stored text')
+        parser.add_argument('--parse', action='store_true',
+                            help='Re-run the structured extraction (and receipt validation) from the stored text')
+        parser.add_argument('--batch-size', type=int, default=200)
+
+    def handle(self, *args, **options):
+        for kind in options['kind'] or ['proforma', 'receipt']:
+            documents = PurchaseRequest.objects.filter(~Q(**{kind: ''}), **{f'{kind}__isnull': False})
+            read = parsed = skipped = 0
+            last_pk = 0
+            while True:
+                batch = list(documents.filter(pk__gt=last_pk).order_by('pk')[:options['batch_size']])
+                if not batch:
+                    break
+                last_pk = batch[-1].pk
+                for purchase_request in batch:
+                    try:
+                        text = extract_document_text(getattr(purchase_request, kind), reextract=options['ocr'])
+                    except OSError:
+                        text = None
+                    if not text or not text.strip():
+                        skipped += 1
+                        continue
+                    read += 1
+                    if options['parse']:
+                        with transaction.atomic():
+                            self.parse(purchase_request, kind, text)
+                        parsed += 1
+                self.stdout.write(f'{kind}: {read} read, {parsed} re-parsed, {skipped} without text')
+            self.stdout.write(self.style.SUCCESS(
+                f'{kind}: {read} documents have stored text, {parsed} re-parsed, {skipped} unreadable'
+            ))
+
+    def parse(self, purchase_request, kind, text):
+        if kind == 'proforma':
+            data = extract_proforma_data(purchase_request.proforma, text=text)
+            purchase_request.proforma_data = data
+            purchase_request.proforma_vendor_id = data.get('vendor_id')
+            purchase_request.save(update_fields=['proforma_data', 'proforma_vendor', 'updated_at'])
+        else:
+            data, validation = validate_receipt(
+                purchase_request.receipt, purchase_request.purchase_order_data,
+                po_vendor_id=purchase_request.proforma_vendor_id, text=text,
+            )
+            purchase_request.receipt_data = data
+            purchase_request.receipt_vendor_id = data.get('vendor_id')
+            purchase_request.receipt_validation = validation
+            purchase_request.save(update_fields=['receipt_data', 'receipt_vendor', 'receipt_validation', 'updated_at'])
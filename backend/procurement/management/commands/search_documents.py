@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from procurement.document_text import search_text
+from procurement.models import ArchivedPurchaseRequest, PurchaseRequest
+from procurement.storage import blob_name
+
+
+class Command(BaseCommand):
+    help = 'List the requests whose stored proforma or receipt text contains a phrase'
+
+    def add_arguments(self, parser):
+        parser.add_argument('query')
+        parser.add_argument('--kind', choices=['proforma', 'receipt'], action='append',
+                            help='Only this kind of document (repeatable); default both')
+        parser.add_argument('--batch-size', type=int, default=200)
+
+    def handle(self, *args, **options):
+        kinds = options['kind'] or ['proforma', 'receipt']
+        found = 0
+        for digest, pages in search_text(options['query'], batch_size=options['batch_size']):
+            # Content-addressed names start with the digest, whatever the extension
+            prefix = blob_name(digest, '')
+            matches = Q()
+            for kind in kinds:
+                matches |= Q(**{f'{kind}__startswith': prefix})
+            for model in (PurchaseRequest, ArchivedPurchaseRequest):
+                for purchase_request in model.objects.filter(matches).only('pk', 'title', *kinds).order_by('pk'):
+                    for kind in kinds:
+                        if getattr(purchase_request, kind).name.startswith(prefix):
+                            found += 1
+                            archived = ' (archived)' if model is ArchivedPurchaseRequest else ''
+                            self.stdout.write(
+                                f'#{purchase_request.pk}{archived} {purchase_request.title}: {kind}, '
+                                f'page {", ".join(map(str, pages))}'
+                            )
+        self.stdout.write(self.style.SUCCESS(f'{found} documents match'))
@@ -0,0 +1,148 @@
+"""
+Request timing broken down by phase, exported in Prometheus format.
+
+RequestMetricsMiddleware times every request and counts its SQL queries;
+code wrapped in `timed(phase)` (text extraction, the OpenAI call, PO
+generation, serialization) adds to the same per-request breakdown, which is
+logged as one structured line and sent back in a Server-Timing header.
+
+With several worker processes, point PROMETHEUS_MULTIPROC_DIR at a shared,
+empty directory so /metrics/ aggregates all of them.
+"""
+import contextvars
+import functools
+import logging
+import os
+import time
+from contextlib import contextmanager
+
+from django.db import connection
+from django.http import HttpResponse
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess,
+)
+
+
+logger = logging.getLogger('procurement.requests')
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'Request latency by endpoint',
+    ['method', 'endpoint', 'status'],
+)
+REQUEST_SQL_QUERIES = Histogram(
+    'http_request_sql_queries', 'SQL queries run per request',
+    ['endpoint'], buckets=(0, 1, 2, 5, 10, 20, 50, 100, 200, 500),
+)
+PHASE_DURATION = Histogram(
+    'request_phase_duration_seconds', 'Time spent in each phase of handling a request',
+    ['phase'], buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+PHASE_ERRORS = Counter('request_phase_errors_total', 'Phases that raised', ['phase'])
+
+# Phase -> [calls, seconds] for the request being handled
+_breakdown = contextvars.ContextVar('request_breakdown', default=None)
+_active_phases = contextvars.ContextVar('active_phases', default=frozenset())
+
+
+def _record(phase, seconds, calls=1):
+    breakdown = _breakdown.get()
+    if breakdown is not None:
+        entry = breakdown.setdefault(phase, [0, 0.0])
+        entry[0] += calls
+        entry[1] += seconds
+
+
+@contextmanager
+def timed(phase):
+    """Time the enclosed block as `phase`; nested blocks of the same phase count once"""
+    active = _active_phases.get()
+    if phase in active:
+        yield
+        return
+    token = _active_phases.set(active | {phase})
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        PHASE_ERRORS.labels(phase).inc()
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        _active_phases.reset(token)
+        PHASE_DURATION.labels(phase).observe(elapsed)
+        _record(phase, elapsed)
+
+
+def timed_function(phase):
+    """Decorator form of `timed`"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timed(phase):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _time_query(execute, sql, params, many, context):
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        _record('sql', time.perf_counter() - started)
+
+
+class RequestMetricsMiddleware:
+    """Record latency, SQL queries and the phase breakdown of every request"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        breakdown = {}
+        token = _breakdown.set(breakdown)
+        started = time.perf_counter()
+        try:
+            with connection.execute_wrapper(_time_query):
+                response = self.get_response(request)
+        finally:
+            _breakdown.reset(token)
+        elapsed = time.perf_counter() - started
+
+        match = request.resolver_match
+        endpoint = match.view_name if match else 'unmatched'
+        sql_queries, sql_seconds = breakdown.get('sql', (0, 0.0))
+        REQUEST_LATENCY.labels(request.method, endpoint, response.status_code).observe(elapsed)
+        REQUEST_SQL_QUERIES.labels(endpoint).observe(sql_queries)
+        PHASE_DURATION.labels('sql').observe(sql_seconds)
+
+        response['Server-Timing'] = ', '.join(
+            [f'{phase};dur={seconds * 1000:.1f}' for phase, (calls, seconds) in breakdown.items()]
+            + [f'total;dur={elapsed * 1000:.1f}']
+        )
+        logger.info(
+            '%s %s %s', request.method, request.path, response.status_code,
+            extra={
+                'method': request.method,
+                'path': request.path,
+                'endpoint': endpoint,
+                'status': response.status_code,
+                'duration_ms': round(elapsed * 1000, 1),
+                'sql_queries': sql_queries,
+                'phases': {
+                    phase: {'calls': calls, 'ms': round(seconds * 1000, 1)}
+                    for phase, (calls, seconds) in breakdown.items()
+                },
+            },
+        )
+        return response
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint"""
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return HttpResponse(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
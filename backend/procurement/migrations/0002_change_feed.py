@@ -0,0 +1,66 @@
+# Generated by Django 4.2.7 on 2026-10-19 09:02
+
+from django.db import migrations, models
+from django.db.models import F, Max
+
+
+def stamp_existing_rows(apps, schema_editor):
+    # Give existing rows distinct sequence values so the initial sync can page through them
+    PurchaseRequest = apps.get_model('procurement', 'PurchaseRequest')
+    Approval = apps.get_model('procurement', 'Approval')
+    ChangeSequence = apps.get_model('procurement', 'ChangeSequence')
+
+    PurchaseRequest.objects.update(change_seq=F('id'))
+    Approval.objects.update(change_seq=F('id'))
+    highest = max(
+        PurchaseRequest.objects.aggregate(value=Max('id'))['value'] or 0,
+        Approval.objects.aggregate(value=Max('id'))['value'] or 0,
+    )
+    ChangeSequence.objects.create(name='change', value=highest)
+    ChangeSequence.objects.create(name='tombstones_pruned', value=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('procurement', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeSequence',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'change_sequences',
+            },
+        ),
+        migrations.CreateModel(
+            name='Tombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model_name', models.CharField(choices=[('purchaserequest', 'Purchase Request'), ('approval', 'Approval')], max_length=20)),
+                ('object_id', models.BigIntegerField()),
+                ('owner_id', models.BigIntegerField(help_text='Creator of the (parent) purchase request')),
+                ('change_seq', models.BigIntegerField(db_index=True)),
+                ('deleted_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'tombstones',
+                'ordering': ['change_seq'],
+            },
+        ),
+        migrations.AddField(
+            model_name='approval',
+            name='change_seq',
+            field=models.BigIntegerField(db_index=True, default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='purchaserequest',
+            name='change_seq',
+            field=models.BigIntegerField(db_index=True, default=0, editable=False),
+        ),
+        migrations.RunPython(stamp_existing_rows, migrations.RunPython.noop),
+    ]
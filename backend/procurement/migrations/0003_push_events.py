@@ -0,0 +1,31 @@
+# Generated by Django 4.2.7 on 2026-10-19 09:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('procurement', '0002_change_feed'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PushEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_type', models.CharField(max_length=50)),
+                ('purchase_request_id', models.BigIntegerField()),
+                ('owner_id', models.BigIntegerField()),
+                ('status', models.CharField(max_length=20)),
+                ('reviewer_ids', models.JSONField(default=list)),
+                ('data', models.JSONField(default=dict)),
+                ('change_seq', models.BigIntegerField(db_index=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                'db_table': 'push_events',
+                'ordering': ['change_seq', 'id'],
+            },
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 4.2.7 on 2026-10-19 09:09
+
+from django.db import migrations, models
+import django.utils.timezone
+import procurement.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('procurement', '0003_push_events'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='purchaserequest',
+            name='proforma',
+            field=models.FileField(blank=True, null=True, storage=procurement.storage.document_storage, upload_to='proformas/'),
+        ),
+        migrations.AlterField(
+            model_name='purchaserequest',
+            name='purchase_order',
+            field=models.FileField(blank=True, null=True, storage=procurement.storage.document_storage, upload_to='purchase_orders/'),
+        ),
+        migrations.AlterField(
+            model_name='purchaserequest',
+            name='receipt',
+            field=models.FileField(blank=True, null=True, storage=procurement.storage.document_storage, upload_to='receipts/'),
+        ),
+        migrations.CreateModel(
+            name='DocumentBlob',
+            fields=[
+                ('digest', models.CharField(help_text='SHA-256 of the content', max_length=64, primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=255)),
+                ('size', models.BigIntegerField()),
+                ('ref_count', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_uploaded_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'db_table': 'document_blobs',
+                'indexes': [models.Index(fields=['ref_count', 'last_uploaded_at'], name='document_bl_ref_cou_de0923_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 4.2.7 on 2026-10-19 09:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('procurement', '0005_user_token_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExtractionSlot',
+            fields=[
+                ('slot', models.PositiveIntegerField(primary_key=True, serialize=False)),
+                ('holder', models.CharField(blank=True, default='', max_length=64)),
+                ('leased_until', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'extraction_slots',
+            },
+        ),
+        migrations.CreateModel(
+            name='RateLimitBucket',
+            fields=[
+                ('key', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('tokens', models.FloatField()),
+                ('updated_at', models.DateTimeField()),
+            ],
+            options={
+                'db_table': 'rate_limit_buckets',
+            },
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 4.2.7 on 2026-10-19 09:27
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('procurement', '0007_idempotency_keys'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Vendor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(help_text='Name as first seen on a document', max_length=255)),
+                ('normalized_name', models.CharField(max_length=255, unique=True)),
+                ('trigram_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'vendors',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.AddField(
+            model_name='purchaserequest',
+            name='proforma_vendor',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='proforma_requests', to='procurement.vendor'),
+        ),
+        migrations.AddField(
+            model_name='purchaserequest',
+            name='receipt_vendor',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='receipt_requests', to='procurement.vendor'),
+        ),
+        migrations.CreateModel(
+            name='VendorTrigram',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('trigram', models.CharField(max_length=3)),
+                ('vendor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trigrams', to='procurement.vendor')),
+            ],
+            options={
+                'db_table': 'vendor_trigrams',
+                'unique_together': {('trigram', 'vendor')},
+            },
+        ),
+    ]
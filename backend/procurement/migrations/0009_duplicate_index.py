@@ -0,0 +1,51 @@
+# Generated by Django 4.2.7 on 2026-10-19 09:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('procurement', '0008_vendors'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentSignature',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('proforma', 'Proforma'), ('receipt', 'Receipt')], max_length=10)),
+                ('signature', models.BinaryField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'document_signatures',
+            },
+        ),
+        migrations.AddField(
+            model_name='purchaserequest',
+            name='duplicate_candidates',
+            field=models.JSONField(blank=True, default=list, help_text='Likely duplicates, for approvers'),
+        ),
+        migrations.CreateModel(
+            name='LSHBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.BigIntegerField(db_index=True)),
+                ('signature', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='buckets', to='procurement.documentsignature')),
+            ],
+            options={
+                'db_table': 'lsh_buckets',
+            },
+        ),
+        migrations.AddField(
+            model_name='documentsignature',
+            name='purchase_request',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='document_signatures', to='procurement.purchaserequest'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='documentsignature',
+            unique_together={('purchase_request', 'kind')},
+        ),
+    ]
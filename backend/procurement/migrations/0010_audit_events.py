@@ -0,0 +1,67 @@
+import django.core.serializers.json
+from django.db import migrations, models
+import django.utils.timezone
+
+
+# On PostgreSQL the table is range-partitioned by month; the primary key has
+# to include the partition key. Monthly partitions are added ahead of time by
+# create_audit_partitions, rows outside them land in the default partition.
+POSTGRES_TABLE = """
+CREATE TABLE audit_events (
+    id bigserial NOT NULL,
+    purchase_request_id bigint NOT NULL,
+    event_type varchar(50) NOT NULL,
+    actor_id bigint NULL,
+    actor_username varchar(150) NOT NULL,
+    status varchar(20) NOT NULL,
+    data jsonb NOT NULL,
+    created_at timestamp with time zone NOT NULL,
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+CREATE TABLE audit_events_default PARTITION OF audit_events DEFAULT;
+CREATE INDEX audit_request_history ON audit_events (purchase_request_id, created_at, id);
+"""
+
+
+def create_table(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(POSTGRES_TABLE)
+    else:
+        schema_editor.create_model(apps.get_model('procurement', 'AuditEvent'))
+
+
+def drop_table(apps, schema_editor):
+    schema_editor.delete_model(apps.get_model('procurement', 'AuditEvent'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('procurement', '0009_duplicate_index'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='AuditEvent',
+                    fields=[
+                        ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('purchase_request_id', models.BigIntegerField()),
+                        ('event_type', models.CharField(max_length=50)),
+                        ('actor_id', models.BigIntegerField(blank=True, null=True)),
+                        ('actor_username', models.CharField(blank=True, max_length=150)),
+                        ('status', models.CharField(help_text='Request status after the event', max_length=20)),
+                        ('data', models.JSONField(default=dict, encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                        ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                    ],
+                    options={
+                        'db_table': 'audit_events',
+                        'ordering': ['created_at', 'id'],
+                        'indexes': [models.Index(fields=['purchase_request_id', 'created_at', 'id'], name='audit_request_history')],
+                    },
+                ),
+            ],
+        ),
+        migrations.RunPython(create_table, drop_table),
+    ]
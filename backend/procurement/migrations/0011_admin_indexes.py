@@ -0,0 +1,40 @@
+from django.db import migrations, models
+import django.db.models.functions.text
+
+
+TITLE_INDEX = models.Index(django.db.models.functions.text.Upper('title'), name='request_title_upper')
+
+
+# istartswith compiles to UPPER(title) LIKE 'X%'; on PostgreSQL only a
+# text_pattern_ops index serves LIKE prefixes under a non-C collation
+def create_title_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(
+            'CREATE INDEX request_title_upper ON purchase_requests (UPPER(title::text) text_pattern_ops)'
+        )
+    else:
+        schema_editor.add_index(apps.get_model('procurement', 'PurchaseRequest'), TITLE_INDEX)
+
+
+def drop_title_index(apps, schema_editor):
+    schema_editor.remove_index(apps.get_model('procurement', 'PurchaseRequest'), TITLE_INDEX)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('procurement', '0010_audit_events'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='purchaserequest',
+            index=models.Index(fields=['-created_at'], name='request_created_desc'),
+        ),
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddIndex(model_name='purchaserequest', index=TITLE_INDEX),
+            ],
+        ),
+        migrations.RunPython(create_title_index, drop_title_index),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.7 on 2026-10-19 09:36
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('procurement', '0011_admin_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentText',
+            fields=[
+                ('digest', models.CharField(help_text='SHA-256 of the document content', max_length=64, primary_key=True, serialize=False)),
+                ('compressed_text', models.BinaryField(help_text='zlib-compressed UTF-8 text')),
+                ('page_offsets', models.JSONField(default=list, help_text='Character offset where each page starts')),
+                ('char_count', models.PositiveIntegerField(default=0)),
+                ('extractor', models.CharField(help_text='pdfplumber or tesseract', max_length=20)),
+                ('extractor_version', models.PositiveSmallIntegerField()),
+                ('extracted_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'db_table': 'document_texts',
+            },
+        ),
+    ]
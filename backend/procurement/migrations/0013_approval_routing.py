@@ -0,0 +1,52 @@
+# Generated by Django 4.2.7 on 2026-10-19 09:39
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('procurement', '0012_document_texts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RoutingRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('priority', models.PositiveIntegerField(default=100, help_text='Lower numbers are tried first')),
+                ('department', models.CharField(blank=True, help_text='Requester department; blank matches any', max_length=100)),
+                ('min_amount', models.DecimalField(blank=True, decimal_places=2, help_text='Inclusive; blank for no lower bound', max_digits=12, null=True)),
+                ('max_amount', models.DecimalField(blank=True, decimal_places=2, help_text='Exclusive; blank for no upper bound', max_digits=12, null=True)),
+                ('levels', models.JSONField(help_text='Levels that must approve, e.g. ["approver-level-1", "finance"]')),
+                ('same_department', models.BooleanField(default=False, help_text="Only approvers from the requester's department")),
+                ('is_active', models.BooleanField(default=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'routing_rules',
+                'ordering': ['priority', 'id'],
+            },
+        ),
+        migrations.AddField(
+            model_name='purchaserequest',
+            name='approval_levels',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.CreateModel(
+            name='ApprovalRoute',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('level', models.CharField(max_length=20)),
+                ('approver', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='routed_requests', to=settings.AUTH_USER_MODEL)),
+                ('purchase_request', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='routes', to='procurement.purchaserequest')),
+            ],
+            options={
+                'db_table': 'approval_routes',
+                'unique_together': {('approver', 'purchase_request')},
+            },
+        ),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 4.2.7 on 2026-10-19 09:46
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import procurement.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('procurement', '0014_notifications'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='documentsignature',
+            name='purchase_request',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='document_signatures', to='procurement.purchaserequest'),
+        ),
+        migrations.CreateModel(
+            name='ArchivedPurchaseRequest',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('title', models.CharField(max_length=255)),
+                ('description', models.TextField()),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('approved', 'Approved'), ('rejected', 'Rejected')], max_length=20)),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('proforma', models.FileField(blank=True, null=True, storage=procurement.storage.document_storage, upload_to='proformas/')),
+                ('proforma_data', models.JSONField(blank=True, null=True)),
+                ('purchase_order', models.FileField(blank=True, null=True, storage=procurement.storage.document_storage, upload_to='purchase_orders/')),
+                ('purchase_order_data', models.JSONField(blank=True, null=True)),
+                ('receipt', models.FileField(blank=True, null=True, storage=procurement.storage.document_storage, upload_to='receipts/')),
+                ('receipt_data', models.JSONField(blank=True, null=True)),
+                ('receipt_validation', models.JSONField(blank=True, null=True)),
+                ('rejection_reason', models.TextField(blank=True, null=True)),
+                ('approval_levels', models.JSONField(blank=True, default=list)),
+                ('duplicate_candidates', models.JSONField(blank=True, default=list)),
+                ('change_seq', models.BigIntegerField(default=0, editable=False)),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('created_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_requests', to=settings.AUTH_USER_MODEL)),
+                ('proforma_vendor', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='procurement.vendor')),
+                ('receipt_vendor', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='procurement.vendor')),
+            ],
+            options={
+                'db_table': 'archived_purchase_requests',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedApproval',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('approved', models.BooleanField(blank=True, null=True)),
+                ('comments', models.TextField(blank=True, null=True)),
+                ('approved_at', models.DateTimeField(blank=True, null=True)),
+                ('change_seq', models.BigIntegerField(default=0, editable=False)),
+                ('approver', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_approvals', to=settings.AUTH_USER_MODEL)),
+                ('purchase_request', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='approvals', to='procurement.archivedpurchaserequest')),
+            ],
+            options={
+                'db_table': 'archived_approvals',
+                'ordering': ['approved_at'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='archivedpurchaserequest',
+            index=models.Index(fields=['-created_at'], name='archived_request_created_desc'),
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 4.2.7 on 2026-10-19 09:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('procurement', '0015_archive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivedpurchaserequest',
+            name='amount_base',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=14, null=True),
+        ),
+        migrations.AddField(
+            model_name='archivedpurchaserequest',
+            name='currency',
+            field=models.CharField(blank=True, max_length=3),
+        ),
+        migrations.AddField(
+            model_name='purchaserequest',
+            name='amount_base',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=14, null=True),
+        ),
+        migrations.AddField(
+            model_name='purchaserequest',
+            name='currency',
+            field=models.CharField(blank=True, help_text='ISO 4217 code of `amount`', max_length=3),
+        ),
+        migrations.AlterField(
+            model_name='routingrule',
+            name='max_amount',
+            field=models.DecimalField(blank=True, decimal_places=2, help_text='In the base currency; exclusive; blank for no upper bound', max_digits=12, null=True),
+        ),
+        migrations.AlterField(
+            model_name='routingrule',
+            name='min_amount',
+            field=models.DecimalField(blank=True, decimal_places=2, help_text='In the base currency; inclusive; blank for no lower bound', max_digits=12, null=True),
+        ),
+        migrations.CreateModel(
+            name='ExchangeRate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('currency', models.CharField(max_length=3)),
+                ('rate_date', models.DateField()),
+                ('rate', models.DecimalField(decimal_places=10, max_digits=20)),
+                ('source', models.CharField(blank=True, max_length=50)),
+            ],
+            options={
+                'db_table': 'exchange_rates',
+                'ordering': ['currency', 'rate_date'],
+                'unique_together': {('currency', 'rate_date')},
+            },
+        ),
+    ]
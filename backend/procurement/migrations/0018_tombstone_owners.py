@@ -0,0 +1,22 @@
+# Generated by Django 4.2.7 on 2026-10-19 10:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('procurement', '0017_sla'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='tombstone',
+            name='owner_id',
+            field=models.BigIntegerField(help_text='User the deletion is reported to'),
+        ),
+        migrations.AddIndex(
+            model_name='tombstone',
+            index=models.Index(fields=['owner_id', 'change_seq'], name='tombstone_owner_seq'),
+        ),
+    ]
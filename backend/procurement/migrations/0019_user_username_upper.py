@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-19 10:25
+
+from django.db import migrations, models
+import django.db.models.functions.text
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('procurement', '0018_tombstone_owners'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(django.db.models.functions.text.Upper('username'), name='user_username_upper'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-19 10:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('procurement', '0019_user_username_upper'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='idempotencykey',
+            name='object_id',
+            field=models.BigIntegerField(blank=True, help_text='ID of the object a successful response described', null=True),
+        ),
+    ]
@@ -0,0 +1,46 @@
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations, models
+from django.db.models.functions import Upper
+
+
+TITLE_INDEX = models.Index(Upper('title'), name='request_title_upper')
+TITLE_TRIGRAM_INDEX = GinIndex(OpClass(Upper('title'), name='gin_trgm_ops'), name='request_title_upper')
+DESCRIPTION_TRIGRAM_INDEX = GinIndex(OpClass(Upper('description'), name='gin_trgm_ops'),
+                                     name='request_description_trgm')
+
+
+# icontains compiles to UPPER(column) LIKE UPPER('%x%'), which only a trigram
+# index serves. On PostgreSQL request_title_upper becomes one (it serves
+# prefixes too) and description gets one; other databases keep the plain
+# upper(title) index from 0011, and scan descriptions.
+def create_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    model = apps.get_model('procurement', 'PurchaseRequest')
+    schema_editor.remove_index(model, TITLE_INDEX)
+    schema_editor.add_index(model, TITLE_TRIGRAM_INDEX)
+    schema_editor.add_index(model, DESCRIPTION_TRIGRAM_INDEX)
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    model = apps.get_model('procurement', 'PurchaseRequest')
+    schema_editor.remove_index(model, DESCRIPTION_TRIGRAM_INDEX)
+    schema_editor.remove_index(model, TITLE_TRIGRAM_INDEX)
+    schema_editor.execute(
+        'CREATE INDEX request_title_upper ON purchase_requests (UPPER(title::text) text_pattern_ops)'
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('procurement', '0020_idempotencykey_object_id'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
@@ -1,8 +1,15 @@
+import zlib
+
 from django.db import models
+from django.db.models.functions import Upper
 from django.contrib.auth.models import AbstractUser
 from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
 from django.utils import timezone
 
+from .previews import refresh_previews
+from .storage import document_storage, update_blob_references
+
 
 class User(AbstractUser):
     ROLE_CHOICES = (
@@ -15,12 +22,88 @@ class User(AbstractUser):
     role = models.CharField(max_length=20, choices=ROLE_CHOICES, default='staff')
     phone_number = models.CharField(max_length=15, blank=True, null=True)
     department = models.CharField(max_length=100, blank=True, null=True)
+    # Bumped whenever access (role, department, active flag) changes; tokens
+    # issued for an older version are refused
+    token_version = models.PositiveIntegerField(default=1, editable=False)
+
+    ACCESS_FIELDS = ('role', 'department', 'is_active')
 
     def __str__(self):
         return f"{self.username} ({self.get_role_display()})"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Deferred fields are left out, loading them later is not a change
+        instance._loaded_access = {
+            field: instance.__dict__[field] for field in cls.ACCESS_FIELDS if field in instance.__dict__
+        }
+        return instance
+
+    def save(self, *args, **kwargs):
+        loaded = getattr(self, '_loaded_access', {})
+        if any(getattr(self, field) != value for field, value in loaded.items()):
+            self.token_version += 1
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'token_version'}
+        super().save(*args, **kwargs)
+        self._loaded_access = {field: self.__dict__[field] for field in self.ACCESS_FIELDS if field in self.__dict__}
+
     class Meta:
         db_table = 'users'
+        indexes = [
+            # Exact case-insensitive username searches (iexact), as the admin's '=created_by__username' does
+            models.Index(Upper('username'), name='user_username_upper'),
+        ]
+
+
+class Vendor(models.Model):
+    """A supplier, identified by its normalized name (see procurement.vendors)"""
+    name = models.CharField(max_length=255, help_text='Name as first seen on a document')
+    normalized_name = models.CharField(max_length=255, unique=True)
+    trigram_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'vendors'
+        ordering = ['name']
+
+    def __str__(self):
+        return self.name
+
+
+class VendorTrigram(models.Model):
+    """Inverted index from name trigrams to vendors, for fuzzy lookup on any database"""
+    trigram = models.CharField(max_length=3)
+    vendor = models.ForeignKey(Vendor, on_delete=models.CASCADE, related_name='trigrams')
+
+    class Meta:
+        db_table = 'vendor_trigrams'
+        unique_together = ('trigram', 'vendor')
+
+    def __str__(self):
+        return f"{self.trigram!r} -> {self.vendor_id}"
+
+
+class PurchaseRequestQuerySet(models.QuerySet):
+    def visible_to(self, user):
+        """Restrict to the requests `user` may see, following the role rules"""
+        # Staff can only see their own requests
+        if user.role == 'staff':
+            return self.filter(created_by=user)
+
+        # Approvers can see the pending requests routed to them and ones they've reviewed
+        if user.role in ['approver-level-1', 'approver-level-2']:
+            return self.filter(
+                models.Q(pk__in=ApprovalRoute.objects.filter(approver=user).values('purchase_request_id'))
+                | models.Q(pk__in=Approval.objects.filter(approver=user).values('purchase_request_id'))
+            )
+
+        # Finance can see all requests
+        if user.role == 'finance':
+            return self.all()
+
+        return self.none()
 
 
 class PurchaseRequest(models.Model):
@@ -33,55 +116,119 @@ class PurchaseRequest(models.Model):
     title = models.CharField(max_length=255)
     description = models.TextField()
     amount = models.DecimalField(max_digits=12, decimal_places=2)
+    currency = models.CharField(max_length=3, blank=True, help_text='ISO 4217 code of `amount`')
+    # `amount` in FX_BASE_CURRENCY at the rate of the creation date (see procurement.fx)
+    amount_base = models.DecimalField(max_digits=14, decimal_places=2, null=True, blank=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
 
     created_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='created_requests')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    DOCUMENT_FIELDS = ('proforma', 'purchase_order', 'receipt')
+    JSON_FIELDS = ('proforma_data', 'purchase_order_data', 'receipt_data', 'receipt_validation', 'duplicate_candidates')
+
     # Document fields
-    proforma = models.FileField(upload_to='proformas/', null=True, blank=True)
+    proforma = models.FileField(upload_to='proformas/', storage=document_storage, null=True, blank=True)
     proforma_data = models.JSONField(null=True, blank=True, help_text='Extracted data from proforma')
 
-    purchase_order = models.FileField(upload_to='purchase_orders/', null=True, blank=True)
+    purchase_order = models.FileField(upload_to='purchase_orders/', storage=document_storage, null=True, blank=True)
     purchase_order_data = models.JSONField(null=True, blank=True, help_text='Generated PO data')
 
-    receipt = models.FileField(upload_to='receipts/', null=True, blank=True)
+    receipt = models.FileField(upload_to='receipts/', storage=document_storage, null=True, blank=True)
     receipt_data = models.JSONField(null=True, blank=True, help_text='Extracted data from receipt')
     receipt_validation = models.JSONField(null=True, blank=True, help_text='Receipt validation results')
 
     rejection_reason = models.TextField(blank=True, null=True)
 
+    # Levels that must approve, decided by the routing rules on creation (see procurement.routing)
+    approval_levels = models.JSONField(default=list, blank=True)
+
+    # Approval deadline per level, and that of the level now due (see procurement.sla)
+    sla_deadlines = models.JSONField(default=dict, blank=True)
+    sla_due_at = models.DateTimeField(null=True, blank=True)
+    escalated_at = models.DateTimeField(null=True, blank=True)
+
+    # Vendors resolved from the extracted documents
+    proforma_vendor = models.ForeignKey(
+        Vendor, on_delete=models.SET_NULL, null=True, blank=True, related_name='proforma_requests'
+    )
+    receipt_vendor = models.ForeignKey(
+        Vendor, on_delete=models.SET_NULL, null=True, blank=True, related_name='receipt_requests'
+    )
+
+    # Earlier requests with near-identical documents (see procurement.duplicates)
+    duplicate_candidates = models.JSONField(default=list, blank=True, help_text='Likely duplicates, for approvers')
+
+    # Position in the change feed, stamped by the writing transaction (see procurement.sync)
+    change_seq = models.BigIntegerField(default=0, db_index=True, editable=False)
+
+    objects = PurchaseRequestQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.title} - {self.status}"
 
     def save(self, *args, **kwargs):
+        old_documents = []
         # Prevent status changes if already approved or rejected
         if self.pk:
             old_instance = PurchaseRequest.objects.get(pk=self.pk)
             if old_instance.status in ['approved', 'rejected'] and old_instance.status != self.status:
                 raise ValidationError("Cannot change status of approved or rejected requests")
+            old_documents = old_instance.document_names()
         super().save(*args, **kwargs)
+        update_blob_references(old_documents, self.document_names())
+        refresh_previews(old_documents, self.document_names())
+
+    def document_names(self):
+        return [getattr(self, field).name for field in self.DOCUMENT_FIELDS]
 
     def can_be_edited_by(self, user):
         return self.created_by == user and self.status == 'pending'
 
+    def routing_amount(self):
+        """The amount routing rules compare, in the base currency when it could be converted"""
+        return self.amount if self.amount_base is None else self.amount_base
+
     def get_required_approval_levels(self):
-        return ['approver-level-1', 'approver-level-2']
+        from .routing import DEFAULT_LEVELS
+        return self.approval_levels or list(DEFAULT_LEVELS)
 
     def check_approval_status(self):
+        from .sla import due_at
+
         required_levels = self.get_required_approval_levels()
-        approved_levels = self.approvals.filter(approved=True).values_list('approver__role', flat=True)
+        approved_levels = set(self.approvals.filter(approved=True).values_list('approver__role', flat=True))
 
         if all(level in approved_levels for level in required_levels):
             self.status = 'approved'
             self.save()
             return True
+
+        # The SLA clock moves on to the next level still to approve
+        next_due_at = due_at(self.sla_deadlines, approved_levels)
+        if next_due_at != self.sla_due_at:
+            self.sla_due_at = next_due_at
+            self.escalated_at = None
+            self.save(update_fields=['sla_due_at', 'escalated_at', 'updated_at'])
         return False
 
     class Meta:
         db_table = 'purchase_requests'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['-created_at'], name='request_created_desc'),
+            # Case-insensitive substring search (icontains) on title, as the admin does. On
+            # PostgreSQL this is a pg_trgm GIN index, and description has one too
+            # (request_description_trgm); elsewhere a plain index, which only serves prefixes.
+            # See migration 0021.
+            models.Index(Upper('title'), name='request_title_upper'),
+            # Overdue requests, and those still to escalate, are index range scans
+            models.Index(fields=['sla_due_at'], name='request_sla_due',
+                         condition=models.Q(status='pending')),
+            models.Index(fields=['sla_due_at'], name='request_sla_unescalated',
+                         condition=models.Q(status='pending', escalated_at__isnull=True)),
+        ]
 
 
 class Approval(models.Model):
@@ -90,6 +237,7 @@ class Approval(models.Model):
     approved = models.BooleanField(null=True, blank=True)
     comments = models.TextField(blank=True, null=True)
     approved_at = models.DateTimeField(null=True, blank=True)
+    change_seq = models.BigIntegerField(default=0, db_index=True, editable=False)
 
     class Meta:
         db_table = 'approvals'
@@ -99,3 +247,401 @@ class Approval(models.Model):
     def __str__(self):
         status = 'Approved' if self.approved else 'Rejected' if self.approved == False else 'Pending'
         return f"{self.purchase_request.title} - {self.approver.username} - {status}"
+
+
+class ExchangeRate(models.Model):
+    """Units of the base currency (FX_BASE_CURRENCY) per unit of `currency`, from `rate_date` on"""
+    currency = models.CharField(max_length=3)
+    rate_date = models.DateField()
+    rate = models.DecimalField(max_digits=20, decimal_places=10)
+    source = models.CharField(max_length=50, blank=True)
+
+    class Meta:
+        db_table = 'exchange_rates'
+        unique_together = ('currency', 'rate_date')
+        ordering = ['currency', 'rate_date']
+
+    def __str__(self):
+        return f"{self.currency} {self.rate_date}: {self.rate}"
+
+
+class ArchivedPurchaseRequestQuerySet(models.QuerySet):
+    def visible_to(self, user):
+        """PurchaseRequestQuerySet.visible_to for closed requests, which have no routes left"""
+        if user.role == 'staff':
+            return self.filter(created_by=user)
+        if user.role in ['approver-level-1', 'approver-level-2']:
+            return self.filter(pk__in=ArchivedApproval.objects.filter(approver=user).values('purchase_request_id'))
+        if user.role == 'finance':
+            return self.all()
+        return self.none()
+
+
+class ArchivedPurchaseRequest(models.Model):
+    """
+    A closed request moved out of purchase_requests by archive_requests (see
+    procurement.archive). Same columns and IDs as PurchaseRequest; read-only.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    title = models.CharField(max_length=255)
+    description = models.TextField()
+    amount = models.DecimalField(max_digits=12, decimal_places=2)
+    currency = models.CharField(max_length=3, blank=True)
+    amount_base = models.DecimalField(max_digits=14, decimal_places=2, null=True, blank=True)
+    status = models.CharField(max_length=20, choices=PurchaseRequest.STATUS_CHOICES)
+
+    created_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_requests')
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+
+    DOCUMENT_FIELDS = PurchaseRequest.DOCUMENT_FIELDS
+    JSON_FIELDS = PurchaseRequest.JSON_FIELDS
+
+    proforma = models.FileField(upload_to='proformas/', storage=document_storage, null=True, blank=True)
+    proforma_data = models.JSONField(null=True, blank=True)
+    purchase_order = models.FileField(upload_to='purchase_orders/', storage=document_storage, null=True, blank=True)
+    purchase_order_data = models.JSONField(null=True, blank=True)
+    receipt = models.FileField(upload_to='receipts/', storage=document_storage, null=True, blank=True)
+    receipt_data = models.JSONField(null=True, blank=True)
+    receipt_validation = models.JSONField(null=True, blank=True)
+    rejection_reason = models.TextField(blank=True, null=True)
+    approval_levels = models.JSONField(default=list, blank=True)
+    sla_deadlines = models.JSONField(default=dict, blank=True)
+    sla_due_at = models.DateTimeField(null=True, blank=True)
+    escalated_at = models.DateTimeField(null=True, blank=True)
+    proforma_vendor = models.ForeignKey(Vendor, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    receipt_vendor = models.ForeignKey(Vendor, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    duplicate_candidates = models.JSONField(default=list, blank=True)
+    change_seq = models.BigIntegerField(default=0, editable=False)
+
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    objects = ArchivedPurchaseRequestQuerySet.as_manager()
+
+    document_names = PurchaseRequest.document_names
+    get_required_approval_levels = PurchaseRequest.get_required_approval_levels
+
+    class Meta:
+        db_table = 'archived_purchase_requests'
+        ordering = ['-created_at']
+        indexes = [models.Index(fields=['-created_at'], name='archived_request_created_desc')]
+
+    def __str__(self):
+        return f"{self.title} - {self.status} (archived)"
+
+
+class ArchivedApproval(models.Model):
+    """An Approval of an archived request, with its original ID"""
+    id = models.BigIntegerField(primary_key=True)
+    purchase_request = models.ForeignKey(ArchivedPurchaseRequest, on_delete=models.CASCADE, related_name='approvals')
+    approver = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_approvals')
+    approved = models.BooleanField(null=True, blank=True)
+    comments = models.TextField(blank=True, null=True)
+    approved_at = models.DateTimeField(null=True, blank=True)
+    change_seq = models.BigIntegerField(default=0, editable=False)
+
+    class Meta:
+        db_table = 'archived_approvals'
+        ordering = ['approved_at']
+
+    def __str__(self):
+        return f"archived approval {self.pk} of request {self.purchase_request_id}"
+
+
+class RoutingRule(models.Model):
+    """
+    Which levels must approve a request, by amount and requester department.
+    Active rules are tried by priority; the first that matches decides.
+    """
+    LEVEL_CHOICES = (
+        ('approver-level-1', 'Approver Level 1'),
+        ('approver-level-2', 'Approver Level 2'),
+        ('finance', 'Finance'),
+    )
+
+    name = models.CharField(max_length=100)
+    priority = models.PositiveIntegerField(default=100, help_text='Lower numbers are tried first')
+    department = models.CharField(max_length=100, blank=True, help_text='Requester department; blank matches any')
+    min_amount = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True,
+                                     help_text='In the base currency; inclusive; blank for no lower bound')
+    max_amount = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True,
+                                     help_text='In the base currency; exclusive; blank for no upper bound')
+    levels = models.JSONField(help_text='Levels that must approve, e.g. ["approver-level-1", "finance"]')
+    same_department = models.BooleanField(default=False, help_text="Only approvers from the requester's department")
+    is_active = models.BooleanField(default=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'routing_rules'
+        ordering = ['priority', 'id']
+
+    def __str__(self):
+        return self.name
+
+    def clean(self):
+        valid = {level for level, _ in self.LEVEL_CHOICES}
+        if not isinstance(self.levels, list) or not self.levels or not set(self.levels) <= valid:
+            raise ValidationError({'levels': f"Must be a non-empty list of: {', '.join(sorted(valid))}"})
+        if self.min_amount is not None and self.max_amount is not None and self.min_amount >= self.max_amount:
+            raise ValidationError({'max_amount': 'Must be greater than the minimum amount'})
+
+
+class ApprovalRoute(models.Model):
+    """A pending request routed to an eligible approver; an approver's inbox is a lookup on this table"""
+    purchase_request = models.ForeignKey(PurchaseRequest, on_delete=models.CASCADE, related_name='routes')
+    approver = models.ForeignKey(User, on_delete=models.CASCADE, related_name='routed_requests')
+    level = models.CharField(max_length=20)
+
+    class Meta:
+        db_table = 'approval_routes'
+        unique_together = ('approver', 'purchase_request')
+
+    def __str__(self):
+        return f"request {self.purchase_request_id} -> {self.approver_id} ({self.level})"
+
+
+class DocumentSignature(models.Model):
+    """MinHash signature of the text of a request's proforma or receipt"""
+    KIND_CHOICES = (
+        ('proforma', 'Proforma'),
+        ('receipt', 'Receipt'),
+    )
+
+    # No constraint: signatures of archived requests stay in the index (see procurement.archive)
+    purchase_request = models.ForeignKey(PurchaseRequest, on_delete=models.DO_NOTHING, db_constraint=False,
+                                         related_name='document_signatures')
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    signature = models.BinaryField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'document_signatures'
+        unique_together = ('purchase_request', 'kind')
+
+    def __str__(self):
+        return f"{self.kind} of request {self.purchase_request_id}"
+
+
+class LSHBucket(models.Model):
+    """One band of a signature; documents sharing a bucket are duplicate candidates"""
+    bucket = models.BigIntegerField(db_index=True)
+    signature = models.ForeignKey(DocumentSignature, on_delete=models.CASCADE, related_name='buckets')
+
+    class Meta:
+        db_table = 'lsh_buckets'
+
+    def __str__(self):
+        return f"{self.bucket} -> {self.signature_id}"
+
+
+class DocumentBlob(models.Model):
+    """A unique stored document, shared by every request that uploaded the same bytes"""
+    digest = models.CharField(max_length=64, primary_key=True, help_text='SHA-256 of the content')
+    name = models.CharField(max_length=255)
+    size = models.BigIntegerField()
+    ref_count = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_uploaded_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        db_table = 'document_blobs'
+        indexes = [models.Index(fields=['ref_count', 'last_uploaded_at'])]
+
+    def __str__(self):
+        return f"{self.name} ({self.ref_count} refs)"
+
+
+class DocumentText(models.Model):
+    """Full extracted text of a stored document, compressed (see procurement.document_text)"""
+    digest = models.CharField(max_length=64, primary_key=True, help_text='SHA-256 of the document content')
+    compressed_text = models.BinaryField(help_text='zlib-compressed UTF-8 text')
+    page_offsets = models.JSONField(default=list, help_text='Character offset where each page starts')
+    char_count = models.PositiveIntegerField(default=0)
+    extractor = models.CharField(max_length=20, help_text='pdfplumber or tesseract')
+    extractor_version = models.PositiveSmallIntegerField()
+    extracted_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        db_table = 'document_texts'
+
+    def __str__(self):
+        return f"{self.digest[:12]} ({len(self.page_offsets)} pages, v{self.extractor_version})"
+
+    @property
+    def text(self):
+        return zlib.decompress(bytes(self.compressed_text)).decode()
+
+    def pages(self):
+        text = self.text
+        ends = self.page_offsets[1:] + [len(text)]
+        return [text[start:end] for start, end in zip(self.page_offsets, ends)]
+
+
+class ChangeSequence(models.Model):
+    """Named monotonic counters backing the change feed"""
+    name = models.CharField(max_length=50, primary_key=True)
+    value = models.BigIntegerField(default=0)
+
+    class Meta:
+        db_table = 'change_sequences'
+
+    def __str__(self):
+        return f"{self.name}={self.value}"
+
+
+class Tombstone(models.Model):
+    """
+    Marker left in the change feed for a deleted request or approval, one per
+    user who could see it. Also left when a user stops seeing a request.
+    """
+    MODEL_CHOICES = (
+        ('purchaserequest', 'Purchase Request'),
+        ('approval', 'Approval'),
+    )
+
+    model_name = models.CharField(max_length=20, choices=MODEL_CHOICES)
+    object_id = models.BigIntegerField()
+    owner_id = models.BigIntegerField(help_text='User the deletion is reported to')
+    change_seq = models.BigIntegerField(db_index=True)
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'tombstones'
+        ordering = ['change_seq']
+        indexes = [
+            models.Index(fields=['owner_id', 'change_seq'], name='tombstone_owner_seq'),
+        ]
+
+    def __str__(self):
+        return f"{self.model_name} {self.object_id} deleted at {self.change_seq}"
+
+
+class PushEvent(models.Model):
+    """Request status change streamed to subscribed clients (see procurement.events)"""
+    event_type = models.CharField(max_length=50)
+    purchase_request_id = models.BigIntegerField()
+
+    # Snapshot used to apply the visibility rules without touching the request
+    owner_id = models.BigIntegerField()
+    status = models.CharField(max_length=20)
+    reviewer_ids = models.JSONField(default=list)
+
+    data = models.JSONField(default=dict)
+    change_seq = models.BigIntegerField(db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        db_table = 'push_events'
+        ordering = ['change_seq', 'id']
+
+    def __str__(self):
+        return f"{self.event_type} - request {self.purchase_request_id}"
+
+
+class Notification(models.Model):
+    """
+    Outbox row for one notification to one user, written in the transaction
+    that caused it; dispatch_notifications sends them as per-user digests.
+    """
+    recipient = models.ForeignKey(User, on_delete=models.CASCADE, related_name='notifications')
+    event_type = models.CharField(max_length=50)
+    purchase_request_id = models.BigIntegerField()
+    data = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+
+    class Meta:
+        db_table = 'notifications'
+        indexes = [
+            # The dispatcher only ever reads the unsent rows
+            models.Index(fields=['recipient', 'created_at'], name='notification_unsent',
+                         condition=models.Q(sent_at__isnull=True)),
+        ]
+
+    def __str__(self):
+        return f"{self.event_type} - request {self.purchase_request_id} -> {self.recipient_id}"
+
+
+class AuditEvent(models.Model):
+    """
+    Append-only history of a purchase request (see procurement.audit). Keeps
+    plain IDs rather than foreign keys, so history outlives deleted rows and
+    the table can be partitioned.
+    """
+    purchase_request_id = models.BigIntegerField()
+    event_type = models.CharField(max_length=50)
+    actor_id = models.BigIntegerField(null=True, blank=True)
+    actor_username = models.CharField(max_length=150, blank=True)
+    status = models.CharField(max_length=20, help_text='Request status after the event')
+    data = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        db_table = 'audit_events'
+        ordering = ['created_at', 'id']
+        indexes = [
+            models.Index(fields=['purchase_request_id', 'created_at', 'id'], name='audit_request_history'),
+        ]
+
+    def __str__(self):
+        return f"{self.event_type} - request {self.purchase_request_id}"
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValidationError("Audit events cannot be changed")
+        super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        raise ValidationError("Audit events cannot be deleted")
+
+
+class RateLimitBucket(models.Model):
+    """Token bucket shared by every worker process (see procurement.throttles)"""
+    key = models.CharField(max_length=100, primary_key=True)
+    tokens = models.FloatField()
+    updated_at = models.DateTimeField()
+
+    class Meta:
+        db_table = 'rate_limit_buckets'
+
+    def __str__(self):
+        return f"{self.key}: {self.tokens:.2f}"
+
+
+class ExtractionSlot(models.Model):
+    """One of EXTRACTION_SLOTS leases capping concurrent document processing"""
+    slot = models.PositiveIntegerField(primary_key=True)
+    holder = models.CharField(max_length=64, blank=True, default='')
+    leased_until = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'extraction_slots'
+
+    def __str__(self):
+        return f"slot {self.slot}: {self.holder or 'free'}"
+
+
+class IdempotencyKey(models.Model):
+    """Outcome of a request sent with an Idempotency-Key header (see procurement.idempotency)"""
+    STATUS_CHOICES = (
+        ('in_progress', 'In progress'),
+        ('completed', 'Completed'),
+    )
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='idempotency_keys')
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64, help_text='Hash of the method, path and payload')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='in_progress')
+    response_status = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_data = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    object_id = models.BigIntegerField(null=True, blank=True, help_text='ID of the object a successful response described')
+    locked_at = models.DateTimeField(default=timezone.now)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        db_table = 'idempotency_keys'
+        unique_together = ('user', 'key')
+
+    def __str__(self):
+        return f"{self.user_id}:{self.key} ({self.status})"
@@ -0,0 +1,177 @@
+"""
+Email notifications.
+
+Views call `notify` inside the transaction that changed a request. It only
+inserts Notification rows (the outbox), so a rolled back change never
+notifies anyone and the request pays for one INSERT. dispatch_notifications
+sends them later: a user's unsent notifications wait until the oldest is
+NOTIFICATION_DIGEST_WINDOW seconds old, then go out together as one digest
+through the NOTIFICATION_TRANSPORT class.
+"""
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import F, Min
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from prometheus_client import Counter, Histogram
+
+logger = logging.getLogger(__name__)
+
+NOTIFICATIONS_SENT = Counter('notifications_sent_total', 'Notifications delivered in a digest', ['event_type'])
+DIGESTS_SENT = Counter('notification_digests_sent_total', 'Digest messages delivered')
+DIGEST_FAILURES = Counter('notification_digest_failures_total', 'Digest messages the transport failed to send')
+DISPATCH_BATCH_DURATION = Histogram(
+    'notification_dispatch_batch_seconds', 'Time to build and send one batch of digests',
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+
+MESSAGES = {
+    'request.created': 'New request awaiting your approval: "{title}" ({amount})',
+    'request.approved': 'Your request "{title}" was approved',
+    'request.rejected': 'Your request "{title}" was rejected',
+    'request.escalated': 'Request "{title}" is overdue for {level} approval',
+}
+
+
+def notify(purchase_request, event_type, **data):
+    """Queue `event_type` for whoever should hear about it, in the current transaction"""
+    from .models import ApprovalRoute, Notification
+
+    if event_type == 'request.created':
+        # Routes are written before this is called, in the same transaction
+        recipient_ids = ApprovalRoute.objects.filter(purchase_request=purchase_request).values_list(
+            'approver_id', flat=True
+        )
+    else:
+        recipient_ids = [purchase_request.created_by_id]
+    data = {'title': purchase_request.title, 'amount': str(purchase_request.amount), **data}
+    Notification.objects.bulk_create(
+        Notification(recipient_id=recipient_id, event_type=event_type,
+                     purchase_request_id=purchase_request.pk, data=data)
+        for recipient_id in recipient_ids
+    )
+
+
+class EmailTransport:
+    """Sends digests through Django's email backend, SMTP unless EMAIL_BACKEND says otherwise"""
+
+    def __enter__(self):
+        self.connection = get_connection()
+        self.connection.open()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.connection.close()
+
+    def send(self, address, subject, body):
+        EmailMessage(subject, body, to=[address], connection=self.connection).send()
+
+
+def get_transport():
+    return import_string(settings.NOTIFICATION_TRANSPORT)()
+
+
+def describe(notification):
+    line = MESSAGES.get(notification.event_type, '{title}: ' + notification.event_type).format(**notification.data)
+    if notification.data.get('reason'):
+        line += f": {notification.data['reason']}"
+    return line
+
+
+def render_digest(notifications):
+    """(subject, body) of one user's digest"""
+    lines = [describe(notification) for notification in notifications]
+    subject = lines[0] if len(lines) == 1 else f'{len(lines)} purchase request updates'
+    body = '\n'.join(f'- {line} (request #{notification.purchase_request_id})'
+                     for line, notification in zip(lines, notifications))
+    return subject, body + '\n'
+
+
+def _undelivered():
+    from .models import Notification
+
+    return Notification.objects.filter(sent_at__isnull=True, attempts__lt=settings.NOTIFICATION_MAX_ATTEMPTS)
+
+
+def due_recipients(window, limit, exclude=()):
+    """IDs of up to `limit` users whose oldest unsent notification is at least `window` seconds old"""
+    cutoff = timezone.now() - timedelta(seconds=window)
+    return list(
+        _undelivered().exclude(recipient_id__in=exclude).values('recipient_id').annotate(oldest=Min('created_at'))
+        .filter(oldest__lte=cutoff).order_by('oldest').values_list('recipient_id', flat=True)[:limit]
+    )
+
+
+def send_digests(recipient_ids, transport):
+    """
+    Send each of `recipient_ids` a digest of their unsent notifications.
+    Returns (digests sent, notifications sent, IDs of the recipients left
+    unsent because their digest failed or another dispatcher holds it).
+    """
+    from .models import Notification
+
+    started = time.perf_counter()
+    by_recipient = {}
+    with transaction.atomic():
+        # Parallel dispatchers skip the rows another one is sending
+        pending = (
+            _undelivered().filter(recipient_id__in=recipient_ids)
+            .select_for_update(skip_locked=True, of=('self',))
+            .select_related('recipient').order_by('recipient_id', 'created_at', 'id')
+        )
+        for notification in pending:
+            by_recipient.setdefault(notification.recipient, []).append(notification)
+
+        digests, delivered, failed = 0, [], []
+        left = set(recipient_ids) - {recipient.pk for recipient in by_recipient}
+        for recipient, notifications in by_recipient.items():
+            ids = [notification.pk for notification in notifications]
+            if not recipient.email or not recipient.is_active:
+                # Nowhere to send it; not worth retrying
+                delivered.extend(ids)
+                continue
+            subject, body = render_digest(notifications)
+            try:
+                transport.send(recipient.email, subject, body)
+            except Exception:
+                logger.exception("Error sending notification digest", extra={'user_id': recipient.pk})
+                DIGEST_FAILURES.inc()
+                failed.extend(ids)
+                left.add(recipient.pk)
+                continue
+            DIGESTS_SENT.inc()
+            digests += 1
+            for notification in notifications:
+                NOTIFICATIONS_SENT.labels(notification.event_type).inc()
+            delivered.extend(ids)
+
+        Notification.objects.filter(pk__in=delivered).update(sent_at=timezone.now(), attempts=F('attempts') + 1)
+        Notification.objects.filter(pk__in=failed).update(attempts=F('attempts') + 1)
+    DISPATCH_BATCH_DURATION.observe(time.perf_counter() - started)
+    return digests, len(delivered), left
+
+
+def dispatch(window=None, batch_size=100, transport=None):
+    """Send every digest that is due; returns (digests, notifications, recipients left unsent)"""
+    window = settings.NOTIFICATION_DIGEST_WINDOW if window is None else window
+    transport = transport or get_transport()
+    digests = notifications = 0
+    left = set()
+    recipient_ids = due_recipients(window, batch_size)
+    if not recipient_ids:
+        # Don't connect to the mail server for nothing
+        return 0, 0, 0
+    with transport:
+        while recipient_ids:
+            sent_digests, sent_notifications, unsent = send_digests(recipient_ids, transport)
+            digests += sent_digests
+            notifications += sent_notifications
+            # Users whose digest failed, or is being sent elsewhere, wait for the next run
+            left |= unsent
+            recipient_ids = due_recipients(window, batch_size, exclude=left)
+    return digests, notifications, len(left)
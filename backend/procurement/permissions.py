@@ -33,8 +33,8 @@ class CanApproveRequest(permissions.BasePermission):
         if not request.user.is_authenticated:
             return False
 
-        user_role = request.user.role
-        if user_role not in ['approver-level-1', 'approver-level-2']:
+        # Only the levels the request was routed to may act on it
+        if request.user.role not in obj.get_required_approval_levels():
             return False
 
         return obj.status == 'pending'
@@ -0,0 +1,136 @@
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+
+from .extraction import document_stack
+from .storage import blob_digest
+
+logger = logging.getLogger(__name__)
+
+
+PREVIEW_DIR = 'previews'
+PREVIEWABLE_EXTENSIONS = ('.pdf', '.jpg', '.jpeg', '.png')
+
+_executor = None
+# Jobs queued or running, as (func, name); bounded by PREVIEW_QUEUE_SIZE
+_pending = set()
+_pending_lock = threading.Lock()
+
+
+def preview_key(name):
+    """Cache key for the previews of stored file `name`, changes whenever the content does"""
+    # Content-addressed names already are one; older names are unique per upload
+    return blob_digest(name) or hashlib.sha256(name.encode()).hexdigest()
+
+
+def preview_dir(key):
+    return f"{PREVIEW_DIR}/{key[:2]}/{key}"
+
+
+def preview_name(key, size, page=1):
+    return f"{preview_dir(key)}/{size}-{page}.jpg"
+
+
+def is_previewable(name):
+    return bool(name) and os.path.splitext(name)[1].lower() in PREVIEWABLE_EXTENSIONS
+
+
+def render_pages(path, max_size):
+    """First PREVIEW_PAGES pages of a PDF or image as PIL images, large enough for `max_size`"""
+    stack = document_stack()
+    if path.lower().endswith('.pdf'):
+        with stack.pdfplumber.open(path) as pdf:
+            images = []
+            for page in pdf.pages[:settings.PREVIEW_PAGES]:
+                resolution = 72 * max_size / max(page.width, page.height)
+                images.append(page.to_image(resolution=resolution).original.convert('RGB'))
+            return images
+
+    with stack.Image.open(path) as image:
+        image = stack.ImageOps.exif_transpose(image)
+        return [image.convert('RGB')]
+
+
+def generate_previews(name):
+    """Write thumbnails of `name` at every PREVIEW_SIZES size"""
+    key = preview_key(name)
+    sizes = sorted(settings.PREVIEW_SIZES, reverse=True)
+    if all(default_storage.exists(preview_name(key, size)) for size in sizes):
+        return
+
+    pages = render_pages(default_storage.path(name), sizes[0])
+    for page_number, image in enumerate(pages, start=1):
+        for size in sizes:
+            # Each pass shrinks the previous, larger thumbnail
+            image.thumbnail((size, size))
+            path = default_storage.path(preview_name(key, size, page_number))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), suffix='.jpg', delete=False) as tmp:
+                image.save(tmp, 'JPEG', quality=80, optimize=True)
+            os.replace(tmp.name, path)
+
+
+def evict_previews(name):
+    """Delete the cached thumbnails of `name`"""
+    shutil.rmtree(default_storage.path(preview_dir(preview_key(name))), ignore_errors=True)
+
+
+def _run_safely(func, name):
+    try:
+        func(name)
+    except Exception as e:
+        logger.warning("Error updating previews: %s", e, extra={'file': name})
+    finally:
+        with _pending_lock:
+            _pending.discard((func, name))
+
+
+def _submit(func, name):
+    """Queue `func(name)` in the background pool; returns False if it was dropped"""
+    global _executor
+    with _pending_lock:
+        if (func, name) in _pending:
+            # Clients polling a missing preview would otherwise queue it again on every request
+            return True
+        if len(_pending) >= settings.PREVIEW_QUEUE_SIZE:
+            # A dropped render is scheduled again the next time the preview is asked for, and
+            # a dropped eviction is redone by gc_document_blobs when it deletes the blob
+            logger.warning("Preview queue full, dropping job", extra={'file': name})
+            return False
+        _pending.add((func, name))
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.PREVIEW_WORKERS, thread_name_prefix='previews')
+    _executor.submit(_run_safely, func, name)
+    return True
+
+
+def schedule_previews(name):
+    """Render the previews of `name` in the background pool"""
+    return _submit(generate_previews, name)
+
+
+def refresh_previews(old_names, new_names):
+    """
+    Once the transaction commits, render previews for newly attached documents
+    in the background and evict those of documents no longer referenced.
+    """
+    from .models import DocumentBlob
+
+    added = [name for name in set(new_names) - set(old_names) if is_previewable(name)]
+    removed = [name for name in set(old_names) - set(new_names) if is_previewable(name)]
+    for name in removed:
+        digest = blob_digest(name)
+        # A deduplicated blob may still be attached to other requests
+        if digest and DocumentBlob.objects.filter(digest=digest, ref_count__gt=0).exists():
+            continue
+        transaction.on_commit(lambda name=name: _submit(evict_previews, name))
+    for name in added:
+        transaction.on_commit(lambda name=name: schedule_previews(name))
@@ -0,0 +1,196 @@
+"""
+Approval routing.
+
+RoutingRule rows decide which levels must approve a request, by amount and
+requester department. They are compiled into a DecisionTable: per
+department, the sorted amount breakpoints of every rule that can apply,
+with the winning rule of each interval between them, so routing a request
+is a dict lookup and a bisect. Each process keeps its compiled table and
+checks the `routing_rules` counter, bumped whenever a rule changes, at most
+every ROUTING_RULES_RECHECK seconds.
+
+The eligible approvers of a pending request are written to ApprovalRoute,
+which approvers' inboxes read directly. Routes are dropped once the
+request is approved or rejected; approvers keep seeing requests they
+reviewed through their Approval rows.
+"""
+import logging
+import threading
+import time
+from bisect import bisect_right
+from collections import namedtuple
+
+from django.conf import settings
+from django.db.models import F
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_LEVELS = ('approver-level-1', 'approver-level-2')
+VERSION_COUNTER = 'routing_rules'
+
+Decision = namedtuple('Decision', 'levels same_department rule_id')
+DEFAULT_DECISION = Decision(DEFAULT_LEVELS, False, None)
+
+
+class DecisionTable:
+    def __init__(self, rules):
+        """`rules` in priority order"""
+        decisions = [
+            (rule.department, rule.min_amount, rule.max_amount,
+             Decision(tuple(rule.levels), rule.same_department, rule.id))
+            for rule in rules
+        ]
+        departments = {department for department, *_ in decisions if department}
+        self.default = self.compile([rule for rule in decisions if not rule[0]])
+        self.by_department = {
+            department: self.compile([rule for rule in decisions if rule[0] in ('', department)])
+            for department in departments
+        }
+
+    @staticmethod
+    def compile(rules):
+        """(breakpoints, decision per interval) for rules that all apply to one department"""
+        bounds = sorted({bound for _, low, high, _ in rules for bound in (low, high) if bound is not None})
+        decisions = []
+        for start, end in zip([None] + bounds, bounds + [None]):
+            # Intervals never straddle a bound, so a rule covers all of one or none of it
+            decisions.append(next(
+                (decision for _, low, high, decision in rules
+                 if (low is None or (start is not None and start >= low))
+                 and (high is None or (end is not None and end <= high))),
+                DEFAULT_DECISION,
+            ))
+        return bounds, decisions
+
+    def decide(self, department, amount):
+        bounds, decisions = self.by_department.get(department or '', self.default)
+        return decisions[bisect_right(bounds, amount)]
+
+
+_lock = threading.Lock()
+_table = None
+_version = None
+_checked_at = 0.0
+
+
+def decision_table():
+    """The compiled routing rules, rebuilt when another process or thread changed them"""
+    from .models import ChangeSequence, RoutingRule
+
+    global _table, _version, _checked_at
+    if _table is not None and time.monotonic() - _checked_at < settings.ROUTING_RULES_RECHECK:
+        return _table
+    with _lock:
+        version = ChangeSequence.objects.filter(pk=VERSION_COUNTER).values_list('value', flat=True).first() or 0
+        if _table is None or version != _version:
+            _table = DecisionTable(RoutingRule.objects.filter(is_active=True).order_by('priority', 'id'))
+            _version = version
+        _checked_at = time.monotonic()
+    return _table
+
+
+def rules_changed():
+    """Make every process recompile its routing table"""
+    from .models import ChangeSequence
+
+    global _checked_at
+    if not ChangeSequence.objects.filter(pk=VERSION_COUNTER).update(value=F('value') + 1):
+        ChangeSequence.objects.get_or_create(pk=VERSION_COUNTER, defaults={'value': 1})
+    _checked_at = 0.0
+
+
+def decide(department, amount):
+    return decision_table().decide(department, amount)
+
+
+def eligible_approvers(decision, department, cache=None):
+    """[(user id, level)] of active users who may approve under `decision`"""
+    from .models import User
+
+    key = (decision.levels, department if decision.same_department else None)
+    if cache is not None and key in cache:
+        return cache[key]
+    approvers = User.objects.filter(role__in=decision.levels, is_active=True)
+    if decision.same_department:
+        approvers = approvers.filter(department=department)
+    result = list(approvers.values_list('id', 'role'))
+    if cache is not None:
+        cache[key] = result
+    return result
+
+
+def routed_approvers(request_ids):
+    """{request id: set of routed approver IDs}"""
+    from .models import ApprovalRoute
+
+    routed = {}
+    for request_id, approver_id in ApprovalRoute.objects.filter(
+            purchase_request_id__in=request_ids).values_list('purchase_request_id', 'approver_id'):
+        routed.setdefault(request_id, set()).add(approver_id)
+    return routed
+
+
+def revoke_unrouted(before, after):
+    """
+    Leave a change feed tombstone for the approvers routed in `before` but not
+    in `after` (both {request id: approver IDs}) who never reviewed the request,
+    since they no longer see it.
+    """
+    from .models import Approval
+    from .sync import mark_revoked
+
+    lost = {request_id: approver_ids - after.get(request_id, set()) for request_id, approver_ids in before.items()}
+    lost = {request_id: approver_ids for request_id, approver_ids in lost.items() if approver_ids}
+    if not lost:
+        return
+    for request_id, approver_id in Approval.objects.filter(
+            purchase_request_id__in=lost).values_list('purchase_request_id', 'approver_id'):
+        lost[request_id].discard(approver_id)
+    mark_revoked(lost)
+
+
+def write_routes(purchase_request, decision):
+    """Replace the routes of a pending request with the approvers eligible under `decision`"""
+    from .models import ApprovalRoute
+
+    before = routed_approvers([purchase_request.pk])
+    ApprovalRoute.objects.filter(purchase_request=purchase_request).delete()
+    approvers = eligible_approvers(decision, purchase_request.created_by.department)
+    if not approvers:
+        logger.warning("No eligible approvers", extra={'request_id': purchase_request.pk, 'rule_id': decision.rule_id})
+    ApprovalRoute.objects.bulk_create(
+        ApprovalRoute(purchase_request=purchase_request, approver_id=approver_id, level=level)
+        for approver_id, level in approvers
+    )
+    revoke_unrouted(before, {purchase_request.pk: {approver_id for approver_id, _ in approvers}})
+
+
+def clear_routes(purchase_request):
+    """A decided request leaves every inbox"""
+    from .models import ApprovalRoute
+
+    revoke_unrouted(routed_approvers([purchase_request.pk]), {})
+    ApprovalRoute.objects.filter(purchase_request=purchase_request).delete()
+
+
+def route_requests(requests, departments):
+    """
+    Route many requests at once, e.g. ones about to be bulk-created.
+    `departments` maps creator IDs to departments. Sets approval_levels on
+    each request (the caller saves them) and returns the ApprovalRoute rows
+    of the pending ones, to insert once the requests have primary keys.
+    """
+    from .models import ApprovalRoute
+
+    table, cache, routes = decision_table(), {}, []
+    for purchase_request in requests:
+        department = departments.get(purchase_request.created_by_id)
+        decision = table.decide(department, purchase_request.routing_amount())
+        purchase_request.approval_levels = list(decision.levels)
+        if purchase_request.status == 'pending':
+            routes.extend(
+                ApprovalRoute(purchase_request=purchase_request, approver_id=approver_id, level=level)
+                for approver_id, level in eligible_approvers(decision, department, cache)
+            )
+    return routes
@@ -1,5 +1,17 @@
+import operator
+from decimal import Decimal
+
+from django.db import models
+from django.utils import timezone
 from rest_framework import serializers
-from .models import User, PurchaseRequest, Approval
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from . import fx
+from .authentication import add_user_claims
+from .downloads import document_url
+from .metrics import timed, timed_function
+from .models import User, PurchaseRequest, Approval, AuditEvent
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -38,33 +50,173 @@ class ApprovalSerializer(serializers.ModelSerializer):
         read_only_fields = ('id', 'purchase_request', 'approved_at')
 
 
+class DocumentField(serializers.FileField):
+    """File field represented by a short-lived signed download URL"""
+
+    def to_representation(self, value):
+        return document_url(value, self.context.get('request'))
+
+
 class PurchaseRequestSerializer(serializers.ModelSerializer):
     created_by = UserSerializer(read_only=True)
     approvals = ApprovalSerializer(many=True, read_only=True)
     created_by_name = serializers.CharField(source='created_by.get_full_name', read_only=True)
+    proforma = DocumentField(required=False, allow_null=True)
+    purchase_order = DocumentField(read_only=True)
+    receipt = DocumentField(required=False, allow_null=True)
+    approval_levels = serializers.ListField(source='get_required_approval_levels', child=serializers.CharField(),
+                                            read_only=True)
 
     class Meta:
         model = PurchaseRequest
         fields = (
-            'id', 'title', 'description', 'amount', 'status',
+            'id', 'title', 'description', 'amount', 'currency', 'amount_base', 'status',
             'created_by', 'created_by_name', 'created_at', 'updated_at',
-            'proforma', 'proforma_data',
+            'proforma', 'proforma_data', 'proforma_vendor',
             'purchase_order', 'purchase_order_data',
-            'receipt', 'receipt_data', 'receipt_validation',
-            'rejection_reason', 'approvals'
+            'receipt', 'receipt_data', 'receipt_vendor', 'receipt_validation',
+            'rejection_reason', 'duplicate_candidates', 'approval_levels', 'sla_due_at', 'approvals'
         )
-        read_only_fields = ('id', 'status', 'created_at', 'updated_at', 'purchase_order',
-                           'purchase_order_data', 'receipt_data', 'receipt_validation')
+        read_only_fields = ('id', 'amount_base', 'status', 'created_at', 'updated_at', 'purchase_order',
+                           'purchase_order_data', 'receipt_data', 'receipt_validation',
+                           'proforma_vendor', 'receipt_vendor', 'duplicate_candidates', 'sla_due_at')
 
     def create(self, validated_data):
         validated_data['created_by'] = self.context['request'].user
         return super().create(validated_data)
 
 
+def _represent_datetime(value):
+    # Mirrors DateTimeField.to_representation with the default ISO 8601 format
+    if not value:
+        return None
+    if timezone.is_aware(value):
+        value = timezone.localtime(value)
+    value = value.isoformat()
+    if value.endswith('+00:00'):
+        value = value[:-6] + 'Z'
+    return value
+
+
+_AMOUNT_QUANTUM = Decimal(1).scaleb(-PurchaseRequest._meta.get_field('amount').decimal_places)
+
+
+def _represent_amount(value):
+    # Mirrors DecimalField.to_representation; None like the serializer's null
+    if value is None:
+        return None
+    if not isinstance(value, Decimal):
+        value = Decimal(str(value).strip())
+    return '{:f}'.format(value.quantize(_AMOUNT_QUANTUM))
+
+
+_user_values = operator.attrgetter(*UserSerializer.Meta.fields)
+_user_keys = UserSerializer.Meta.fields
+
+
+def represent_user(user, cache=None):
+    """Build the UserSerializer payload, reusing dicts for users already seen"""
+    if cache is not None and user.pk in cache:
+        return cache[user.pk]
+    data = dict(zip(_user_keys, _user_values(user)))
+    if cache is not None:
+        cache[user.pk] = data
+    return data
+
+
+def represent_approval(approval, users=None):
+    """Build the ApprovalSerializer payload from an approval with its approver loaded"""
+    approver = approval.approver
+    return {
+        'id': approval.id,
+        'purchase_request': approval.purchase_request_id,
+        'approver': represent_user(approver, users),
+        'approver_name': approver.get_full_name(),
+        'approved': approval.approved,
+        'comments': approval.comments,
+        'approved_at': _represent_datetime(approval.approved_at),
+    }
+
+
+def represent_purchase_request(purchase_request, request=None, users=None):
+    """
+    Build the PurchaseRequestSerializer payload without DRF field machinery.
+
+    Expects `created_by` and `approvals__approver` to be loaded already
+    (see PurchaseRequestViewSet.get_queryset), otherwise each access queries.
+    """
+    if users is None:
+        users = {}
+    created_by = purchase_request.created_by
+    return {
+        'id': purchase_request.id,
+        'title': purchase_request.title,
+        'description': purchase_request.description,
+        'amount': _represent_amount(purchase_request.amount),
+        'currency': purchase_request.currency,
+        'amount_base': _represent_amount(purchase_request.amount_base),
+        'status': purchase_request.status,
+        'created_by': represent_user(created_by, users),
+        'created_by_name': created_by.get_full_name(),
+        'created_at': _represent_datetime(purchase_request.created_at),
+        'updated_at': _represent_datetime(purchase_request.updated_at),
+        'proforma': document_url(purchase_request.proforma, request),
+        'proforma_data': purchase_request.proforma_data,
+        'proforma_vendor': purchase_request.proforma_vendor_id,
+        'purchase_order': document_url(purchase_request.purchase_order, request),
+        'purchase_order_data': purchase_request.purchase_order_data,
+        'receipt': document_url(purchase_request.receipt, request),
+        'receipt_data': purchase_request.receipt_data,
+        'receipt_vendor': purchase_request.receipt_vendor_id,
+        'receipt_validation': purchase_request.receipt_validation,
+        'rejection_reason': purchase_request.rejection_reason,
+        'duplicate_candidates': purchase_request.duplicate_candidates,
+        'approval_levels': purchase_request.get_required_approval_levels(),
+        'sla_due_at': _represent_datetime(purchase_request.sla_due_at),
+        'approvals': [represent_approval(approval, users) for approval in purchase_request.approvals.all()],
+    }
+
+
+class PurchaseRequestReadListSerializer(serializers.ListSerializer):
+    @timed_function('serialization')
+    def to_representation(self, data):
+        iterable = data.all() if isinstance(data, models.manager.BaseManager) else data
+        request = self.context.get('request')
+        users = {}
+        return [represent_purchase_request(item, request, users) for item in iterable]
+
+
+class PurchaseRequestReadSerializer(PurchaseRequestSerializer):
+    """
+    Read-only fast path for PurchaseRequestSerializer.
+
+    Produces the same payload, but builds plain dicts from prefetched data
+    instead of walking the nested serializer fields row by row.
+    """
+
+    class Meta(PurchaseRequestSerializer.Meta):
+        list_serializer_class = PurchaseRequestReadListSerializer
+
+    def to_representation(self, instance):
+        with timed('serialization'):
+            return represent_purchase_request(instance, self.context.get('request'))
+
+
+def validate_currency(value):
+    value = value.upper()
+    if value and not fx.has_rates(value):
+        raise serializers.ValidationError(f"No exchange rates for {value}")
+    return value
+
+
 class PurchaseRequestCreateSerializer(serializers.ModelSerializer):
+    proforma = DocumentField(required=False, allow_null=True)
+    currency = serializers.CharField(max_length=3, required=False, allow_blank=True, validators=[validate_currency])
+
     class Meta:
         model = PurchaseRequest
-        fields = ('title', 'description', 'amount', 'proforma')
+        fields = ('id', 'title', 'description', 'amount', 'currency', 'proforma')
+        read_only_fields = ('id',)
 
     def create(self, validated_data):
         validated_data['created_by'] = self.context['request'].user
@@ -72,9 +224,12 @@ class PurchaseRequestCreateSerializer(serializers.ModelSerializer):
 
 
 class PurchaseRequestUpdateSerializer(serializers.ModelSerializer):
+    proforma = DocumentField(required=False, allow_null=True)
+    currency = serializers.CharField(max_length=3, required=False, allow_blank=True, validators=[validate_currency])
+
     class Meta:
         model = PurchaseRequest
-        fields = ('title', 'description', 'amount', 'proforma')
+        fields = ('title', 'description', 'amount', 'currency', 'proforma')
 
     def validate(self, attrs):
         if self.instance.status != 'pending':
@@ -84,6 +239,13 @@ class PurchaseRequestUpdateSerializer(serializers.ModelSerializer):
         return attrs
 
 
+class AuditEventSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = AuditEvent
+        fields = ('id', 'event_type', 'actor_id', 'actor_username', 'status', 'data', 'created_at')
+        read_only_fields = fields
+
+
 class ApprovalActionSerializer(serializers.Serializer):
     approved = serializers.BooleanField(required=True)
     comments = serializers.CharField(required=False, allow_blank=True)
@@ -91,3 +253,26 @@ class ApprovalActionSerializer(serializers.Serializer):
 
 class ReceiptSubmissionSerializer(serializers.Serializer):
     receipt = serializers.FileField(required=True)
+
+
+class RoleTokenObtainPairSerializer(TokenObtainPairSerializer):
+    @classmethod
+    def get_token(cls, user):
+        return add_user_claims(super().get_token(user), user)
+
+
+class RoleTokenRefreshSerializer(TokenRefreshSerializer):
+    """Refresh that re-reads the user, so new access tokens carry their current role and version"""
+
+    def validate(self, attrs):
+        data = super().validate(attrs)
+        refresh = self.token_class(attrs['refresh'])
+        user = User.objects.filter(
+            pk=refresh[api_settings.USER_ID_CLAIM], is_active=True
+        ).only('id', 'role', 'token_version').first()
+        if user is None:
+            raise AuthenticationFailed("User not found or inactive", code="user_not_found")
+
+        access = add_user_claims(refresh.access_token, user)
+        data['access'] = str(access)
+        return data
@@ -0,0 +1,58 @@
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
+from django.dispatch import receiver
+
+from .authentication import user_cache
+from . import routing
+from .models import User, PurchaseRequest, Approval, ApprovalRoute, DocumentSignature, RoutingRule
+from .previews import refresh_previews
+from .storage import update_blob_references
+from .sync import mark_changed, mark_deleted, stamp
+
+
+@receiver(pre_save, sender=PurchaseRequest)
+@receiver(pre_save, sender=Approval)
+def stamp_change(sender, instance, **kwargs):
+    stamp(instance)
+
+
+@receiver(post_save, sender=PurchaseRequest)
+@receiver(post_save, sender=Approval)
+def record_change(sender, instance, update_fields=None, **kwargs):
+    mark_changed(instance, update_fields)
+
+
+@receiver(pre_delete, sender=PurchaseRequest)
+def collect_request_viewers(sender, instance, **kwargs):
+    # Routes and approvals are gone by post_delete
+    instance._viewer_ids = {instance.created_by_id}.union(
+        ApprovalRoute.objects.filter(purchase_request=instance).values_list('approver_id', flat=True),
+        Approval.objects.filter(purchase_request=instance).values_list('approver_id', flat=True),
+    )
+
+
+@receiver(post_delete, sender=PurchaseRequest)
+def record_purchase_request_deletion(sender, instance, **kwargs):
+    mark_deleted(instance, getattr(instance, '_viewer_ids', {instance.created_by_id}))
+    update_blob_references(instance.document_names(), [])
+    refresh_previews(instance.document_names(), [])
+    # Not cascaded by the database, so archived requests keep theirs
+    DocumentSignature.objects.filter(purchase_request_id=instance.pk).delete()
+
+
+@receiver(post_delete, sender=Approval)
+def record_approval_deletion(sender, instance, **kwargs):
+    owner_id = PurchaseRequest.objects.filter(pk=instance.purchase_request_id).values_list(
+        'created_by_id', flat=True
+    ).first()
+    mark_deleted(instance, {owner_id or 0, instance.approver_id})
+
+
+@receiver(post_save, sender=RoutingRule)
+@receiver(post_delete, sender=RoutingRule)
+def recompile_routing_rules(sender, instance, **kwargs):
+    routing.rules_changed()
+
+
+@receiver(post_save, sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    user_cache.invalidate(instance.pk)
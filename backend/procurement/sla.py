@@ -0,0 +1,118 @@
+"""
+Approval deadlines.
+
+When a request is routed, each of its approval levels gets a deadline,
+APPROVAL_SLA_HOURS after the previous one (the first counts from
+creation), kept in `sla_deadlines`. `sla_due_at` holds the deadline of the
+first level still to approve and moves on as levels approve; a partial
+index on it, over pending requests only, makes "what is overdue" an index
+range scan.
+
+escalate_overdue picks up pending requests past `sla_due_at` that were not
+escalated yet, notifies the overdue level's approvers and the
+SLA_ESCALATION_ROLE users through the notification outbox, and stamps
+`escalated_at` (cleared when the next level's deadline starts).
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+
+def schedule(levels, start):
+    """{level: ISO deadline} for approving `levels` in order from `start`"""
+    deadlines, due = {}, start
+    for level in levels:
+        due += timedelta(hours=settings.APPROVAL_SLA_HOURS.get(level, settings.APPROVAL_SLA_DEFAULT_HOURS))
+        deadlines[level] = due.isoformat()
+    return deadlines
+
+
+def due_at(deadlines, approved_levels):
+    """Deadline of the first level in `deadlines` not in `approved_levels`, or None"""
+    pending = [parse_datetime(due) for level, due in (deadlines or {}).items() if level not in approved_levels]
+    return min(pending) if pending else None
+
+
+def current_level(purchase_request):
+    """The level whose deadline `sla_due_at` is"""
+    for level, due in (purchase_request.sla_deadlines or {}).items():
+        if parse_datetime(due) == purchase_request.sla_due_at:
+            return level
+    return None
+
+
+def apply(purchase_request, approved_levels=(), start=None):
+    """Set the deadlines of a request from its approval levels (in memory; the caller saves)"""
+    purchase_request.sla_deadlines = schedule(
+        purchase_request.get_required_approval_levels(), start or purchase_request.created_at or timezone.now()
+    )
+    previous_due_at = purchase_request.sla_due_at
+    purchase_request.sla_due_at = due_at(purchase_request.sla_deadlines, approved_levels)
+    if purchase_request.sla_due_at != previous_due_at:
+        purchase_request.escalated_at = None
+
+
+def apply_many(requests):
+    """apply() for many requests, e.g. freshly re-routed ones, reading their approvals in one query"""
+    from .models import Approval
+
+    approved = {}
+    rows = Approval.objects.filter(purchase_request__in=[request for request in requests if request.pk],
+                                   approved=True).values_list('purchase_request_id', 'approver__role')
+    for request_id, role in rows:
+        approved.setdefault(request_id, set()).add(role)
+    for purchase_request in requests:
+        if purchase_request.status == 'pending':
+            apply(purchase_request, approved.get(purchase_request.pk, ()))
+
+
+def overdue(queryset=None, now=None):
+    """Pending requests past their current deadline"""
+    from .models import PurchaseRequest
+
+    queryset = PurchaseRequest.objects.all() if queryset is None else queryset
+    return queryset.filter(status='pending', sla_due_at__lt=now or timezone.now())
+
+
+def escalate_batch(batch_size, now=None):
+    """Escalate up to `batch_size` overdue requests not escalated yet; returns how many were"""
+    from . import audit
+    from .models import ApprovalRoute, Notification, PurchaseRequest, User
+
+    now = now or timezone.now()
+    with transaction.atomic():
+        # Parallel scanners skip the requests another one is escalating
+        requests = list(
+            overdue(PurchaseRequest.objects.filter(escalated_at__isnull=True), now)
+            .select_for_update(skip_locked=True).order_by('sla_due_at')
+            .only('pk', 'title', 'amount', 'status', 'created_by', 'sla_deadlines', 'sla_due_at')[:batch_size]
+        )
+        if not requests:
+            return 0
+
+        routed = {}
+        for request_id, approver_id, level in ApprovalRoute.objects.filter(
+                purchase_request__in=requests).values_list('purchase_request_id', 'approver_id', 'level'):
+            routed.setdefault((request_id, level), []).append(approver_id)
+        escalation_ids = list(User.objects.filter(role=settings.SLA_ESCALATION_ROLE, is_active=True)
+                              .values_list('id', flat=True))
+
+        notifications = []
+        for purchase_request in requests:
+            level = current_level(purchase_request)
+            data = {'title': purchase_request.title, 'amount': str(purchase_request.amount), 'level': level,
+                    'due_at': purchase_request.sla_due_at.isoformat()}
+            recipients = dict.fromkeys(routed.get((purchase_request.pk, level), []) + escalation_ids)
+            notifications.extend(
+                Notification(recipient_id=recipient_id, event_type='request.escalated',
+                             purchase_request_id=purchase_request.pk, data=data)
+                for recipient_id in recipients
+            )
+            audit.record(purchase_request, 'request.escalated', level=level, due_at=purchase_request.sla_due_at)
+        Notification.objects.bulk_create(notifications)
+        # escalated_at isn't part of the synced representation, so no change_seq stamp
+        PurchaseRequest.objects.filter(pk__in=[request.pk for request in requests]).update(escalated_at=now)
+    return len(requests)
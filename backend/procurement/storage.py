@@ -0,0 +1,102 @@
+import hashlib
+import os
+import tempfile
+from collections import Counter
+
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+
+BLOB_DIR = 'blobs'
+BLOB_TMP_DIR = os.path.join(BLOB_DIR, 'tmp')
+_CHUNK_SIZE = 64 * 1024
+
+
+def blob_name(digest, extension):
+    return f"{BLOB_DIR}/{digest[:2]}/{digest[2:4]}/{digest}{extension}"
+
+
+def blob_digest(name):
+    """Digest of a content-addressed file name, or None for other names"""
+    if not name or not name.startswith(BLOB_DIR + '/'):
+        return None
+    digest = os.path.splitext(os.path.basename(name))[0]
+    return digest if len(digest) == 64 else None
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    File storage that keeps one copy of each distinct upload.
+
+    Content is hashed while it is streamed to a temporary file, which is then
+    moved to a name derived from its SHA-256 digest (the extension is kept,
+    extraction dispatches on it). Uploading the same bytes again returns the
+    existing name. Files are never deleted here; see gc_document_blobs.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        # The final name comes from the content, collisions are the point
+        return name
+
+    def _save(self, name, content):
+        from .models import DocumentBlob
+
+        tmp_dir = self.path(BLOB_TMP_DIR)
+        os.makedirs(tmp_dir, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        with tempfile.NamedTemporaryFile(dir=tmp_dir, delete=False) as tmp:
+            if hasattr(content, 'seek'):
+                content.seek(0)
+            for chunk in content.chunks(_CHUNK_SIZE):
+                if isinstance(chunk, str):
+                    chunk = chunk.encode()
+                digest.update(chunk)
+                tmp.write(chunk)
+                size += len(chunk)
+
+        final_name = blob_name(digest.hexdigest(), os.path.splitext(name)[1].lower())
+        full_path = self.path(final_name)
+        # gc_document_blobs deletes a blob's file under the same row lock, so
+        # the file is either still there or was deleted together with the row
+        with transaction.atomic():
+            blob = DocumentBlob.objects.select_for_update().filter(digest=digest.hexdigest()).first()
+            if blob is None:
+                # A concurrent upload of the same bytes may get there first
+                DocumentBlob.objects.bulk_create(
+                    [DocumentBlob(digest=digest.hexdigest(), name=final_name, size=size)], ignore_conflicts=True
+                )
+            else:
+                # Tell the garbage collector this blob is in use again
+                DocumentBlob.objects.filter(pk=blob.pk).update(last_uploaded_at=timezone.now())
+
+            if os.path.exists(full_path):
+                os.remove(tmp.name)
+                os.utime(full_path)
+            else:
+                # New, or lost: the row outlived its file
+                os.makedirs(os.path.dirname(full_path), exist_ok=True)
+                if self.file_permissions_mode is not None:
+                    os.chmod(tmp.name, self.file_permissions_mode)
+                os.replace(tmp.name, full_path)
+        return final_name
+
+
+def document_storage():
+    return ContentAddressedStorage()
+
+
+def update_blob_references(old_names, new_names):
+    """Move blob reference counts from the documents in `old_names` to those in `new_names`"""
+    from .models import DocumentBlob
+
+    delta = Counter(filter(None, map(blob_digest, new_names)))
+    delta.subtract(filter(None, map(blob_digest, old_names)))
+    by_change = {}
+    for digest, change in delta.items():
+        if change:
+            by_change.setdefault(change, []).append(digest)
+    for change, digests in by_change.items():
+        DocumentBlob.objects.filter(digest__in=digests).update(ref_count=F('ref_count') + change)
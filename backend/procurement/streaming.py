@@ -0,0 +1,185 @@
+import asyncio
+import time
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core import signing
+from django.db import close_old_connections
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings
+
+from .authentication import VERSION_CLAIM, CachedJWTAuthentication
+from .events import broker, fetch_events, is_visible, format_event, parse_event_cursor
+
+
+EVENT_STREAM_PATH = '/api/events/stream/'
+
+_ticket_signer = signing.TimestampSigner(salt='procurement.streaming')
+
+
+def issue_ticket(user, validated_token=None):
+    """
+    Short-lived ticket that opens one event stream for `user`.
+
+    EventSource can't send an Authorization header, and an access token in
+    the URL would end up in access logs; the ticket only opens streams, for
+    PUSH_EVENTS_TICKET_MAX_AGE seconds. Streams opened with it still end
+    when the access token it was issued for expires.
+    """
+    if validated_token is not None:
+        expires = validated_token['exp']
+    else:
+        expires = time.time() + api_settings.ACCESS_TOKEN_LIFETIME.total_seconds()
+    return _ticket_signer.sign_object({'u': user.pk, 'v': user.token_version, 'e': expires})
+
+
+def stream_claims(scope):
+    """
+    Claims of the Authorization header's access token, or of the ?ticket=
+    query parameter: the user ID, token version and expiry. None if neither
+    is valid.
+    """
+    for name, value in scope.get('headers', []):
+        if name == b'authorization':
+            parts = value.decode('latin1').split()
+            if len(parts) == 2 and parts[0] in settings.SIMPLE_JWT['AUTH_HEADER_TYPES']:
+                try:
+                    return CachedJWTAuthentication().get_validated_token(parts[1]).payload
+                except (InvalidToken, TokenError):
+                    return None
+    ticket = parse_qs(scope.get('query_string', b'').decode('latin1')).get('ticket', [None])[0]
+    if not ticket:
+        return None
+    try:
+        payload = _ticket_signer.unsign_object(ticket, max_age=settings.PUSH_EVENTS_TICKET_MAX_AGE)
+    except signing.BadSignature:
+        return None
+    return {api_settings.USER_ID_CLAIM: payload['u'], VERSION_CLAIM: payload['v'], 'exp': payload['e']}
+
+
+def authenticate(claims):
+    """The user `claims` are valid for, or None once they expire or the user's access changes"""
+    if claims.get('exp', 0) <= time.time():
+        return None
+    close_old_connections()
+    try:
+        return CachedJWTAuthentication().get_user(claims)
+    except (InvalidToken, AuthenticationFailed):
+        return None
+
+
+def cors_headers(scope):
+    """The headers CorsMiddleware would add; the stream doesn't go through Django's middleware"""
+    origin = get_header(scope, b'origin')
+    if not origin:
+        return []
+    allowed = getattr(settings, 'CORS_ALLOW_ALL_ORIGINS', False) or origin in getattr(
+        settings, 'CORS_ALLOWED_ORIGINS', ()
+    )
+    if not allowed:
+        return []
+    headers = [(b'access-control-allow-origin', origin.encode('latin1')), (b'vary', b'origin')]
+    if getattr(settings, 'CORS_ALLOW_CREDENTIALS', False):
+        headers.append((b'access-control-allow-credentials', b'true'))
+    return headers
+
+
+def get_header(scope, header):
+    for name, value in scope.get('headers', []):
+        if name == header:
+            return value.decode('latin1')
+    return None
+
+
+async def send_response(send, status, body, headers=()):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json'), *headers],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def event_stream(scope, receive, send):
+    """
+    ASGI app streaming request status changes as server-sent events.
+
+    Each connection only receives events for requests its user may see. A
+    reconnecting client sends Last-Event-ID (or ?last_event_id=, for a new
+    EventSource) and gets what it missed replayed. The user is checked again
+    at every keepalive, and the stream ends when the access token expires;
+    the client then reconnects with a fresh ticket.
+    """
+    cors = cors_headers(scope)
+    claims = stream_claims(scope)
+    user = await sync_to_async(authenticate)(claims) if claims else None
+    if user is None:
+        await send_response(
+            send, 401, b'{"detail":"Authentication credentials were not provided or are invalid."}', cors
+        )
+        return
+
+    subscription = broker.subscribe(user)
+    try:
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [
+                (b'content-type', b'text/event-stream'),
+                (b'cache-control', b'no-cache'),
+                (b'x-accel-buffering', b'no'),
+                *cors,
+            ],
+        })
+        await send({'type': 'http.response.body', 'body': b'retry: 5000\n\n', 'more_body': True})
+
+        last_event_id = get_header(scope, b'last-event-id') or parse_qs(
+            scope.get('query_string', b'').decode('latin1')
+        ).get('last_event_id', [None])[0]
+        resume_from = parse_event_cursor(last_event_id)
+        if resume_from is not None:
+            missed = await sync_to_async(fetch_events)(resume_from)
+            for event in missed:
+                if is_visible(user, event):
+                    await send({'type': 'http.response.body', 'body': format_event(event), 'more_body': True})
+
+        disconnected = asyncio.ensure_future(wait_for_disconnect(receive))
+        checked_at = time.monotonic()
+        try:
+            while not subscription.overflowed:
+                getter = asyncio.ensure_future(subscription.queue.get())
+                done, _ = await asyncio.wait(
+                    {getter, disconnected},
+                    timeout=max(0, min(settings.PUSH_EVENTS_KEEPALIVE, claims['exp'] - time.time())),
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if getter not in done:
+                    getter.cancel()
+                if disconnected in done:
+                    return
+                if time.monotonic() - checked_at >= settings.PUSH_EVENTS_KEEPALIVE or time.time() >= claims['exp']:
+                    # Role changes, deactivation and token expiry reach open streams too
+                    user = await sync_to_async(authenticate)(claims)
+                    if user is None:
+                        break
+                    subscription.user = user
+                    checked_at = time.monotonic()
+                frame = getter.result() if getter in done else b': keepalive\n\n'
+                await send({'type': 'http.response.body', 'body': frame, 'more_body': True})
+        finally:
+            disconnected.cancel()
+
+        await send({'type': 'http.response.body', 'body': b''})
+    except OSError:
+        # Client went away mid-write
+        pass
+    finally:
+        broker.unsubscribe(subscription)
+
+
+async def wait_for_disconnect(receive):
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return
@@ -0,0 +1,126 @@
+"""
+Change feed for purchase requests and approvals.
+
+Writes stamp the touched rows with a value of the `change` counter inside
+the writing transaction, deletes leave a Tombstone and push events are
+inserted with one. A transaction reserves one value, on its first write,
+and uses it for everything it touches; the row lock it takes on the
+counter is held until it commits, so sequence order equals commit order
+and a client cursor never skips a row. Writes made outside a transaction
+are stamped right after, in a transaction of their own.
+
+Tombstones are addressed to a user (`owner_id`): the creator, and the
+approvers who could see the request. The same kind of tombstone is left
+when an approver stops seeing a request they could see, e.g. when it is
+routed elsewhere or when it is archived. Queryset update() and raw delete
+paths send no signals: they either stamp rows themselves (see
+next_change_seq) or only change what the feed doesn't carry.
+"""
+import threading
+from functools import partial
+
+from django.db import connection, transaction
+from django.db.models import F
+
+from .models import PurchaseRequest, Approval, ChangeSequence, Tombstone
+
+
+CHANGE_COUNTER = 'change'
+PRUNED_COUNTER = 'tombstones_pruned'
+
+SYNC_MODELS = {
+    'purchaserequest': PurchaseRequest,
+    'approval': Approval,
+}
+
+_local = threading.local()
+
+
+def next_change_seq(count=1):
+    """Advance the change counter by `count` and return the new value, the last of the reserved range"""
+    updated = ChangeSequence.objects.filter(pk=CHANGE_COUNTER).update(value=F('value') + count)
+    if not updated:
+        ChangeSequence.objects.get_or_create(pk=CHANGE_COUNTER)
+        ChangeSequence.objects.filter(pk=CHANGE_COUNTER).update(value=F('value') + count)
+    return ChangeSequence.objects.values_list('value', flat=True).get(pk=CHANGE_COUNTER)
+
+
+def current_change_seq(name=CHANGE_COUNTER):
+    return ChangeSequence.objects.filter(pk=name).values_list('value', flat=True).first() or 0
+
+
+def _release(seq):
+    reserved = getattr(_local, 'reserved', None)
+    if reserved is not None and reserved[0] == seq:
+        _local.reserved = None
+
+
+def transaction_seq():
+    """The change sequence of the current transaction, reserved on its first write"""
+    reserved = getattr(_local, 'reserved', None)
+    # A rolled back savepoint drops its on_commit callbacks, and its reservation with them
+    if reserved is not None and any(entry[1] is reserved[1] for entry in connection.run_on_commit):
+        return reserved[0]
+    seq = next_change_seq()
+    release = partial(_release, seq)
+    _local.reserved = (seq, release)
+    transaction.on_commit(release)
+    return seq
+
+
+def _stamped(write):
+    """Run `write(seq)` in the current transaction, or in one of its own outside of any"""
+    if connection.in_atomic_block:
+        return write(transaction_seq())
+    with transaction.atomic():
+        return write(next_change_seq())
+
+
+def stamp(instance):
+    """Give `instance`, about to be saved in a transaction, the transaction's change sequence"""
+    if connection.in_atomic_block:
+        instance.change_seq = transaction_seq()
+
+
+def mark_changed(instance, update_fields=None):
+    """Make sure the saved row of `instance` carries a change sequence of the transaction that wrote it"""
+    if connection.in_atomic_block and (update_fields is None or 'change_seq' in update_fields):
+        # stamp() set it before the save wrote the row
+        return
+
+    def write(seq):
+        SYNC_MODELS[instance._meta.model_name].objects.filter(pk=instance.pk).update(change_seq=seq)
+        instance.change_seq = seq
+
+    _stamped(write)
+
+
+def mark_deleted(instance, owner_ids):
+    """Record a tombstone of `instance` for each of `owner_ids`"""
+    model_name = instance._meta.model_name
+    _stamped(lambda seq: Tombstone.objects.bulk_create(
+        Tombstone(model_name=model_name, object_id=instance.pk, owner_id=owner_id, change_seq=seq)
+        for owner_id in set(owner_ids)
+    ))
+
+
+def mark_revoked(user_ids_by_request):
+    """Tell the users in {request id: user IDs} that they no longer see those requests"""
+    tombstones = [
+        (request_id, user_id)
+        for request_id, user_ids in user_ids_by_request.items() for user_id in user_ids
+    ]
+    if tombstones:
+        _stamped(lambda seq: Tombstone.objects.bulk_create(
+            Tombstone(model_name='purchaserequest', object_id=request_id, owner_id=user_id, change_seq=seq)
+            for request_id, user_id in tombstones
+        ))
+
+
+def queue_event(event):
+    """Insert the unsaved PushEvent `event` with the change sequence of the current transaction"""
+    def write(seq):
+        event.change_seq = seq
+        event.save()
+
+    _stamped(write)
@@ -1,3 +1,1701 @@
-from django.test import TestCase
+import asyncio
+import json
+import logging
+import os
+import shutil
+import socketserver
+import tempfile
+import threading
+import time
+from decimal import Decimal
+from email import message_from_bytes
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.core import signing
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.test import LiveServerTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+
+from . import (
+    document_text, downloads, duplicates, fx, metrics, notifications, previews, routing, sla, streaming, sync, throttles, vendors,
+)
+from .models import (
+    User, PurchaseRequest, Approval, ApprovalRoute, ArchivedApproval, ArchivedPurchaseRequest, AuditEvent,
+    DocumentBlob, DocumentText, ExchangeRate, ExtractionSlot, IdempotencyKey, Notification, PushEvent, RateLimitBucket, RoutingRule, Tombstone,
+    Vendor, VendorTrigram,
+)
+from .admin import EstimatedCountPaginator
+from .logs import JSONFormatter
+from .authentication import CachedJWTAuthentication, user_cache
+from .management.commands.gc_document_blobs import Command as GCDocumentBlobs
+from .management.commands.loadtest import parse_mix, percentile
+from .serializers import PurchaseRequestReadSerializer, PurchaseRequestSerializer, RoleTokenObtainPairSerializer
+from .utils import EXTRACTOR_VERSION, extract_document_text, validate_receipt
+
+
+# Documents and previews the tests write go here, never to the real MEDIA_ROOT
+TEST_MEDIA_ROOT = tempfile.mkdtemp(prefix='procurement-tests-')
+
+
+def tearDownModule():
+    shutil.rmtree(TEST_MEDIA_ROOT, ignore_errors=True)
+
+
+SIZES = (10, 100, 1000)
+
+EXPECTED_QUERIES = {
+    # count, page, approvals, approvers
+    ('list', 'staff'): 4,
+    ('list', 'approver-level-1'): 4,
+    ('list', 'approver-level-2'): 4,
+    ('list', 'finance'): 4,
+    ('retrieve', 'staff'): 3,
+    ('retrieve', 'approver-level-1'): 3,
+    ('retrieve', 'approver-level-2'): 3,
+    ('retrieve', 'finance'): 3,
+    # Extraction slot lease and release (3), the transaction (2), request,
+    # approvals and the existing approval (3), approval insert (3 with its
+    # savepoint), approved levels (1), the change sequence of the transaction
+    # (2), push event recipients and insert (2), the approvals again for the
+    # response (1); after commit: audit insert (1)
+    ('approve', 'approver-level-1'): 18,
+    # Final approval: also the status and PO saves (each with the status
+    # guard's read), route clearing and the tombstones of approvers who lose
+    # the request, notifications, the PO blob and a second push event
+    ('approve', 'approver-level-2'): 34,
+    ('reject', 'approver-level-1'): 23,
+    ('submit_receipt', 'staff'): 20,
+}
+
+
+PROFORMA_DATA = {
+    'vendor': 'Acme Supplies',
+    'items': [{'name': 'Paper', 'quantity': 10, 'unit_price': 5, 'total': 50}],
+    'currency': 'USD',
+}
+
+
+def seed_requests(count, staff, other_staff, approver_1, approver_2):
+    """
+    Bulk-create `count` requests in a realistic mix: pending ones, some
+    approved at level 1 only, fully approved ones with a PO, and rejected ones.
+    """
+    now = timezone.now()
+    requests = []
+    for i in range(count):
+        status = ('pending', 'pending', 'approved', 'rejected')[i % 4]
+        requests.append(PurchaseRequest(
+            title=f'Request {i}',
+            description='Seeded for performance tests',
+            amount=Decimal('100.00') + i,
+            status=status,
+            created_by=staff if i % 5 else other_staff,
+            proforma_data=PROFORMA_DATA,
+            purchase_order_data={'po_number': f'PO-{i}', 'vendor': 'Acme Supplies', 'total_amount': 100 + i}
+            if status == 'approved' else None,
+            rejection_reason='Too expensive' if status == 'rejected' else None,
+        ))
+    departments = {user.id: user.department for user in (staff, other_staff)}
+    routes = routing.route_requests(requests, departments)
+    requests = PurchaseRequest.objects.bulk_create(requests)
+    ApprovalRoute.objects.bulk_create(routes)
+
+    approvals = []
+    for i, purchase_request in enumerate(requests):
+        if purchase_request.status == 'approved' or (purchase_request.status == 'pending' and i % 8 == 1):
+            approvals.append(Approval(purchase_request=purchase_request, approver=approver_1,
+                                      approved=True, approved_at=now))
+        if purchase_request.status == 'approved':
+            approvals.append(Approval(purchase_request=purchase_request, approver=approver_2,
+                                      approved=True, approved_at=now))
+        if purchase_request.status == 'rejected':
+            approvals.append(Approval(purchase_request=purchase_request, approver=approver_1,
+                                      approved=False, comments='Too expensive', approved_at=now))
+    Approval.objects.bulk_create(approvals)
+    return requests
+
+
+def reset_extraction_slots():
+    """Slot rows are created once per process and rolled back with each test; have them created again"""
+    throttles._slots_created = 0
+
+
+class APIClientTestCase(TestCase):
+    """Tests that call the API: a fresh client, and extraction slots to lease"""
+
+    def setUp(self):
+        reset_extraction_slots()
+        self.client = APIClient()
+
+
+@override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT, DOCUMENT_THROTTLE_USER_RATES={}, DOCUMENT_THROTTLE_ROLE_RATES={})
+class APIQueryCountTests(TestCase):
+    """
+    Query-count and latency regression tests for the purchase request API.
+
+    Each scenario runs against 10, 100 and 1,000 seeded requests. The number
+    of queries must not depend on how many rows exist or are returned (list
+    pages are widened to the whole result set, so an N+1 shows up
+    immediately) and must match EXPECTED_QUERIES. Extraction is stubbed, so
+    the suite runs offline.
+
+    Latencies are recorded, not asserted; set PERF_RESULTS_FILE to write
+    them out as JSON baselines.
+    """
+    results = {}
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # One JSON log line per request would drown the test output
+        cls.request_logger = logging.getLogger('procurement.requests')
+        cls.request_log_level = cls.request_logger.level
+        cls.request_logger.setLevel(logging.WARNING)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.request_logger.setLevel(cls.request_log_level)
+        if os.getenv('PERF_RESULTS_FILE'):
+            with open(os.getenv('PERF_RESULTS_FILE'), 'w') as f:
+                json.dump(cls.results, f, indent=2, sort_keys=True)
+        super().tearDownClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('staff', password='x', role='staff')
+        cls.other_staff = User.objects.create_user('staff2', password='x', role='staff')
+        cls.approver_1 = User.objects.create_user('approver1', password='x', role='approver-level-1')
+        cls.approver_2 = User.objects.create_user('approver2', password='x', role='approver-level-2')
+        cls.finance = User.objects.create_user('finance', password='x', role='finance', department='IT')
+
+    def setUp(self):
+        reset_extraction_slots()
+        throttles._ensure_slots()
+        patchers = [
+            mock.patch.object(PageNumberPagination, 'page_size', max(SIZES)),
+            mock.patch('procurement.views.extract_document_text', return_value=''),
+            mock.patch('procurement.views.validate_receipt', return_value=(
+                {'seller': 'Acme Supplies', 'total_amount': 100},
+                {'status': 'validated', 'discrepancies': [], 'matches': []},
+            )),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def measure(self, name, user, method, url, data=None, format='json'):
+        client = self.client_for(user)
+        # Commit hooks (change feed stamps, audit events, previews) run as they would after a
+        # real commit, so their queries are counted too
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+            started = time.perf_counter()
+            response = getattr(client, method)(url, data, format=format)
+            elapsed = time.perf_counter() - started
+        self.assertLess(response.status_code, 300, f"{name} as {user.role}: {response.content[:200]}")
+        return len(queries), elapsed, response
+
+    def take(self, status, approved_by=None):
+        """A seeded request in `status` nobody touched yet, optionally approved by `approved_by` only"""
+        candidates = PurchaseRequest.objects.filter(status=status).exclude(pk__in=self.used)
+        if status == 'pending':
+            if approved_by:
+                candidates = candidates.filter(approvals__approver=approved_by)
+            else:
+                candidates = candidates.filter(approvals__isnull=True)
+        if status == 'approved':
+            candidates = candidates.filter(created_by=self.staff)
+        purchase_request = candidates.first()
+        self.used.add(purchase_request.pk)
+        return purchase_request
+
+    def scenarios(self):
+        detail = PurchaseRequest.objects.filter(status='approved', created_by=self.staff).first()
+        yield 'list', self.staff, 'get', '/api/requests/', None
+        yield 'list', self.approver_1, 'get', '/api/requests/', None
+        yield 'list', self.approver_2, 'get', '/api/requests/', None
+        yield 'list', self.finance, 'get', '/api/requests/', None
+        for user in (self.staff, self.approver_1, self.approver_2, self.finance):
+            yield 'retrieve', user, 'get', f'/api/requests/{detail.pk}/', None
+
+        yield 'approve', self.approver_1, 'patch', f"/api/requests/{self.take('pending').pk}/approve/", {'approved': True}
+        # The second approval completes the request and generates its PO
+        pending = self.take('pending', approved_by=self.approver_1)
+        yield 'approve', self.approver_2, 'patch', f'/api/requests/{pending.pk}/approve/', {'approved': True}
+        yield 'reject', self.approver_1, 'patch', f"/api/requests/{self.take('pending').pk}/reject/", {'comments': 'No budget'}
+
+        # Distinct content, so every upload stores a new blob
+        content = f'%PDF-1.4 receipt {len(self.used)}'.encode()
+        receipt = SimpleUploadedFile('receipt.pdf', content, content_type='application/pdf')
+        yield ('submit_receipt', self.staff, 'post', f"/api/requests/{self.take('approved').pk}/submit_receipt/",
+               {'receipt': receipt})
+
+    def test_query_counts_do_not_grow_with_data(self):
+        self.used = set()
+        seeded = 0
+        counts = {}
+        for size in SIZES:
+            seed_requests(size - seeded, self.staff, self.other_staff, self.approver_1, self.approver_2)
+            seeded = size
+            for name, user, method, url, data in self.scenarios():
+                format = 'multipart' if name == 'submit_receipt' else 'json'
+                num_queries, elapsed, response = self.measure(name, user, method, url, data, format)
+                if name == 'list':
+                    # The whole visible set is on the page
+                    self.assertEqual(response.data['count'], len(response.data['results']))
+                key = (name, user.role)
+                counts.setdefault(key, {})[size] = num_queries
+                self.results.setdefault(f'{name}[{user.role}]', {})[size] = {
+                    'queries': num_queries,
+                    'ms': round(elapsed * 1000, 2),
+                }
+
+        for key, by_size in counts.items():
+            with self.subTest(scenario=key):
+                self.assertEqual(
+                    len(set(by_size.values())), 1,
+                    f"{key[0]} as {key[1]} runs more queries as data grows: {by_size}"
+                )
+                self.assertEqual(by_size[SIZES[0]], EXPECTED_QUERIES[key], f"{key[0]} as {key[1]}")
+
+
+@override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT, DOCUMENT_THROTTLE_USER_RATES={}, DOCUMENT_THROTTLE_ROLE_RATES={})
+class ReadSerializerTests(APIClientTestCase):
+    """PurchaseRequestReadSerializer builds its payload by hand; it must match the ModelSerializer's"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('staff', password='x', role='staff', first_name='Sam')
+        cls.other_staff = User.objects.create_user('staff2', password='x', role='staff')
+        cls.approver_1 = User.objects.create_user('approver1', password='x', role='approver-level-1')
+        cls.approver_2 = User.objects.create_user('approver2', password='x', role='approver-level-2')
+
+    def assert_same_payload(self, purchase_request):
+        request = Request(APIRequestFactory().get('/api/requests/'))
+        purchase_request = PurchaseRequest.objects.select_related('created_by') \
+            .prefetch_related('approvals__approver').get(pk=purchase_request.pk)
+        # Both sign document URLs at the same instant
+        with mock.patch('procurement.downloads.time.time', return_value=1_700_000_000):
+            for context in ({'request': request}, {}):
+                expected = PurchaseRequestSerializer(purchase_request, context=context).data
+                self.assertEqual(PurchaseRequestReadSerializer(purchase_request, context=context).data, expected)
+                self.assertEqual(
+                    PurchaseRequestReadSerializer([purchase_request], many=True, context=context).data, [expected]
+                )
+
+    def test_payloads_match_the_model_serializer(self):
+        requests = seed_requests(4, self.staff, self.other_staff, self.approver_1, self.approver_2)
+        for purchase_request in requests:
+            self.assert_same_payload(purchase_request)
+
+        # Documents, a base amount, a vendor and whole amounts
+        purchase_request = requests[2]
+        purchase_request.proforma.save('quote.pdf', ContentFile(b'%PDF-1.4 quote'), save=False)
+        purchase_request.receipt.save('receipt.png', ContentFile(b'receipt'), save=False)
+        purchase_request.amount = 250
+        purchase_request.amount_base = Decimal('230.5')
+        purchase_request.proforma_vendor = Vendor.objects.create(name='Acme Supplies', normalized_name='acme supplies')
+        purchase_request.receipt_validation = {'status': 'validated', 'discrepancies': []}
+        purchase_request.save()
+        self.assert_same_payload(purchase_request)
+
+    @mock.patch('procurement.views.generate_purchase_order', return_value=(None, {}))
+    def test_action_responses_carry_the_approvals_just_written(self, generate):
+        pending = seed_requests(1, self.staff, self.other_staff, self.approver_1, self.approver_2)[0]
+        pending.proforma.save('quote.pdf', ContentFile(b'%PDF-1.4 quote'))
+        self.client.force_authenticate(self.approver_1)
+        response = self.client.patch(f'/api/requests/{pending.pk}/approve/', {'approved': True}, format='json')
+        self.assertEqual([approval['approver']['id'] for approval in response.data['approvals']], [self.approver_1.pk])
+
+        self.client.force_authenticate(self.approver_2)
+        response = self.client.patch(f'/api/requests/{pending.pk}/reject/', {'comments': 'No budget'}, format='json')
+        self.assertEqual(response.data['status'], 'rejected')
+        self.assertEqual(
+            {(approval['approver']['id'], approval['approved']) for approval in response.data['approvals']},
+            {(self.approver_1.pk, True), (self.approver_2.pk, False)},
+        )
+        # Built with the request, like every other response, so document URLs are absolute
+        self.assertTrue(response.data['proforma'].startswith('http://testserver/'))
+        self.client.force_authenticate(pending.created_by)
+        self.assertEqual(self.client.get(f'/api/requests/{pending.pk}/').data['approvals'], response.data['approvals'])
+
+
+@override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT, DOCUMENT_THROTTLE_USER_RATES={}, DOCUMENT_THROTTLE_ROLE_RATES={})
+class AuthenticationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('staff', password='x', role='staff', department='IT')
+
+    def setUp(self):
+        user_cache.clear()
+        self.addCleanup(user_cache.clear)
+        self.authentication = CachedJWTAuthentication()
+
+    def access_token(self, user):
+        return str(RoleTokenObtainPairSerializer.get_token(user).access_token)
+
+    def resolve(self, token):
+        return self.authentication.get_user(self.authentication.get_validated_token(token))
+
+    def test_each_request_gets_its_own_user(self):
+        token = self.access_token(self.user)
+        with self.assertNumQueries(1):
+            first = self.resolve(token)
+        first.department = 'Sales'
+        with self.assertNumQueries(0):
+            second = self.resolve(token)
+        self.assertIsNot(first, second)
+        self.assertEqual((second.pk, second.department), (self.user.pk, 'IT'))
+        self.assertFalse(second._state.adding)
+
+    def test_access_changes_refuse_older_tokens(self):
+        for field, value in (('role', 'finance'), ('department', 'Sales')):
+            user = User.objects.get(pk=self.user.pk)
+            token = self.access_token(user)
+            self.resolve(token)
+            setattr(user, field, value)
+            user.save()
+            with self.assertRaises(AuthenticationFailed) as refused:
+                self.resolve(token)
+            self.assertEqual(refused.exception.detail['code'], 'token_outdated')
+            self.assertEqual(getattr(self.resolve(self.access_token(user)), field), value)
+
+        # Loading a deferred field is not a change
+        user = User.objects.only('id', 'first_name').get(pk=self.user.pk)
+        version = User.objects.get(pk=self.user.pk).token_version
+        user.first_name = 'Ada'
+        user.save(update_fields=['first_name'])
+        self.assertEqual(User.objects.get(pk=self.user.pk).token_version, version)
+
+    def test_outdated_token_is_refused_by_the_api(self):
+        client = APIClient()
+        refresh = RoleTokenObtainPairSerializer.get_token(self.user)
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
+        self.assertEqual(client.get('/api/requests/').status_code, 200)
+
+        self.user.role = 'finance'
+        self.user.save()
+        response = client.get('/api/requests/')
+        self.assertEqual((response.status_code, response.json()['code']), (401, 'token_outdated'))
+
+        access = client.post('/api/token/refresh/', {'refresh': str(refresh)}, format='json').json()['access']
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+        self.assertEqual(client.get('/api/requests/').status_code, 200)
+
+    def test_saving_a_user_drops_the_cached_copy(self):
+        token = self.access_token(self.user)
+        self.resolve(token)
+        user = User.objects.get(pk=self.user.pk)
+        user.first_name = 'Ada'
+        user.save()
+        with self.assertNumQueries(1):
+            self.assertEqual(self.resolve(token).first_name, 'Ada')
+
+
+@override_settings(CORS_ALLOWED_ORIGINS=['https://app.example'], PUSH_EVENTS_KEEPALIVE=0.05)
+class EventStreamTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('staff', password='x', role='staff')
+
+    def setUp(self):
+        user_cache.clear()
+        self.addCleanup(user_cache.clear)
+        self.token = RoleTokenObtainPairSerializer.get_token(self.user).access_token
+
+    def ticket(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token}')
+        response = client.post('/api/events/ticket/')
+        self.assertEqual(response.status_code, 200)
+        return response.json()['ticket']
+
+    def stream(self, query='', headers=(), on_send=None):
+        """Messages the stream sends until it ends by itself"""
+        sent = []
+
+        async def receive():
+            await asyncio.Event().wait()
+
+        async def send(message):
+            sent.append(message)
+            if on_send is not None:
+                await on_send(message)
+
+        scope = {'type': 'http', 'method': 'GET', 'path': streaming.EVENT_STREAM_PATH,
+                 'query_string': query.encode(), 'headers': [(b'origin', b'https://app.example'), *headers]}
+
+        async def run():
+            await asyncio.wait_for(streaming.event_stream(scope, receive, send), timeout=5)
+
+        async_to_sync(run)()
+        return sent
+
+    def test_credentials_are_required_and_never_taken_from_the_url(self):
+        for query in ('', f'token={self.token}', 'ticket=forged'):
+            start = self.stream(query)[0]
+            self.assertEqual(start['status'], 401)
+            self.assertIn((b'access-control-allow-origin', b'https://app.example'), start['headers'])
+
+        with override_settings(PUSH_EVENTS_TICKET_MAX_AGE=-1):
+            self.assertEqual(self.stream(f'ticket={self.ticket()}')[0]['status'], 401)
+
+    def test_stream_ends_when_access_changes(self):
+        async def change_role(message):
+            if message.get('body') == b': keepalive\n\n' and self.user.role == 'staff':
+                self.user.role = 'finance'
+                await sync_to_async(self.user.save)()
+
+        sent = self.stream(f'ticket={self.ticket()}', on_send=change_role)
+        self.assertEqual(sent[0]['status'], 200)
+        self.assertIn((b'access-control-allow-origin', b'https://app.example'), sent[0]['headers'])
+        self.assertEqual(sent[-1], {'type': 'http.response.body', 'body': b''})
+
+    def test_stream_ends_when_the_token_expires(self):
+        ticket = streaming.issue_ticket(self.user, {'exp': time.time() + 0.3})
+        with override_settings(PUSH_EVENTS_KEEPALIVE=20):
+            started = time.monotonic()
+            sent = self.stream(f'ticket={ticket}')
+        self.assertEqual(sent[0]['status'], 200)
+        self.assertLess(time.monotonic() - started, 3)
+        self.assertEqual(sent[-1]['body'], b'')
+
+        # Header credentials, for clients that can send them, expire the same way
+        self.token.set_exp(lifetime=timezone.timedelta(seconds=2))
+        with override_settings(PUSH_EVENTS_KEEPALIVE=20):
+            sent = self.stream(headers=[(b'authorization', f'Bearer {self.token}'.encode())])
+        self.assertEqual(sent[0]['status'], 200)
+        self.assertEqual(sent[-1]['body'], b'')
+
+
+class ChangeFeedTests(APIClientTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('staff', password='x', role='staff')
+        cls.other_staff = User.objects.create_user('staff2', password='x', role='staff')
+        cls.approver_1 = User.objects.create_user('approver1', password='x', role='approver-level-1')
+        cls.other_approver_1 = User.objects.create_user('approver1b', password='x', role='approver-level-1')
+        cls.approver_2 = User.objects.create_user('approver2', password='x', role='approver-level-2')
+        # Inactive when the requests are routed, so never sees them
+        cls.outsider = User.objects.create_user('approver1c', password='x', role='approver-level-1',
+                                                is_active=False)
+        cls.finance = User.objects.create_user('finance', password='x', role='finance')
+
+    def as_user(self, user, method, url, data=None):
+        self.client.force_authenticate(user)
+        # One request, one committed transaction
+        with self.captureOnCommitCallbacks(execute=True):
+            return getattr(self.client, method)(url, data, format='json')
+
+    def create(self, user, title):
+        response = self.as_user(user, 'post', '/api/requests/', {'title': title, 'description': 'd', 'amount': '10.00'})
+        self.assertEqual(response.status_code, 201)
+        return PurchaseRequest.objects.get(title=title)
+
+    def changes(self, user, since=0, **params):
+        response = self.as_user(user, 'get', '/api/requests/changes/', {'since': since, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_writes_are_stamped_in_their_transaction_in_commit_order(self):
+        first = self.create(self.staff, 'Laptop')
+        second = self.create(self.staff, 'Desk')
+        self.assertLess(first.change_seq, second.change_seq)
+        self.assertEqual(second.change_seq, sync.current_change_seq())
+
+        feed = self.changes(self.staff)
+        self.assertEqual([request['id'] for request in feed['requests']], [first.pk, second.pk])
+        self.assertEqual(feed['cursor'], second.change_seq)
+        self.assertEqual(self.changes(self.staff, feed['cursor'])['requests'], [])
+
+        # The approval, the request and its push event share the sequence of the approving transaction
+        self.as_user(self.approver_1, 'patch', f'/api/requests/{first.pk}/approve/', {'approved': True})
+        approval = Approval.objects.get()
+        self.assertEqual(approval.change_seq, PushEvent.objects.order_by('-change_seq').first().change_seq)
+        feed = self.changes(self.staff, feed['cursor'])
+        self.assertEqual([approval['id'] for approval in feed['approvals']], [approval.pk])
+
+        # Paging stops at the limit and resumes from the cursor
+        page = self.changes(self.staff, limit=1)
+        self.assertTrue(page['has_more'])
+        self.assertEqual([request['id'] for request in page['requests']], [second.pk])
+        rest = self.changes(self.staff, page['cursor'], limit=1)
+        self.assertEqual([request['id'] for request in rest['requests']], [first.pk])
+
+    def test_rolled_back_writes_leave_no_stamp(self):
+        purchase_request = self.create(self.staff, 'Laptop')
+        seq = sync.current_change_seq()
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            purchase_request.title = 'Desk'
+            purchase_request.save()
+            raise RuntimeError
+        self.assertEqual(sync.current_change_seq(), seq)
+        self.assertEqual(self.changes(self.staff, seq)['requests'], [])
+
+    @override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT, DOCUMENT_THROTTLE_USER_RATES={}, DOCUMENT_THROTTLE_ROLE_RATES={})
+    def test_documents_are_read_before_the_change_sequence_is_reserved(self):
+        # Reserving locks the counter row until commit; no writer may wait on an OCR or LLM call
+        before = sync.current_change_seq()
+        read_at = []
+
+        def read(*args, **kwargs):
+            read_at.append(sync.current_change_seq())
+            return {'vendor': 'Acme Supplies', 'vendor_id': None}
+
+        proforma = SimpleUploadedFile('quote.pdf', b'%PDF-1.4 quote', content_type='application/pdf')
+        self.client.force_authenticate(self.staff)
+        with mock.patch('procurement.views.extract_document_text', return_value='Acme Supplies quote'), \
+                mock.patch('procurement.views.extract_proforma_data', side_effect=read), \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/requests/', {
+                'title': 'Laptop', 'description': 'd', 'amount': '10.00', 'proforma': proforma,
+            }, format='multipart')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(read_at, [before])
+        created = PurchaseRequest.objects.get(title='Laptop')
+        self.assertEqual(created.proforma_data, {'vendor': 'Acme Supplies', 'vendor_id': None})
+        with created.proforma.open() as handle:
+            self.assertEqual(handle.read(), b'%PDF-1.4 quote')
+        self.assertEqual(created.change_seq, sync.current_change_seq())
+
+        PurchaseRequest.objects.filter(pk=created.pk).update(status='approved', purchase_order_data={'vendor': 'Acme'})
+        before = sync.current_change_seq()
+        receipt = SimpleUploadedFile('receipt.pdf', b'%PDF-1.4 receipt', content_type='application/pdf')
+        with mock.patch('procurement.views.extract_document_text', return_value='Acme Supplies receipt'), \
+                mock.patch('procurement.views.validate_receipt', side_effect=lambda *args, **kwargs: (
+                    read_at.append(sync.current_change_seq()) or ({}, {'status': 'validated'})
+                )), self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'/api/requests/{created.pk}/submit_receipt/', {'receipt': receipt},
+                                        format='multipart')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(read_at[1:], [before])
+
+    def test_tombstones_only_reach_users_who_could_see_the_request(self):
+        decided = self.create(self.staff, 'Laptop')
+        deleted = self.create(self.other_staff, 'Desk').pk
+        User.objects.filter(pk=self.outsider.pk).update(is_active=True)
+        cursor = sync.current_change_seq()
+
+        # Fully approving clears the routes: the level 1 approver who didn't review loses the request
+        self.as_user(self.approver_1, 'patch', f'/api/requests/{decided.pk}/approve/', {'approved': True})
+        self.as_user(self.approver_2, 'patch', f'/api/requests/{decided.pk}/approve/', {'approved': True})
+        with self.captureOnCommitCallbacks(execute=True), transaction.atomic():
+            PurchaseRequest.objects.get(pk=deleted).delete()
+
+        self.assertEqual(self.changes(self.other_approver_1, cursor)['deleted']['requests'], [decided.pk, deleted])
+        self.assertEqual(self.changes(self.approver_1, cursor)['deleted']['requests'], [deleted])
+        self.assertEqual(self.changes(self.staff, cursor)['deleted']['requests'], [])
+        self.assertEqual(self.changes(self.other_staff, cursor)['deleted']['requests'], [deleted])
+        self.assertEqual(self.changes(self.finance, cursor)['deleted']['requests'], [deleted])
+        # Changes to requests someone never saw are not reported to them at all
+        outsider_feed = self.changes(self.outsider)
+        self.assertEqual((outsider_feed['requests'], outsider_feed['deleted']), ([], {'requests': [], 'approvals': []}))
+
+
+@override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT, DOCUMENT_ACCEL_REDIRECT_PREFIX='')
+class DocumentDownloadTests(TestCase):
+    def setUp(self):
+        self.name = default_storage.save('receipts/receipt.pdf', ContentFile(b'0123456789'))
+        self.url = downloads.sign_document(self.name, 'receipt.pdf')
+
+    def get(self, url=None, **headers):
+        response = self.client.get(url or self.url, **headers)
+        self.addCleanup(response.close)
+        return response
+
+    def body(self, response):
+        return b''.join(response.streaming_content)
+
+    def test_ranges(self):
+        self.assertEqual(downloads.parse_range('bytes=2-4', 10), (2, 4))
+        self.assertEqual(downloads.parse_range('bytes=-3', 10), (7, 9))
+        self.assertEqual(downloads.parse_range('bytes=8-', 10), (8, 9))
+        self.assertEqual(downloads.parse_range('bytes=8-100', 10), (8, 9))
+        # Malformed, or several ranges: ignored
+        for header in ('bytes=5-2', 'bytes=abc', 'items=0-1', 'bytes=0-1,4-5', 'bytes=-', ''):
+            self.assertIsNone(downloads.parse_range(header, 10), header)
+        # Well-formed but outside the file
+        self.assertIs(downloads.parse_range('bytes=10-', 10), False)
+        self.assertIs(downloads.parse_range('bytes=-0', 10), False)
+
+        response = self.get(HTTP_RANGE='bytes=2-4')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 2-4/10')
+        self.assertEqual(self.body(response), b'234')
+        response = self.get(HTTP_RANGE='bytes=5-2')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.body(response), b'0123456789')
+        response = self.get(HTTP_RANGE='bytes=20-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */10')
+
+    def test_expired_and_tampered_links_are_refused(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Disposition'], 'inline; filename="receipt.pdf"')
+
+        token = self.url.rstrip('/').rsplit('/', 1)[1]
+        tampered = token[:-1] + ('A' if token[-1] != 'A' else 'B')
+        self.assertEqual(self.get(self.url.replace(token, tampered)).status_code, 404)
+        forged = signing.Signer(salt='other').sign_object({'n': self.name, 'e': time.time() + 60})
+        self.assertEqual(self.get(f'/api/documents/{forged}/').status_code, 404)
+        with mock.patch('procurement.downloads.time.time', return_value=time.time() + settings.DOCUMENT_URL_MAX_AGE + 61):
+            self.assertEqual(self.get().status_code, 404)
+
+    @override_settings(DOCUMENT_ACCEL_REDIRECT_PREFIX='/protected-media/')
+    def test_front_server_transfers_only_what_it_proxies(self):
+        response = self.get(HTTP_X_SENDFILE_TYPE='X-Accel-Redirect')
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/' + self.name)
+        self.assertEqual(response.content, b'')
+        # Straight to Django: no front server to hand the transfer to
+        response = self.get()
+        self.assertNotIn('X-Accel-Redirect', response)
+        self.assertEqual(self.body(response), b'0123456789')
+
+
+@override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT, DOCUMENT_THROTTLE_USER_RATES={}, DOCUMENT_THROTTLE_ROLE_RATES={})
+class IdempotencyKeyTests(APIClientTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('staff', password='x', role='staff')
+        cls.approver = User.objects.create_user('approver1', password='x', role='approver-level-1')
+
+    def post_request(self, key, title='Laptop'):
+        self.client.force_authenticate(self.staff)
+        return self.client.post('/api/requests/', {'title': title, 'description': 'd', 'amount': '10.00'},
+                                format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_duplicate_create_is_replayed(self):
+        first = self.post_request('create-1')
+        second = self.post_request('create-1')
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(second.status_code, 201)
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(first.json(), second.json())
+        self.assertEqual(PurchaseRequest.objects.count(), 1)
+
+    def test_replays_hand_out_fresh_document_urls(self):
+        def token(url):
+            return url.rstrip('/').rsplit('/', 1)[1]
+
+        self.client.force_authenticate(self.staff)
+        proforma = SimpleUploadedFile('quote.pdf', b'%PDF-1.4 quote', content_type='application/pdf')
+        with mock.patch('procurement.views.extract_document_text', return_value=''):
+            first = self.client.post('/api/requests/', {
+                'title': 'Laptop', 'description': 'd', 'amount': '10.00', 'proforma': proforma,
+            }, format='multipart', HTTP_IDEMPOTENCY_KEY='create-1')
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(IdempotencyKey.objects.get().object_id, first.json()['id'])
+
+        later = time.time() + settings.DOCUMENT_URL_MAX_AGE + 120
+        with mock.patch('procurement.downloads.time.time', return_value=later):
+            self.assertEqual(downloads.unsign_document(token(first.json()['proforma'])), (None, None))
+            proforma.seek(0)
+            second = self.client.post('/api/requests/', {
+                'title': 'Laptop', 'description': 'd', 'amount': '10.00', 'proforma': proforma,
+            }, format='multipart', HTTP_IDEMPOTENCY_KEY='create-1')
+            self.assertEqual(second['Idempotent-Replayed'], 'true')
+            name, _ = downloads.unsign_document(token(second.json()['proforma']))
+        self.assertEqual(name, PurchaseRequest.objects.get().proforma.name)
+        self.assertEqual({**second.json(), 'proforma': None}, {**first.json(), 'proforma': None})
+
+    def test_reused_key_with_other_payload_is_refused(self):
+        self.post_request('create-1')
+        self.assertEqual(self.post_request('create-1', title='Desk').status_code, 422)
+
+    def test_duplicate_in_flight_gets_conflict(self):
+        self.post_request('create-1')
+        IdempotencyKey.objects.update(status='in_progress', locked_at=timezone.now())
+        response = self.post_request('create-1')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response['Retry-After'], '1')
+
+    def test_reject_runs_once_under_its_key(self):
+        purchase_request = seed_requests(1, self.staff, self.staff, self.approver, self.approver)[0]
+        self.client.force_authenticate(self.approver)
+        url = f'/api/requests/{purchase_request.pk}/reject/'
+        for _ in range(2):
+            response = self.client.patch(url, {'comments': 'No budget'}, format='json', HTTP_IDEMPOTENCY_KEY='reject-1')
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(Approval.objects.filter(purchase_request=purchase_request).count(), 1)
+        self.assertEqual(IdempotencyKey.objects.get().status, 'completed')
+
+
+@override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT, EXTRACTION_SLOTS=1, EXTRACTION_SLOT_RETRY_AFTER=7,
+                   DOCUMENT_THROTTLE_USER_RATES={'approver-level-1': '5/hour'},
+                   DOCUMENT_THROTTLE_ROLE_RATES={'approver-level-1': '1/hour'})
+class DocumentThrottleTests(APIClientTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('staff', password='x', role='staff')
+        cls.approver = User.objects.create_user('approver1', password='x', role='approver-level-1')
+        cls.approver_2 = User.objects.create_user('approver2', password='x', role='approver-level-2')
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.approver)
+        self.pending = [purchase_request for purchase_request in seed_requests(
+            5, self.staff, self.staff, self.approver, self.approver_2
+        ) if purchase_request.status == 'pending']
+
+    def approve(self, purchase_request, key=None):
+        headers = {'HTTP_IDEMPOTENCY_KEY': key} if key else {}
+        return self.client.patch(f'/api/requests/{purchase_request.pk}/approve/', {'approved': True},
+                                 format='json', **headers)
+
+    def tokens(self):
+        return dict(RateLimitBucket.objects.values_list('key', 'tokens'))
+
+    def test_a_refusal_charges_neither_bucket(self):
+        self.assertEqual(self.approve(self.pending[0]).status_code, 200)
+        user_key, role_key = f'documents:user:{self.approver.pk}', 'documents:role:approver-level-1'
+        charged = self.tokens()
+        self.assertAlmostEqual(charged[user_key], 4, places=2)
+        self.assertAlmostEqual(charged[role_key], 0, places=2)
+
+        response = self.approve(self.pending[1])
+        self.assertEqual(response.status_code, 429)
+        self.assertAlmostEqual(int(response['Retry-After']), 3600, delta=5)
+        self.assertEqual(self.tokens(), charged)
+
+    def test_extraction_slots_are_released(self):
+        self.assertEqual(self.approve(self.pending[0]).status_code, 200)
+        self.assertEqual(ExtractionSlot.objects.get().holder, '')
+
+        ExtractionSlot.objects.update(holder='other', leased_until=timezone.now() + timezone.timedelta(minutes=5))
+        with override_settings(DOCUMENT_THROTTLE_ROLE_RATES={}):
+            response = self.approve(self.pending[1])
+        self.assertEqual((response.status_code, response['Retry-After']), (429, '7'))
+        # A lease whose worker died is taken over
+        ExtractionSlot.objects.update(leased_until=timezone.now() - timezone.timedelta(seconds=1))
+        with override_settings(DOCUMENT_THROTTLE_ROLE_RATES={}):
+            self.assertEqual(self.approve(self.pending[1]).status_code, 200)
+        self.assertEqual(ExtractionSlot.objects.get().holder, '')
+
+    def test_replays_are_not_throttled(self):
+        first = self.approve(self.pending[0], key='approve-1')
+        charged = self.tokens()
+        replayed = self.approve(self.pending[0], key='approve-1')
+        self.assertEqual((replayed.status_code, replayed['Idempotent-Replayed']), (200, 'true'))
+        self.assertEqual(replayed.data, first.data)
+        self.assertEqual(self.tokens(), charged)
+        # A new key is a new action, and is throttled
+        self.assertEqual(self.approve(self.pending[1], key='approve-2').status_code, 429)
+
+
+class AdminTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', password='x', email='admin@example.com')
+        cls.staff = User.objects.create_user('Staff', password='x', role='staff')
+        cls.other_staff = User.objects.create_user('other', password='x', role='staff')
+        cls.approver_1 = User.objects.create_user('approver1', password='x', role='approver-level-1')
+        cls.approver_2 = User.objects.create_user('approver2', password='x', role='approver-level-2')
+        seed_requests(12, cls.staff, cls.other_staff, cls.approver_1, cls.approver_2)
+
+    @override_settings(ADMIN_COUNT_LIMIT=5)
+    def test_counts_stop_at_the_limit(self):
+        paginator = EstimatedCountPaginator(PurchaseRequest.objects.all(), 2)
+        self.assertEqual((paginator.count, paginator.num_pages), (5, 3))
+        self.assertEqual(EstimatedCountPaginator(PurchaseRequest.objects.filter(status='rejected'), 2).count, 3)
+
+    @override_settings(ADMIN_COUNT_LIMIT=5)
+    def test_unfiltered_postgresql_lists_use_the_estimate(self):
+        with mock.patch('procurement.admin.connection') as pg:
+            pg.vendor = 'postgresql'
+            pg.cursor.return_value.__enter__.return_value.fetchone.return_value = (250000,)
+            self.assertEqual(EstimatedCountPaginator(PurchaseRequest.objects.all(), 2).count, 250000)
+            # A stale estimate under the limit is counted instead
+            pg.cursor.return_value.__enter__.return_value.fetchone.return_value = (3,)
+            self.assertEqual(EstimatedCountPaginator(PurchaseRequest.objects.all(), 2).count, 5)
+            self.assertEqual(EstimatedCountPaginator(PurchaseRequest.objects.filter(status='pending'), 2).count, 5)
+        self.assertEqual(pg.cursor.call_count, 2)
+
+    # The changelist's static files aren't collected in tests
+    @override_settings(STORAGES={**settings.STORAGES, 'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    }})
+    def test_username_search_is_exact_and_ignores_case(self):
+        self.client.force_login(self.admin)
+        response = self.client.get('/admin/procurement/purchaserequest/', {'q': 'staff'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual({purchase_request.created_by for purchase_request in response.context['cl'].result_list},
+                         {self.staff})
+        response = self.client.get('/admin/procurement/purchaserequest/', {'q': 'sta'})
+        self.assertEqual(list(response.context['cl'].result_list), [])
+        self.assertIn('user_username_upper', {index.name for index in User._meta.indexes})
+
+    @override_settings(STORAGES={**settings.STORAGES, 'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    }})
+    def test_title_and_description_search_match_substrings(self):
+        laptop, dock = PurchaseRequest.objects.order_by('pk')[:2]
+        PurchaseRequest.objects.filter(pk=laptop.pk).update(title='Dell Laptop')
+        PurchaseRequest.objects.filter(pk=dock.pk).update(description='USB-C docking station for the new laptops')
+        self.client.force_login(self.admin)
+        response = self.client.get('/admin/procurement/purchaserequest/', {'q': 'laptop'})
+        self.assertEqual({purchase_request.pk for purchase_request in response.context['cl'].result_list},
+                         {laptop.pk, dock.pk})
+        response = self.client.get('/admin/procurement/purchaserequest/', {'q': 'DOCKING'})
+        self.assertEqual([purchase_request.pk for purchase_request in response.context['cl'].result_list], [dock.pk])
+
+
+QUOTE = """
+Acme Office Supplies Ltd, 12 Market Street. Quotation Q-{number} for Kigali HQ.
+Ergonomic office chair, black mesh, quantity 12 at 145.00 each.
+Height adjustable standing desk, oak top, quantity 4 at 520.00 each.
+Delivery within 14 days of the purchase order, payment net 30. Total 3820.00 USD.
+"""
+
+
+class VendorTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('staff', password='x', role='staff')
+        cls.other_staff = User.objects.create_user('staff2', password='x', role='staff')
+        cls.approver_1 = User.objects.create_user('approver1', password='x', role='approver-level-1')
+        cls.approver_2 = User.objects.create_user('approver2', password='x', role='approver-level-2')
+
+    def test_names_are_normalized(self):
+        self.assertEqual(vendors.normalize_vendor_name('  Acmé Supplies, Ltd. '), 'acme supplies')
+        self.assertEqual(vendors.normalize_vendor_name('Smith & Sons Co'), 'smith and sons')
+        # A suffix alone is still a name
+        self.assertEqual(vendors.normalize_vendor_name('Limited'), 'limited')
+        self.assertEqual(vendors.vendor_name_from({'seller': {'name': ' Acme '}}), 'Acme')
+        self.assertEqual(vendors.vendor_name_from({'vendor': 12, 'supplier_name': 'Globex'}), 'Globex')
+        self.assertEqual(vendors.vendor_name_from(None), '')
+
+    def test_similar_names_resolve_to_one_vendor(self):
+        acme = vendors.resolve_vendor('Acme Supplies Ltd')
+        self.assertEqual((acme.name, acme.normalized_name), ('Acme Supplies Ltd', 'acme supplies'))
+        self.assertEqual(acme.trigram_count, len(vendors.trigrams('acme supplies')))
+        self.assertEqual(
+            set(VendorTrigram.objects.filter(vendor=acme).values_list('trigram', flat=True)),
+            vendors.trigrams('acme supplies'),
+        )
+
+        self.assertEqual(vendors.resolve_vendor('ACME SUPPLIES, INC.'), acme)
+        # A typo shares most trigrams
+        self.assertEqual(vendors.resolve_vendor('Acme Suppliers'), acme)
+        self.assertEqual(Vendor.objects.count(), 1)
+
+        globex = vendors.resolve_vendor('Globex Trading')
+        self.assertNotEqual(globex, acme)
+        with override_settings(VENDOR_MATCH_THRESHOLD=0.95):
+            self.assertIsNone(vendors.find_vendor('acme supplier'))
+        self.assertIsNone(vendors.resolve_vendor(' , '))
+        self.assertEqual(Vendor.objects.count(), 2)
+
+    def test_backfill_resolves_extracted_names(self):
+        requests = seed_requests(4, self.staff, self.other_staff, self.approver_1, self.approver_2)
+        PurchaseRequest.objects.filter(pk=requests[2].pk).update(receipt_data={'seller': 'ACME Supplies, Inc.'})
+        PurchaseRequest.objects.filter(pk=requests[3].pk).update(proforma_data={'supplier': 'Globex Trading'})
+        before = sync.current_change_seq()
+
+        out = StringIO()
+        call_command('backfill_vendors', batch_size=2, stdout=out)
+        self.assertIn('Updated 4 requests across 2 vendors', out.getvalue())
+        acme = Vendor.objects.get(normalized_name='acme supplies')
+        self.assertEqual(
+            {pk: (proforma, receipt) for pk, proforma, receipt in PurchaseRequest.objects.values_list(
+                'pk', 'proforma_vendor', 'receipt_vendor')},
+            {
+                requests[0].pk: (acme.pk, None),
+                requests[1].pk: (acme.pk, None),
+                requests[2].pk: (acme.pk, acme.pk),
+                requests[3].pk: (Vendor.objects.get(normalized_name='globex trading').pk, None),
+            },
+        )
+        # Updated requests go out on the change feed
+        self.assertEqual(
+            sorted(PurchaseRequest.objects.values_list('change_seq', flat=True)),
+            list(range(before + 1, before + 5)),
+        )
+
+        call_command('backfill_vendors', stdout=out)
+        self.assertIn('Updated 0 requests', out.getvalue())
+
+
+class DuplicateDetectionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('staff', password='x', role='staff')
+        cls.approver_1 = User.objects.create_user('approver1', password='x', role='approver-level-1')
+        cls.approver_2 = User.objects.create_user('approver2', password='x', role='approver-level-2')
+
+    def test_near_identical_proforma_is_flagged(self):
+        original, resubmitted, unrelated = seed_requests(3, self.staff, self.staff, self.approver_1, self.approver_2)
+        duplicates.index_document(original, 'proforma', QUOTE.format(number=1041))
+        found = duplicates.index_document(resubmitted, 'proforma', QUOTE.format(number=1042))
+        self.assertEqual([duplicate['id'] for duplicate in found], [original.pk])
+        self.assertEqual(resubmitted.duplicate_candidates, found)
+
+        other = 'Globex Corporation receipt 88123: printer toner cartridges, two boxes of A4 paper, 96.40 RWF'
+        self.assertEqual(duplicates.index_document(unrelated, 'proforma', other), [])
+
+    def test_receipts_do_not_match_proformas(self):
+        first, second = seed_requests(2, self.staff, self.staff, self.approver_1, self.approver_2)
+        duplicates.index_document(first, 'proforma', QUOTE.format(number=1041))
+        self.assertEqual(duplicates.index_document(second, 'receipt', QUOTE.format(number=1041)), [])
+
+
+@override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT, DOCUMENT_THROTTLE_USER_RATES={}, DOCUMENT_THROTTLE_ROLE_RATES={})
+class ReceiptSubmissionTests(APIClientTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('staff', password='x', role='staff')
+        cls.approver_1 = User.objects.create_user('approver1', password='x', role='approver-level-1')
+        cls.approver_2 = User.objects.create_user('approver2', password='x', role='approver-level-2')
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.staff)
+
+    @mock.patch('procurement.utils.extract_with_openai', return_value={'vendor': 'Acme', 'items': []})
+    def test_receipt_is_read_from_the_stored_upload(self, extract):
+        approved = seed_requests(3, self.staff, self.staff, self.approver_1, self.approver_2)[2]
+        read = []
+
+        def pages(path):
+            with open(path, 'rb') as handle:
+                read.append(handle.read())
+            return ['Acme receipt']
+
+        receipt = SimpleUploadedFile('receipt.pdf', b'%PDF-1.4 stored receipt', content_type='application/pdf')
+        with mock.patch('procurement.utils.extract_pages_from_pdf', side_effect=pages):
+            response = self.client.post(f'/api/requests/{approved.pk}/submit_receipt/', {'receipt': receipt},
+                                        format='multipart')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(read, [b'%PDF-1.4 stored receipt'])
+        extract.assert_called_once_with('Acme receipt\n', 'receipt')
+
+
+@override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT)
+class DocumentBlobTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('staff', password='x', role='staff')
+        cls.approver_1 = User.objects.create_user('approver1', password='x', role='approver-level-1')
+        cls.approver_2 = User.objects.create_user('approver2', password='x', role='approver-level-2')
+
+    def setUp(self):
+        self.requests = seed_requests(3, self.staff, self.staff, self.approver_1, self.approver_2)
+
+    def upload(self, purchase_request, content):
+        purchase_request.proforma.save('quote.pdf', ContentFile(content))
+        return DocumentBlob.objects.get(name=purchase_request.proforma.name)
+
+    def age(self, *blobs, hours=48):
+        DocumentBlob.objects.filter(pk__in=[blob.pk for blob in blobs]).update(
+            last_uploaded_at=timezone.now() - timezone.timedelta(hours=hours)
+        )
+
+    def gc(self):
+        out = StringIO()
+        call_command('gc_document_blobs', stdout=out)
+        return out.getvalue()
+
+    def test_identical_uploads_share_a_counted_blob(self):
+        first, second, third = self.requests
+        shared = self.upload(first, b'%PDF-1.4 shared quote')
+        self.assertEqual(self.upload(second, b'%PDF-1.4 shared quote'), shared)
+        self.assertEqual(DocumentBlob.objects.get(pk=shared.pk).ref_count, 2)
+
+        other = self.upload(second, b'%PDF-1.4 revised quote')
+        self.assertEqual(DocumentBlob.objects.get(pk=shared.pk).ref_count, 1)
+        self.assertEqual(DocumentBlob.objects.get(pk=other.pk).ref_count, 1)
+        self.assertTrue(default_storage.exists(shared.name))
+
+    def test_gc_removes_old_unreferenced_blobs_only(self):
+        first, second, third = self.requests
+        kept = self.upload(first, b'%PDF-1.4 kept')
+        orphan = self.upload(second, b'%PDF-1.4 orphan')
+        recent = self.upload(third, b'%PDF-1.4 recent')
+        document_text.store_text(orphan.digest, ['orphan'], 'pdfplumber', EXTRACTOR_VERSION)
+        PurchaseRequest.objects.filter(pk__in=[second.pk, third.pk]).update(proforma='')
+        # Drifted: the queryset update above left the counts at 1
+        self.age(kept, orphan)
+        DocumentBlob.objects.filter(pk=kept.pk).update(ref_count=5)
+
+        self.assertIn('Fixed 3 reference counts, removed 1 orphaned blobs', self.gc())
+        self.assertEqual(DocumentBlob.objects.get(pk=kept.pk).ref_count, 1)
+        self.assertFalse(DocumentBlob.objects.filter(pk=orphan.pk).exists())
+        self.assertFalse(default_storage.exists(orphan.name))
+        self.assertFalse(DocumentText.objects.exists())
+        # Unreferenced too, but inside the grace period
+        self.assertEqual(DocumentBlob.objects.get(pk=recent.pk).ref_count, 0)
+        self.assertTrue(default_storage.exists(kept.name) and default_storage.exists(recent.name))
+
+    def test_reuploads_win_over_gc(self):
+        first, second, _ = self.requests
+        orphan = self.upload(first, b'%PDF-1.4 quote')
+        PurchaseRequest.objects.filter(pk=first.pk).update(proforma='')
+        DocumentBlob.objects.filter(pk=orphan.pk).update(ref_count=0)
+        self.age(orphan)
+        cutoff = timezone.now() - timezone.timedelta(hours=24)
+
+        # Listed as an orphan, then uploaded again before the lock was taken
+        self.upload(second, b'%PDF-1.4 quote')
+        self.assertEqual(GCDocumentBlobs().remove_orphan(orphan.pk, cutoff, dry_run=False), 0)
+        self.assertTrue(default_storage.exists(orphan.name))
+
+        # A file lost anyway is written again by the next upload of its bytes
+        os.remove(default_storage.path(orphan.name))
+        self.upload(first, b'%PDF-1.4 quote')
+        with default_storage.open(orphan.name) as handle:
+            self.assertEqual(handle.read(), b'%PDF-1.4 quote')
+
+
+@override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT)
+class DocumentTextTests(TestCase):
+    PAGES = ['Acme Supplies quote 1041', '', 'Paper, 10 reams\nToner, 2 boxes ' * 20]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('staff', password='x', role='staff')
+        cls.approver_1 = User.objects.create_user('approver1', password='x', role='approver-level-1')
+        cls.approver_2 = User.objects.create_user('approver2', password='x', role='approver-level-2')
+
+    def with_proforma(self, content=b'%PDF-1.4 quote 1041'):
+        purchase_request = seed_requests(1, self.staff, self.staff, self.approver_1, self.approver_2)[0]
+        purchase_request.proforma.save('quote.pdf', ContentFile(content))
+        return purchase_request
+
+    def test_text_is_stored_compressed_with_page_offsets(self):
+        document_text.store_text('a' * 64, self.PAGES, 'pdfplumber', 2)
+        stored = DocumentText.objects.get()
+        text = ''.join(page + '\n' for page in self.PAGES if page)
+        self.assertEqual(stored.text, text)
+        self.assertLess(len(bytes(stored.compressed_text)), len(text.encode()) // 4)
+        self.assertEqual(stored.page_offsets, [0, 25, 25])
+        self.assertEqual(stored.pages(), [self.PAGES[0] + '\n', '', self.PAGES[2] + '\n'])
+        self.assertEqual(stored.char_count, len(text))
+
+        self.assertEqual(document_text.load_text('a' * 64, 2), stored)
+        self.assertIsNone(document_text.load_text('a' * 64, 3))
+
+    @mock.patch('procurement.utils.extract_pages_from_pdf')
+    def test_documents_are_read_once(self, extract):
+        extract.return_value = self.PAGES
+        proforma = self.with_proforma().proforma
+        text = extract_document_text(proforma)
+        self.assertEqual(extract_document_text(proforma), text)
+        self.assertEqual(extract.call_count, 1)
+        stored = DocumentText.objects.get()
+        self.assertEqual((stored.digest, stored.extractor, stored.extractor_version),
+                         (document_text.document_digest(proforma), 'pdfplumber', EXTRACTOR_VERSION))
+
+        # The same content uploaded again shares the stored text
+        self.assertEqual(extract_document_text(self.with_proforma().proforma), text)
+        self.assertEqual(extract.call_count, 1)
+
+        extract.return_value = ['Acme Supplies quote 1041, corrected']
+        self.assertEqual(extract_document_text(proforma, reextract=True), 'Acme Supplies quote 1041, corrected\n')
+        self.assertEqual(DocumentText.objects.get().pages(), ['Acme Supplies quote 1041, corrected\n'])
+
+    @mock.patch('procurement.utils.extract_pages_from_pdf', return_value=['  '])
+    def test_failed_extractions_are_not_stored(self, extract):
+        proforma = self.with_proforma().proforma
+        extract_document_text(proforma)
+        extract_document_text(proforma)
+        self.assertEqual(extract.call_count, 2)
+        self.assertFalse(DocumentText.objects.exists())
+
+    def test_search_reads_the_stored_text(self):
+        with mock.patch('procurement.utils.extract_pages_from_pdf', return_value=self.PAGES):
+            purchase_request = self.with_proforma()
+            extract_document_text(purchase_request.proforma)
+        digest = document_text.document_digest(purchase_request.proforma)
+        self.assertEqual(list(document_text.search_text('TONER')), [(digest, [3])])
+        self.assertEqual(list(document_text.search_text('quote 1041')), [(digest, [1])])
+        self.assertEqual(list(document_text.search_text('toner', digests=['b' * 64])), [])
+
+        out = StringIO()
+        call_command('search_documents', 'toner', stdout=out)
+        self.assertIn(f'#{purchase_request.pk} {purchase_request.title}: proforma, page 3', out.getvalue())
+        call_command('search_documents', 'toner', kind=['receipt'], stdout=out)
+        self.assertIn('0 documents match', out.getvalue())
+
+
+@override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT, PREVIEW_PAGES=1)
+class PreviewTests(TestCase):
+    def test_images_render_through_the_document_stack(self):
+        from PIL import Image
+
+        name = default_storage.save('previews-test/photo.png', ContentFile(b''))
+        Image.new('RGB', (600, 300), 'white').save(default_storage.path(name))
+        with mock.patch('procurement.previews.document_stack', wraps=previews.document_stack) as stack:
+            previews.generate_previews(name)
+        stack.assert_called_once()
+        key = previews.preview_key(name)
+        with Image.open(default_storage.path(previews.preview_name(key, 128))) as thumbnail:
+            self.assertEqual(thumbnail.size, (128, 64))
+
+    @override_settings(PREVIEW_QUEUE_SIZE=2)
+    def test_the_queue_is_bounded(self):
+        started, release = threading.Event(), threading.Event()
+
+        def render(name):
+            started.set()
+            release.wait(5)
+
+        try:
+            self.assertTrue(previews._submit(render, 'a.pdf'))
+            started.wait(5)
+            # Already queued: not queued twice
+            self.assertTrue(previews._submit(render, 'a.pdf'))
+            self.assertTrue(previews._submit(render, 'b.pdf'))
+            with self.assertLogs('procurement.previews', 'WARNING'):
+                self.assertFalse(previews._submit(render, 'c.pdf'))
+        finally:
+            release.set()
+        for _ in range(50):
+            if not previews._pending:
+                break
+            time.sleep(0.1)
+        self.assertEqual(previews._pending, set())
+        self.assertTrue(previews._submit(lambda name: None, 'c.pdf'))
+
+
+class MetricsTests(APIClientTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('staff', password='x', role='staff')
+
+    def test_requests_are_timed_and_logged(self):
+        self.client.force_authenticate(self.staff)
+        with self.assertLogs('procurement.requests', 'INFO') as logs:
+            response = self.client.get('/api/requests/')
+        phases = [part.split(';')[0] for part in response['Server-Timing'].split(', ')]
+        self.assertEqual(phases[-1], 'total')
+        self.assertIn('sql', phases)
+        self.assertIn('serialization', phases)
+        self.assertRegex(response['Server-Timing'], r'^(\w+;dur=\d+\.\d, )*total;dur=\d+\.\d$')
+
+        entry = json.loads(JSONFormatter().format(logs.records[-1]))
+        self.assertEqual(entry['message'], 'GET /api/requests/ 200')
+        self.assertEqual(
+            (entry['logger'], entry['method'], entry['endpoint'], entry['status']),
+            ('procurement.requests', 'GET', 'purchaserequest-list', 200),
+        )
+        self.assertGreater(entry['sql_queries'], 0)
+        self.assertEqual(entry['phases']['sql']['calls'], entry['sql_queries'])
+
+    def test_metrics_are_exported_in_prometheus_format(self):
+        self.client.force_authenticate(self.staff)
+        self.client.get('/api/requests/')
+        with self.assertRaises(ValueError):
+            with metrics.timed('render'):
+                raise ValueError
+
+        response = self.client.get('/metrics/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        body = response.content.decode()
+        self.assertIn('# TYPE http_request_duration_seconds histogram', body)
+        self.assertRegex(
+            body, r'http_request_duration_seconds_bucket\{endpoint="purchaserequest-list",le="\+Inf",'
+                  r'method="GET",status="200"\} [1-9]'
+        )
+        self.assertRegex(body, r'http_request_sql_queries_count\{endpoint="purchaserequest-list"\} [1-9]')
+        self.assertRegex(body, r'request_phase_duration_seconds_sum\{phase="serialization"\} \d')
+        self.assertRegex(body, r'request_phase_errors_total\{phase="render"\} [1-9]')
+
+
+@override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT)
+class AuditLogTests(APIClientTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('staff', password='x', role='staff')
+        cls.approver_1 = User.objects.create_user('approver1', password='x', role='approver-level-1')
+        cls.approver_2 = User.objects.create_user('approver2', password='x', role='approver-level-2')
+
+    def test_history_replays_the_timeline(self):
+        self.client.force_authenticate(self.staff)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/requests/', {'title': 'Laptop', 'description': 'd', 'amount': '10.00'},
+                                        format='json')
+        self.assertEqual(response.status_code, 201)
+        purchase_request = PurchaseRequest.objects.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(f'/api/requests/{purchase_request.pk}/', {'amount': '12.50'}, format='json')
+
+        self.client.force_authenticate(self.approver_1)
+        # The approval and the rejection are buffered and written in one INSERT on commit
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.client.patch(f'/api/requests/{purchase_request.pk}/reject/', {'comments': 'Too expensive'},
+                              format='json')
+        with CaptureQueriesContext(connection) as queries:
+            for callback in callbacks:
+                callback()
+        self.assertEqual(sum('INSERT INTO "audit_events"' in query['sql'] for query in queries), 1)
+
+        self.client.force_authenticate(self.staff)
+        history = self.client.get(f'/api/requests/{purchase_request.pk}/history/').json()
+        self.assertEqual(
+            [(event['event_type'], event['actor_username']) for event in history],
+            [('request.created', 'staff'), ('request.updated', 'staff'),
+             ('approval.recorded', 'approver1'), ('request.rejected', 'approver1')],
+        )
+        self.assertEqual(history[1]['data']['changes'], {'amount': ['10.00', '12.50']})
+        self.assertEqual(history[-1]['status'], 'rejected')
+
+    def test_rolled_back_actions_leave_no_events(self):
+        purchase_request = seed_requests(1, self.staff, self.staff, self.approver_1, self.approver_2)[0]
+        self.client.force_authenticate(self.approver_1)
+        with self.captureOnCommitCallbacks(execute=True), \
+                mock.patch('procurement.views.publish_event', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.client.patch(f'/api/requests/{purchase_request.pk}/reject/', {}, format='json')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(f'/api/requests/{purchase_request.pk}/reject/', {}, format='json')
+        self.assertEqual(
+            list(AuditEvent.objects.values_list('event_type', flat=True)),
+            ['approval.recorded', 'request.rejected'],
+        )
+
+
+@override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT)
+class RoutingTests(APIClientTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('staff', password='x', role='staff', department='IT')
+        cls.approver_1 = User.objects.create_user('approver1', password='x', role='approver-level-1', department='IT')
+        cls.other_approver_1 = User.objects.create_user('approver1b', password='x', role='approver-level-1',
+                                                        department='Sales')
+        cls.approver_2 = User.objects.create_user('approver2', password='x', role='approver-level-2')
+        cls.finance = User.objects.create_user('finance', password='x', role='finance', department='IT')
+
+    def setUp(self):
+        super().setUp()
+        # Compiled tables outlive the test transaction that created their rules
+        self.addCleanup(setattr, routing, '_table', None)
+        RoutingRule.objects.create(name='Large IT purchases', priority=10, department='IT',
+                                   min_amount=Decimal('1000'), levels=['approver-level-1', 'finance'],
+                                   same_department=True)
+        RoutingRule.objects.create(name='Small purchases', priority=20, max_amount=Decimal('50'),
+                                   levels=['approver-level-1'])
+
+    def create(self, amount):
+        self.client.force_authenticate(self.staff)
+        response = self.client.post('/api/requests/', {'title': 'Laptop', 'description': 'd', 'amount': amount},
+                                    format='json')
+        self.assertEqual(response.status_code, 201)
+        return PurchaseRequest.objects.get()
+
+    def test_rules_pick_levels_and_approvers(self):
+        self.assertEqual(routing.decide('IT', Decimal('999.99')).levels, routing.DEFAULT_LEVELS)
+        self.assertEqual(routing.decide('Sales', Decimal('5000')).levels, routing.DEFAULT_LEVELS)
+        self.assertEqual(routing.decide('Sales', Decimal('49.99')).levels, ('approver-level-1',))
+
+        purchase_request = self.create('5000.00')
+        self.assertEqual(purchase_request.approval_levels, ['approver-level-1', 'finance'])
+        self.assertEqual(
+            set(purchase_request.routes.values_list('approver__username', flat=True)), {'approver1', 'finance'}
+        )
+        self.client.force_authenticate(self.other_approver_1)
+        self.assertEqual(self.client.get(f'/api/requests/{purchase_request.pk}/').status_code, 404)
+        self.client.force_authenticate(self.approver_2)
+        self.assertEqual(self.client.get(f'/api/requests/{purchase_request.pk}/').status_code, 404)
+
+        for user in (self.approver_1, self.finance):
+            self.client.force_authenticate(user)
+            response = self.client.patch(f'/api/requests/{purchase_request.pk}/approve/', {'approved': True}, format='json')
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['status'], 'approved')
+        self.assertFalse(purchase_request.routes.exists())
+        # Reviewers keep seeing what they approved
+        self.client.force_authenticate(self.approver_1)
+        self.assertEqual(self.client.get(f'/api/requests/{purchase_request.pk}/').status_code, 200)
+
+    def test_amount_change_reroutes(self):
+        purchase_request = self.create('20.00')
+        self.assertEqual(purchase_request.approval_levels, ['approver-level-1'])
+        self.assertEqual(purchase_request.routes.count(), 2)
+
+        self.client.patch(f'/api/requests/{purchase_request.pk}/', {'amount': '200.00'}, format='json')
+        purchase_request.refresh_from_db()
+        self.assertEqual(purchase_request.approval_levels, list(routing.DEFAULT_LEVELS))
+        self.assertEqual(purchase_request.routes.count(), 3)
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    """Just enough of an SMTP server on localhost to collect the messages sent to it"""
+    daemon_threads = True
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            self.wfile.write(b'220 localhost\r\n')
+            for line in self.rfile:
+                command = line[:4].upper()
+                if command == b'DATA':
+                    self.wfile.write(b'354 End data with <CR><LF>.<CR><LF>\r\n')
+                    lines = []
+                    for data in self.rfile:
+                        if data == b'.\r\n':
+                            break
+                        lines.append(data)
+                    self.server.messages.append(message_from_bytes(b''.join(lines)))
+                if command == b'QUIT':
+                    self.wfile.write(b'221 Bye\r\n')
+                    return
+                self.wfile.write(b'250 OK\r\n')
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), self.Handler)
+        self.messages = []
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+@override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT, DOCUMENT_THROTTLE_USER_RATES={}, DOCUMENT_THROTTLE_ROLE_RATES={})
+class NotificationTests(APIClientTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('staff', 'staff@example.com', 'x', role='staff')
+        cls.approver_1 = User.objects.create_user('approver1', 'approver1@example.com', 'x', role='approver-level-1')
+        cls.approver_2 = User.objects.create_user('approver2', 'approver2@example.com', 'x', role='approver-level-2')
+
+    def setUp(self):
+        super().setUp()
+        self.smtp = SMTPSink()
+        self.addCleanup(self.smtp.stop)
+        smtp_settings = override_settings(
+            EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend',
+            EMAIL_HOST='127.0.0.1', EMAIL_PORT=self.smtp.server_address[1],
+        )
+        smtp_settings.enable()
+        self.addCleanup(smtp_settings.disable)
+
+    def create(self, title):
+        self.client.force_authenticate(self.staff)
+        response = self.client.post('/api/requests/', {'title': title, 'description': 'd', 'amount': '10.00'},
+                                    format='json')
+        self.assertEqual(response.status_code, 201)
+        return PurchaseRequest.objects.get(title=title)
+
+    def test_events_go_out_as_one_digest_per_user(self):
+        first, second = self.create('Laptop'), self.create('Desk')
+        self.assertEqual(Notification.objects.filter(event_type='request.created').count(), 4)
+        self.client.force_authenticate(self.approver_1)
+        self.client.patch(f'/api/requests/{first.pk}/reject/', {'comments': 'Too expensive'}, format='json')
+
+        # Nothing is due inside the window
+        self.assertEqual(notifications.dispatch(window=3600), (0, 0, 0))
+        self.assertEqual(notifications.dispatch(window=0), (3, 5, 0))
+        self.assertFalse(Notification.objects.filter(sent_at__isnull=True).exists())
+
+        digests = {message['To']: message for message in self.smtp.messages}
+        self.assertEqual(set(digests), {'staff@example.com', 'approver1@example.com', 'approver2@example.com'})
+        self.assertEqual(digests['approver2@example.com']['Subject'], '2 purchase request updates')
+        self.assertIn(f'"Desk" (10.00) (request #{second.pk})', digests['approver2@example.com'].get_payload())
+        self.assertEqual(digests['staff@example.com']['Subject'], 'Your request "Laptop" was rejected: Too expensive')
+        self.assertEqual(notifications.dispatch(window=0), (0, 0, 0))
+
+    def test_failed_digests_are_retried(self):
+        self.create('Laptop')
+        with mock.patch.object(notifications.EmailTransport, 'send', side_effect=OSError):
+            self.assertEqual(notifications.dispatch(window=0), (0, 0, 2))
+        self.assertEqual(list(Notification.objects.values_list('attempts', flat=True)), [1, 1])
+        self.assertEqual(notifications.dispatch(window=0), (2, 2, 0))
+        self.assertEqual(len(self.smtp.messages), 2)
+
+
+@override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT, DOCUMENT_THROTTLE_USER_RATES={}, DOCUMENT_THROTTLE_ROLE_RATES={})
+class ArchiveTests(APIClientTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('staff', password='x', role='staff')
+        cls.approver_1 = User.objects.create_user('approver1', password='x', role='approver-level-1')
+        cls.approver_2 = User.objects.create_user('approver2', password='x', role='approver-level-2')
+
+    def setUp(self):
+        super().setUp()
+        requests = seed_requests(8, self.staff, self.staff, self.approver_1, self.approver_2)
+        # One of the two approved requests has its receipt; the other is still open
+        approved = [request.pk for request in requests if request.status == 'approved']
+        self.with_receipt = approved[0]
+        PurchaseRequest.objects.filter(pk=self.with_receipt).update(receipt='receipts/receipt.pdf')
+        PurchaseRequest.objects.update(created_at=timezone.now() - timezone.timedelta(days=400))
+        self.closed = {approved[0]} | {request.pk for request in requests if request.status == 'rejected'}
+
+    def test_closed_requests_move_with_their_approvals(self):
+        approvals = Approval.objects.filter(purchase_request__in=self.closed).count()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('archive_requests', months=12, batch_size=2, stdout=open(os.devnull, 'w'))
+
+        self.assertEqual(set(ArchivedPurchaseRequest.objects.values_list('pk', flat=True)), self.closed)
+        self.assertFalse(PurchaseRequest.objects.filter(pk__in=self.closed).exists())
+        self.assertEqual(PurchaseRequest.objects.count(), 5)
+        self.assertEqual(ArchivedApproval.objects.count(), approvals)
+        self.assertFalse(Approval.objects.filter(purchase_request__in=self.closed).exists())
+        # Change feed clients drop them from the live set
+        self.assertEqual(
+            set(Tombstone.objects.values_list('object_id', 'owner_id')),
+            {(pk, self.staff.pk) for pk in self.closed}
+            | set(ArchivedApproval.objects.values_list('purchase_request_id', 'approver_id')),
+        )
+
+        self.client.force_authenticate(self.staff)
+        listed = self.client.get('/api/requests/', {'archived': 'true'}).json()
+        self.assertEqual({request['id'] for request in listed['results']}, self.closed)
+        self.assertEqual(len(self.client.get('/api/requests/').json()['results']), 5)
+
+        pk = self.with_receipt
+        response = self.client.get(f'/api/requests/{pk}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['status'], 'approved')
+        self.assertIsNotNone(response.json()['receipt'])
+        self.assertEqual(self.client.get(f'/api/requests/{pk}/history/').status_code, 200)
+        self.client.force_authenticate(self.approver_1)
+        self.assertEqual(self.client.get(f'/api/requests/{pk}/').json()['approvals'][0]['approver']['username'],
+                         'approver1')
+        self.assertEqual(self.client.patch(f'/api/requests/{pk}/approve/', {'approved': True},
+                                           format='json').status_code, 404)
+
+    def test_recent_requests_stay(self):
+        call_command('archive_requests', months=24, stdout=open(os.devnull, 'w'))
+        self.assertFalse(ArchivedPurchaseRequest.objects.exists())
+
+
+@override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT, DOCUMENT_THROTTLE_USER_RATES={}, DOCUMENT_THROTTLE_ROLE_RATES={},
+                   FX_BASE_CURRENCY='USD')
+class CurrencyTests(APIClientTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('staff', password='x', role='staff')
+        ExchangeRate.objects.bulk_create([
+            ExchangeRate(currency='EUR', rate_date=timezone.localdate() - timezone.timedelta(days=30), rate='1.05'),
+            ExchangeRate(currency='EUR', rate_date=timezone.localdate() - timezone.timedelta(days=1), rate='1.10'),
+            ExchangeRate(currency='RWF', rate_date=timezone.localdate() - timezone.timedelta(days=30), rate='0.00075'),
+        ])
+
+    def setUp(self):
+        super().setUp()
+        # Cached rates outlive the test transaction that loaded them
+        fx.rates_changed()
+        self.addCleanup(fx._rates.clear)
+
+    def test_dated_rates_and_batch_conversion(self):
+        today = timezone.localdate()
+        self.assertEqual(fx.rate('EUR', today - timezone.timedelta(days=10)), Decimal('1.05'))
+        self.assertEqual(fx.rate('eur', today), Decimal('1.10'))
+        self.assertIsNone(fx.rate('EUR', today - timezone.timedelta(days=31)))
+        self.assertEqual(fx.rate('USD'), 1)
+
+        fx._rates.clear()
+        with self.assertNumQueries(1):
+            converted = fx.convert_many([('100', 'EUR', today), (Decimal('1000000'), 'RWF', today),
+                                         (5, 'USD', today), (5, 'GBP', today)])
+        self.assertEqual(converted, [Decimal('110.00'), Decimal('750.00'), Decimal('5.00'), None])
+
+    def test_amounts_are_stored_and_totalled_in_the_base_currency(self):
+        self.client.force_authenticate(self.staff)
+        for amount, currency in (('100.00', 'EUR'), ('20000.00', 'RWF'), ('10.00', '')):
+            response = self.client.post('/api/requests/', {'title': 'Chairs', 'description': 'd', 'amount': amount,
+                                                           'currency': currency}, format='json')
+            self.assertEqual(response.status_code, 201)
+        response = self.client.post('/api/requests/', {'title': 'Chairs', 'description': 'd', 'amount': '1',
+                                                       'currency': 'GBP'}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+        created = PurchaseRequest.objects.order_by('pk')
+        self.assertEqual([(request.currency, request.amount_base) for request in created],
+                         [('EUR', Decimal('110.00')), ('RWF', Decimal('15.00')), ('USD', Decimal('10.00'))])
+        # Written before rates were loaded
+        PurchaseRequest.objects.filter(currency='RWF').update(amount_base=None)
+
+        totals = self.client.get('/api/requests/totals/').json()
+        self.assertEqual(totals['total_base'], '135.00')
+        self.assertEqual(totals['unconverted'], 0)
+        self.assertEqual([row['currency'] for row in totals['by_currency']], ['EUR', 'RWF', 'USD'])
+
+    def test_currencies_without_a_rate_yet_are_refused(self):
+        ExchangeRate.objects.create(currency='CHF', rate_date=timezone.localdate() + timezone.timedelta(days=3),
+                                    rate='1.12')
+        fx.rates_changed()
+        self.client.force_authenticate(self.staff)
+        response = self.client.post('/api/requests/', {'title': 'Chairs', 'description': 'd', 'amount': '100.00',
+                                                       'currency': 'CHF'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('No exchange rate for CHF', response.json()['currency'][0])
+        self.assertFalse(PurchaseRequest.objects.exists())
+
+        self.client.post('/api/requests/', {'title': 'Chairs', 'description': 'd', 'amount': '100.00',
+                                            'currency': 'EUR'}, format='json')
+        response = self.client.patch(f'/api/requests/{PurchaseRequest.objects.get().pk}/', {'currency': 'CHF'},
+                                     format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(PurchaseRequest.objects.values_list('currency', 'amount_base').get(),
+                         ('EUR', Decimal('110.00')))
+
+    @mock.patch('procurement.utils.extract_with_openai')
+    def test_receipts_in_another_currency_are_converted(self, extract):
+        po_data = {'vendor': 'Acme', 'total_amount': 110.0, 'currency': 'USD', 'items': []}
+        extract.return_value = {'vendor': 'Acme', 'total_amount': 100, 'currency': 'EUR', 'items': []}
+        _, validation = validate_receipt(None, po_data, text='receipt')
+        self.assertFalse(validation['discrepancies'])
+        self.assertIn('Total amount matches after converting EUR to USD', validation['matches'])
+
+        extract.return_value = {'vendor': 'Acme', 'total_amount': 150, 'currency': 'EUR', 'items': []}
+        _, validation = validate_receipt(None, po_data, text='receipt')
+        self.assertEqual([discrepancy['field'] for discrepancy in validation['discrepancies']], ['total_amount'])
+
+
+@override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT, APPROVAL_SLA_HOURS={'approver-level-1': 24, 'approver-level-2': 48},
+                   APPROVAL_SLA_DEFAULT_HOURS=12, SLA_ESCALATION_ROLE='finance')
+class SLATests(APIClientTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('staff', password='x', role='staff')
+        cls.approver_1 = User.objects.create_user('approver1', password='x', role='approver-level-1')
+        cls.approver_2 = User.objects.create_user('approver2', password='x', role='approver-level-2')
+        cls.finance = User.objects.create_user('finance', password='x', role='finance')
+
+    def setUp(self):
+        super().setUp()
+        self.addCleanup(setattr, routing, '_table', None)
+
+    def create(self):
+        self.client.force_authenticate(self.staff)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/requests/', {'title': 'Desk', 'description': 'd',
+                                                           'amount': '300.00'}, format='json')
+        self.assertEqual(response.status_code, 201)
+        return PurchaseRequest.objects.latest('pk')
+
+    def test_deadlines_are_set_on_create_and_move_on_approval(self):
+        purchase_request = self.create()
+        created = purchase_request.created_at
+        self.assertEqual(list(purchase_request.sla_deadlines), ['approver-level-1', 'approver-level-2'])
+        self.assertAlmostEqual(purchase_request.sla_due_at, created + timezone.timedelta(hours=24),
+                               delta=timezone.timedelta(seconds=5))
+
+        self.client.force_authenticate(self.approver_1)
+        response = self.client.patch(f'/api/requests/{purchase_request.pk}/approve/', {'approved': True},
+                                     format='json')
+        self.assertEqual(response.status_code, 200)
+        purchase_request.refresh_from_db()
+        self.assertAlmostEqual(purchase_request.sla_due_at, created + timezone.timedelta(hours=72),
+                               delta=timezone.timedelta(seconds=5))
+        self.assertEqual(response.json()['sla_due_at'], purchase_request.sla_due_at.isoformat().replace('+00:00', 'Z'))
+
+    def test_overdue_requests_are_escalated_once(self):
+        late = self.create()
+        self.create()
+        sla.apply(late, start=timezone.now() - timezone.timedelta(hours=25))
+        late.save(update_fields=['sla_deadlines', 'sla_due_at', 'escalated_at'])
+
+        self.client.force_authenticate(self.approver_1)
+        self.assertEqual(self.client.get('/api/requests/overdue/').json(), {'overdue': 1})
+        response = self.client.get('/api/requests/', {'overdue': 'true'})
+        self.assertEqual([row['id'] for row in response.json()['results']], [late.pk])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(sla.escalate_batch(10), 1)
+        self.assertEqual(sla.escalate_batch(10), 0)
+        escalated = Notification.objects.filter(event_type='request.escalated')
+        self.assertEqual(set(escalated.values_list('recipient__username', flat=True)), {'approver1', 'finance'})
+        self.assertEqual(set(escalated.values_list('purchase_request_id', flat=True)), {late.pk})
+        self.assertIn('overdue for approver-level-1 approval', notifications.describe(escalated.first()))
+        self.assertTrue(AuditEvent.objects.filter(event_type='request.escalated', purchase_request_id=late.pk).exists())
+
+        # Approving the overdue level starts the next deadline, which can be escalated again
+        self.client.patch(f'/api/requests/{late.pk}/approve/', {'approved': True}, format='json')
+        late.refresh_from_db()
+        self.assertIsNone(late.escalated_at)
+        self.assertGreater(late.sla_due_at, timezone.now())
+
+
+@override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT)
+class GenerateDataTests(TestCase):
+    def test_generated_data_is_consistent(self):
+        call_command('generate_data', users=8, requests=40, documents=3, batch_size=15, seed=1, stdout=StringIO())
+        self.assertEqual(User.objects.filter(username__startswith='load-').count(), 8)
+        self.assertTrue(User.objects.get(username='load-finance-3').check_password('loadtest'))
+        self.assertEqual(PurchaseRequest.objects.count(), 40)
+
+        for purchase_request in PurchaseRequest.objects.prefetch_related('approvals__approver'):
+            decisions = [(approval.approver.role, approval.approved) for approval in purchase_request.approvals.all()]
+            with self.subTest(status=purchase_request.status, decisions=decisions):
+                if purchase_request.status == 'approved':
+                    self.assertEqual(sorted(decisions), [('approver-level-1', True), ('approver-level-2', True)])
+                    self.assertTrue(purchase_request.purchase_order)
+                elif purchase_request.status == 'rejected':
+                    self.assertFalse(decisions[-1][1])
+                else:
+                    self.assertIn(decisions, ([], [('approver-level-1', True)]))
+                    self.assertIsNotNone(purchase_request.sla_due_at)
+                self.assertLessEqual(purchase_request.created_at, purchase_request.updated_at)
+
+        # Every row is on the change feed, and the shared documents are counted
+        seqs = [*PurchaseRequest.objects.values_list('change_seq', flat=True),
+                *Approval.objects.values_list('change_seq', flat=True)]
+        self.assertEqual(len(set(seqs)), len(seqs))
+        self.assertEqual(max(seqs), sync.current_change_seq())
+        references = sum(len(list(filter(None, purchase_request.document_names())))
+                         for purchase_request in PurchaseRequest.objects.all())
+        self.assertEqual(sum(DocumentBlob.objects.values_list('ref_count', flat=True)), references)
+
+    def test_requests_need_approvers(self):
+        with self.assertRaisesMessage(CommandError, 'No users with role staff, approver-level-1, approver-level-2'):
+            call_command('generate_data', users=0, requests=5, stdout=StringIO())
+
+
+@override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT)
+class LoadTestTests(LiveServerTestCase):
+    def test_mix_and_percentiles(self):
+        self.assertEqual(parse_mix('list=50,retrieve=,approve=2.5'), {'list': 50, 'retrieve': 1, 'approve': 2.5})
+        with self.assertRaisesMessage(CommandError, "Unknown scenario 'delete'"):
+            parse_mix('list=1,delete=1')
+        self.assertEqual(percentile([], 0.5), 0)
+        self.assertEqual(percentile([1, 2, 3, 4], 0.5), 3)
+        self.assertEqual(percentile([1, 2, 3, 4], 0.99), 4)
+
+    def test_traffic_is_replayed_against_a_server(self):
+        call_command('generate_data', users=4, requests=8, documents=1, seed=1, stdout=StringIO())
+        out = StringIO()
+        # The server's request log would drown the test output
+        with self.assertLogs('procurement.requests', 'INFO'):
+            call_command('loadtest', url=self.live_server_url, duration=0.5, concurrency=1,
+                         mix={'list': 1, 'retrieve': 1}, users_per_role=1, seed=1, stdout=out, stderr=StringIO())
+        lines = {line.split()[0]: line for line in out.getvalue().splitlines()[2:]}
+        self.assertEqual(set(lines), {'list', 'retrieve'})
+        # Only pages and requests that exist are asked for
+        for line in lines.values():
+            self.assertRegex(line, r'  200:\d+$')
+
+        with self.assertRaisesMessage(CommandError, 'run generate_data first'):
+            call_command('loadtest', url=self.live_server_url, prefix='nobody', stdout=StringIO(), stderr=StringIO())
+
+
+
+class StartupTests(TestCase):
+    def test_workers_start_without_the_document_stack(self):
+        out = StringIO()
+        call_command('measure_startup', runs=1, stdout=out)
+        self.assertRegex(out.getvalue(), r'^startup \d+ ms, peak RSS \d+\.\d MiB \(median of 1 runs\)')
+        self.assertIn('document libraries loaded: none', out.getvalue())
+
+        call_command('measure_startup', runs=1, warm_up=True, stdout=out)
+        self.assertRegex(out.getvalue(), r'document stack warm-up \d+ ms')
+        self.assertIn('document libraries loaded: pdfplumber, pytesseract, PIL, openai', out.getvalue())
@@ -0,0 +1,146 @@
+"""
+Limits on the actions that run document extraction and PDF generation.
+
+Rates are token buckets kept in the database so every worker process draws
+from the same bucket: one per user, and one shared by all users of a role.
+A request takes a token from both or from neither. On top of that, at most
+EXTRACTION_SLOTS requests process documents at once; a slot is a leased row
+taken with a conditional UPDATE and released when the response is finalized
+(or when the lease runs out, should the worker die). Requests whose
+Idempotency-Key already has an outcome are not throttled: they get it
+replayed instead of running the action again (see
+PurchaseRequestViewSet.check_throttles).
+"""
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework.throttling import BaseThrottle
+
+from .models import RateLimitBucket, ExtractionSlot
+
+
+_PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+_slots_created = 0
+
+
+def parse_rate(rate):
+    """'30/hour' -> (30, 3600), or None for no limit"""
+    if not rate:
+        return None
+    count, period = rate.split('/')
+    return int(count), _PERIODS[period[0]]
+
+
+def take_tokens(limits):
+    """
+    Take one token from each bucket in {key: (capacity, period)}, or from
+    none of them. None when granted, otherwise the seconds until every bucket
+    has a token.
+    """
+    with transaction.atomic():
+        now = timezone.now()
+        refilled, wait = {}, 0
+        # A fixed lock order, so requests sharing buckets can't deadlock
+        for key, (capacity, period) in sorted(limits.items()):
+            refill_rate = capacity / period
+            bucket, created = RateLimitBucket.objects.select_for_update().get_or_create(
+                key=key, defaults={'tokens': capacity, 'updated_at': now}
+            )
+            elapsed = max((now - bucket.updated_at).total_seconds(), 0)
+            refilled[key] = min(capacity, bucket.tokens + elapsed * refill_rate)
+            if refilled[key] < 1:
+                wait = max(wait, (1 - refilled[key]) / refill_rate)
+        if wait:
+            # Refused; no bucket is charged, the refill is recomputed next time
+            return wait
+        for key, tokens in refilled.items():
+            RateLimitBucket.objects.filter(pk=key).update(tokens=tokens - 1, updated_at=now)
+    return None
+
+
+def _ensure_slots():
+    global _slots_created
+    if _slots_created < settings.EXTRACTION_SLOTS:
+        ExtractionSlot.objects.bulk_create(
+            [ExtractionSlot(slot=slot) for slot in range(settings.EXTRACTION_SLOTS)],
+            ignore_conflicts=True,
+        )
+        _slots_created = settings.EXTRACTION_SLOTS
+
+
+def acquire_extraction_slot():
+    """Lease a free extraction slot, returning (slot, holder) or None when all are busy"""
+    _ensure_slots()
+    now = timezone.now()
+    holder = uuid.uuid4().hex
+    free = Q(holder='') | Q(leased_until__lt=now)
+    candidates = ExtractionSlot.objects.filter(free, slot__lt=settings.EXTRACTION_SLOTS)
+    for slot in candidates.values_list('slot', flat=True):
+        # Another process may take the slot in between; then try the next one
+        leased = ExtractionSlot.objects.filter(free, pk=slot).update(
+            holder=holder, leased_until=now + timedelta(seconds=settings.EXTRACTION_SLOT_LEASE)
+        )
+        if leased:
+            return slot, holder
+    return None
+
+
+def release_extraction_slot(request):
+    """Give back the slot leased for `request`, if any"""
+    lease = getattr(request, 'extraction_slot', None)
+    if lease is None:
+        return
+    request.extraction_slot = None
+    slot, holder = lease
+    ExtractionSlot.objects.filter(pk=slot, holder=holder).update(holder='', leased_until=None)
+
+
+class DocumentRateThrottle(BaseThrottle):
+    """
+    Token buckets per user (DOCUMENT_THROTTLE_USER_RATES, sized by role) and
+    shared by every user of a role (DOCUMENT_THROTTLE_ROLE_RATES), checked
+    together so a refused request charges neither.
+    """
+
+    def get_limits(self, request):
+        role = request.user.role
+        limits = {}
+        for key, rates in ((f"documents:user:{request.user.pk}", settings.DOCUMENT_THROTTLE_USER_RATES),
+                           (f"documents:role:{role}", settings.DOCUMENT_THROTTLE_ROLE_RATES)):
+            rate = parse_rate(rates.get(role))
+            if rate is not None:
+                limits[key] = rate
+        return limits
+
+    def allow_request(self, request, view):
+        self.wait_seconds = None
+        limits = self.get_limits(request)
+        if not limits:
+            return True
+        self.wait_seconds = take_tokens(limits)
+        return self.wait_seconds is None
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class ExtractionSlotThrottle(BaseThrottle):
+    """Refuse the request while EXTRACTION_SLOTS others are processing documents"""
+
+    def allow_request(self, request, view):
+        lease = acquire_extraction_slot()
+        if lease is None:
+            return False
+        request.extraction_slot = lease
+        return True
+
+    def wait(self):
+        return settings.EXTRACTION_SLOT_RETRY_AFTER
+
+
+DOCUMENT_THROTTLES = [DocumentRateThrottle, ExtractionSlotThrottle]
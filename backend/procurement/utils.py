@@ -1,44 +1,49 @@
 import os
 import json
-import pdfplumber
-import pytesseract
-from PIL import Image
-from io import BytesIO
+import logging
+from decimal import Decimal
 from django.core.files.base import ContentFile
 from django.conf import settings
-import openai
+from django.utils import timezone
 
-# Set OpenAI API key
-if settings.OPENAI_API_KEY:
-    openai.api_key = settings.OPENAI_API_KEY
+from . import fx
+from .document_text import document_digest, join_pages, load_text, store_text
+from .extraction import document_stack
+from .metrics import timed_function
+from .vendors import normalize_vendor_name, resolve_vendor, vendor_name_from
 
+logger = logging.getLogger(__name__)
 
-def extract_text_from_pdf(file_path):
-    """Extract text from PDF using pdfplumber"""
+
+# Bump when extraction changes, so reextract_documents refreshes the stored text
+EXTRACTOR_VERSION = 1
+
+
+@timed_function('pdf_text')
+def extract_pages_from_pdf(file_path):
+    """Extract the text of each page of a PDF using pdfplumber"""
     try:
-        text = ""
-        with pdfplumber.open(file_path) as pdf:
-            for page in pdf.pages:
-                page_text = page.extract_text()
-                if page_text:
-                    text += page_text + "\n"
-        return text
+        with document_stack().pdfplumber.open(file_path) as pdf:
+            return [page.extract_text() or "" for page in pdf.pages]
     except Exception as e:
-        print(f"Error extracting text with pdfplumber: {e}")
-        return ""
+        logger.warning("Error extracting text with pdfplumber: %s", e, extra={'file': str(file_path)})
+        return []
 
 
+@timed_function('ocr')
 def extract_text_from_image(image_file):
     """Extract text from image using OCR"""
     try:
-        image = Image.open(image_file)
-        text = pytesseract.image_to_string(image)
+        stack = document_stack()
+        image = stack.Image.open(image_file)
+        text = stack.pytesseract.image_to_string(image)
         return text
     except Exception as e:
-        print(f"Error extracting text from image: {e}")
+        logger.warning("Error extracting text from image: %s", e, extra={'file': str(image_file)})
         return ""
 
 
+@timed_function('openai')
 def extract_with_openai(text, document_type="proforma"):
     """Use OpenAI to extract structured data from text"""
     if not settings.OPENAI_API_KEY:
@@ -80,7 +85,7 @@ def extract_with_openai(text, document_type="proforma"):
         else:
             return {"error": "Unknown document type"}
 
-        response = openai.chat.completions.create(
+        response = document_stack().openai.chat.completions.create(
             model="gpt-3.5-turbo",
             messages=[
                 {"role": "system", "content": "You are a helpful assistant that extracts structured data from documents. Always respond with valid JSON."},
@@ -107,21 +112,43 @@ def extract_with_openai(text, document_type="proforma"):
             return {"raw_response": content}
 
     except Exception as e:
-        print(f"Error with OpenAI extraction: {e}")
+        logger.exception("Error with OpenAI extraction", extra={'document_type': document_type})
         return {"error": str(e)}
 
 
-def extract_proforma_data(proforma_file):
-    """Extract data from proforma document"""
-    file_path = proforma_file.path
+def extract_document_text(document_file, reextract=False):
+    """
+    Text of an uploaded PDF or image; None for unsupported formats. Documents
+    read before are served from the document text store, unless `reextract`.
+    """
+    file_path = document_file.path
     file_extension = os.path.splitext(file_path)[1].lower()
+    if file_extension not in ['.pdf', '.jpg', '.jpeg', '.png']:
+        return None
+
+    digest = document_digest(document_file)
+    if not reextract:
+        stored = load_text(digest, EXTRACTOR_VERSION)
+        if stored is not None:
+            return stored.text
 
     # Extract text based on file type
     if file_extension == '.pdf':
-        text = extract_text_from_pdf(file_path)
-    elif file_extension in ['.jpg', '.jpeg', '.png']:
-        text = extract_text_from_image(file_path)
+        pages, extractor = extract_pages_from_pdf(file_path), 'pdfplumber'
     else:
+        pages, extractor = [extract_text_from_image(file_path)], 'tesseract'
+    text, _ = join_pages(pages)
+    # Failed extractions are not stored, the next attempt tries again
+    if text.strip():
+        store_text(digest, pages, extractor, EXTRACTOR_VERSION)
+    return text
+
+
+def extract_proforma_data(proforma_file, text=None):
+    """Extract data from proforma document; pass `text` if it was already extracted"""
+    if text is None:
+        text = extract_document_text(proforma_file)
+    if text is None:
         return {"error": "Unsupported file format"}
 
     if not text.strip():
@@ -129,11 +156,13 @@ def extract_proforma_data(proforma_file):
 
     # Use OpenAI to extract structured data
     extracted_data = extract_with_openai(text, "proforma")
-    extracted_data['raw_text'] = text[:500]  # Store first 500 chars of raw text
+    vendor = resolve_vendor(vendor_name_from(extracted_data))
+    extracted_data['vendor_id'] = vendor.pk if vendor else None
 
     return extracted_data
 
 
+@timed_function('po_generation')
 def generate_purchase_order(purchase_request):
     """Generate a Purchase Order document from approved request"""
     if not purchase_request.proforma_data:
@@ -149,9 +178,13 @@ def generate_purchase_order(purchase_request):
         "created_at": purchase_request.created_at.isoformat(),
         "approved_at": purchase_request.updated_at.isoformat(),
         "vendor": proforma_data.get("vendor", "Unknown"),
+        "vendor_id": purchase_request.proforma_vendor_id,
         "items": proforma_data.get("items", []),
+        # The request's amount is what was approved, in the request's currency
         "total_amount": float(purchase_request.amount),
-        "currency": proforma_data.get("currency", "USD"),
+        "currency": purchase_request.currency or proforma_data.get("currency") or fx.base_currency(),
+        "total_amount_base": float(purchase_request.amount_base) if purchase_request.amount_base is not None else None,
+        "base_currency": fx.base_currency(),
         "terms": proforma_data.get("terms", ""),
         "payment_terms": proforma_data.get("payment_terms", ""),
         "delivery_terms": proforma_data.get("delivery_terms", ""),
@@ -200,20 +233,15 @@ def generate_purchase_order(purchase_request):
     return po_file, po_data
 
 
-def validate_receipt(receipt_file, po_data):
-    """Validate receipt against Purchase Order"""
+def validate_receipt(receipt_file, po_data, po_vendor_id=None, text=None):
+    """Validate receipt against Purchase Order; pass `text` if it was already extracted"""
     if not po_data:
         return {}, {"status": "error", "message": "No PO data available for comparison"}
 
-    file_path = receipt_file.path
-    file_extension = os.path.splitext(file_path)[1].lower()
-
     # Extract text from receipt
-    if file_extension == '.pdf':
-        text = extract_text_from_pdf(file_path)
-    elif file_extension in ['.jpg', '.jpeg', '.png']:
-        text = extract_text_from_image(file_path)
-    else:
+    if text is None:
+        text = extract_document_text(receipt_file)
+    if text is None:
         return {}, {"status": "error", "message": "Unsupported file format"}
 
     if not text.strip():
@@ -229,26 +257,39 @@ def validate_receipt(receipt_file, po_data):
         "matches": [],
     }
 
-    # Validate vendor/seller
-    po_vendor = po_data.get("vendor", "").lower()
-    receipt_vendor = str(receipt_data.get("seller", "")).lower()
+    # Validate vendor/seller: both documents resolve to a vendor ID
+    receipt_vendor_name = vendor_name_from(receipt_data)
+    receipt_vendor = resolve_vendor(receipt_vendor_name)
+    receipt_data['vendor_id'] = receipt_vendor.pk if receipt_vendor else None
+    po_vendor_id = po_vendor_id or po_data.get("vendor_id")
 
-    if po_vendor and receipt_vendor:
-        if po_vendor in receipt_vendor or receipt_vendor in po_vendor:
-            validation_result["matches"].append("Vendor name matches")
-        else:
-            validation_result["discrepancies"].append({
-                "field": "vendor",
-                "po_value": po_data.get("vendor"),
-                "receipt_value": receipt_data.get("seller"),
-                "message": "Vendor name mismatch"
-            })
+    if po_vendor_id and receipt_vendor:
+        vendor_matches = po_vendor_id == receipt_vendor.pk
+    else:
+        # PO issued before vendors were resolved; compare the names
+        po_vendor = normalize_vendor_name(po_data.get("vendor", ""))
+        receipt_vendor_name = normalize_vendor_name(receipt_vendor_name)
+        vendor_matches = None
+        if po_vendor and receipt_vendor_name:
+            vendor_matches = po_vendor in receipt_vendor_name or receipt_vendor_name in po_vendor
+
+    if vendor_matches:
+        validation_result["matches"].append("Vendor name matches")
+    elif vendor_matches is not None:
+        validation_result["discrepancies"].append({
+            "field": "vendor",
+            "po_value": po_data.get("vendor"),
+            "receipt_value": vendor_name_from(receipt_data),
+            "message": "Vendor name mismatch"
+        })
 
     # Validate total amount
     po_total = float(po_data.get("total_amount", 0))
     receipt_total = float(receipt_data.get("total_amount", 0)) if receipt_data.get("total_amount") else 0
+    po_currency = (po_data.get("currency") or fx.base_currency()).upper()
+    receipt_currency = (receipt_data.get("currency") or po_currency).upper()
 
-    if po_total > 0 and receipt_total > 0:
+    if po_total > 0 and receipt_total > 0 and receipt_currency == po_currency:
         if abs(po_total - receipt_total) < 0.01:  # Allow small floating point differences
             validation_result["matches"].append("Total amount matches")
         else:
@@ -258,6 +299,26 @@ def validate_receipt(receipt_file, po_data):
                 "receipt_value": receipt_total,
                 "message": f"Amount mismatch: PO={po_total}, Receipt={receipt_total}"
             })
+    elif po_total > 0 and receipt_total > 0:
+        # Both converted at today's rates, in one lookup
+        po_base, receipt_base = fx.convert_many([(po_total, po_currency, None), (receipt_total, receipt_currency, None)])
+        if po_base is None or receipt_base is None:
+            validation_result["discrepancies"].append({
+                "field": "currency",
+                "po_value": po_currency,
+                "receipt_value": receipt_currency,
+                "message": f"No exchange rate to compare {receipt_currency} with {po_currency}"
+            })
+        elif abs(po_base - receipt_base) <= max(po_base, receipt_base) * Decimal(str(settings.FX_MATCH_TOLERANCE)):
+            validation_result["matches"].append(f"Total amount matches after converting {receipt_currency} to {po_currency}")
+        else:
+            validation_result["discrepancies"].append({
+                "field": "total_amount",
+                "po_value": po_total,
+                "receipt_value": receipt_total,
+                "message": (f"Amount mismatch: PO={po_currency} {po_total}, Receipt={receipt_currency} {receipt_total} "
+                            f"({fx.base_currency()} {po_base} vs {receipt_base})")
+            })
 
     # Validate items (basic check)
     po_items = po_data.get("items", [])
@@ -279,6 +340,6 @@ def validate_receipt(receipt_file, po_data):
         validation_result["status"] = "discrepancy_found"
         validation_result["message"] = f"Found {len(validation_result['discrepancies'])} discrepancies"
 
-    receipt_data['validation_performed_at'] = purchase_request.updated_at.isoformat() if hasattr(purchase_request, 'updated_at') else None
+    receipt_data['validation_performed_at'] = timezone.now().isoformat()
 
     return receipt_data, validation_result
@@ -0,0 +1,108 @@
+"""
+Vendor master built from extracted documents.
+
+Names read off proformas and receipts are normalized (case, accents,
+punctuation and legal suffixes dropped) and resolved to a Vendor row. An
+exact normalized match wins; otherwise the VendorTrigram index yields
+candidates sharing trigrams with the name, scored by trigram similarity the
+way pg_trgm does, and the best one above VENDOR_MATCH_THRESHOLD is reused.
+Only when nothing is close enough is a new vendor created.
+"""
+import re
+import unicodedata
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count
+
+
+# Dropped from the end of a name, so "Acme Ltd." and "ACME Limited" are one vendor
+LEGAL_SUFFIXES = {
+    'co', 'company', 'corp', 'corporation', 'gmbh', 'inc', 'incorporated', 'limited',
+    'llc', 'llp', 'ltd', 'plc', 'sa', 'sarl', 'sas', 'srl',
+}
+
+# Keys the extraction has been seen to put the vendor name under
+VENDOR_KEYS = ('vendor', 'vendor_name', 'seller', 'seller_name', 'supplier', 'supplier_name')
+
+# Only the most promising trigram candidates are scored
+MAX_CANDIDATES = 20
+
+
+def normalize_vendor_name(name):
+    """'  Acmé Supplies, Ltd. ' -> 'acme supplies'"""
+    name = unicodedata.normalize('NFKD', str(name or '')).encode('ascii', 'ignore').decode()
+    name = name.casefold().replace('&', ' and ')
+    words = re.sub(r'[^a-z0-9]+', ' ', name).split()
+    while len(words) > 1 and words[-1] in LEGAL_SUFFIXES:
+        words.pop()
+    return ' '.join(words)[:255]
+
+
+def trigrams(normalized_name):
+    """Trigrams of each word padded with two leading and one trailing space, as pg_trgm does"""
+    result = set()
+    for word in normalized_name.split():
+        padded = f'  {word} '
+        result.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return result
+
+
+def vendor_name_from(data):
+    """The vendor name in extracted document data, or ''"""
+    if not isinstance(data, dict):
+        return ''
+    for key in VENDOR_KEYS:
+        value = data.get(key)
+        if isinstance(value, dict):
+            value = value.get('name')
+        if value and isinstance(value, str):
+            return value.strip()
+    return ''
+
+
+def find_vendor(normalized_name):
+    """The existing vendor matching a normalized name, exactly or by trigram similarity"""
+    from .models import Vendor
+
+    vendor = Vendor.objects.filter(normalized_name=normalized_name).first()
+    if vendor is not None:
+        return vendor
+
+    grams = trigrams(normalized_name)
+    if not grams:
+        return None
+    candidates = Vendor.objects.filter(trigrams__trigram__in=grams) \
+        .annotate(shared=Count('trigrams')) \
+        .order_by('-shared')[:MAX_CANDIDATES]
+
+    best, best_score = None, settings.VENDOR_MATCH_THRESHOLD
+    for candidate in candidates:
+        score = candidate.shared / (len(grams) + candidate.trigram_count - candidate.shared)
+        if score >= best_score:
+            best, best_score = candidate, score
+    return best
+
+
+def resolve_vendor(name):
+    """The Vendor for a document's vendor name, created if nothing similar exists; None for blank names"""
+    from .models import Vendor, VendorTrigram
+
+    normalized = normalize_vendor_name(name)
+    if not normalized:
+        return None
+    vendor = find_vendor(normalized)
+    if vendor is not None:
+        return vendor
+
+    grams = trigrams(normalized)
+    try:
+        with transaction.atomic():
+            vendor = Vendor.objects.create(
+                name=str(name).strip()[:255], normalized_name=normalized, trigram_count=len(grams)
+            )
+            VendorTrigram.objects.bulk_create(VendorTrigram(trigram=gram, vendor=vendor) for gram in grams)
+    except IntegrityError:
+        # Created concurrently under the same normalized name
+        vendor = Vendor.objects.get(normalized_name=normalized)
+    return vendor
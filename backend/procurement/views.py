@@ -1,18 +1,38 @@
+import logging
+import os
+from decimal import Decimal
+from itertools import islice
 from rest_framework import viewsets, status, permissions
-from rest_framework.decorators import action
+from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny, IsAuthenticated
+from django.conf import settings
+from django.core.files.storage import default_storage
 from django.db import transaction, models
+from django.db.models import Prefetch, prefetch_related_objects
+from django.http import FileResponse, HttpResponse, HttpResponseRedirect, Http404
 from django.utils import timezone
-from .models import User, PurchaseRequest, Approval
+from .models import User, PurchaseRequest, Approval, ArchivedPurchaseRequest, AuditEvent, Tombstone
 from .serializers import (
     UserSerializer, UserRegistrationSerializer,
-    PurchaseRequestSerializer, PurchaseRequestCreateSerializer,
+    PurchaseRequestSerializer, PurchaseRequestReadSerializer, PurchaseRequestCreateSerializer,
     PurchaseRequestUpdateSerializer, ApprovalSerializer,
-    ApprovalActionSerializer, ReceiptSubmissionSerializer
+    ApprovalActionSerializer, AuditEventSerializer, ReceiptSubmissionSerializer, represent_approval
 )
 from .permissions import IsStaff, IsApprover, IsFinance, CanEditRequest, CanApproveRequest
-from .utils import extract_proforma_data, generate_purchase_order, validate_receipt
+from . import audit, fx, notifications, routing, sla
+from .downloads import DOCUMENT_FIELDS, document_url
+from .duplicates import index_document, minhash
+from .events import publish_event
+from .idempotency import has_outcome, idempotent
+from .previews import is_previewable, preview_key, preview_name, schedule_previews
+from .streaming import issue_ticket
+from .sync import current_change_seq, PRUNED_COUNTER
+from .throttles import DOCUMENT_THROTTLES, release_extraction_slot
+from .utils import extract_document_text, extract_proforma_data, generate_purchase_order, validate_receipt
+
+logger = logging.getLogger(__name__)
 
 
 class UserViewSet(viewsets.ModelViewSet):
@@ -40,53 +60,179 @@ class UserViewSet(viewsets.ModelViewSet):
 class PurchaseRequestViewSet(viewsets.ModelViewSet):
     queryset = PurchaseRequest.objects.all()
     permission_classes = [IsAuthenticated]
+    # Read-only actions that also find archived requests
+    ARCHIVE_ACTIONS = ('retrieve', 'history', 'document', 'preview')
 
     def get_serializer_class(self):
         if self.action == 'create':
             return PurchaseRequestCreateSerializer
         elif self.action in ['update', 'partial_update']:
             return PurchaseRequestUpdateSerializer
+        elif self.action in ['list', 'retrieve']:
+            return PurchaseRequestReadSerializer
         return PurchaseRequestSerializer
 
     def get_queryset(self):
-        user = self.request.user
-        queryset = PurchaseRequest.objects.all()
-
-        # Staff can only see their own requests
-        if user.role == 'staff':
-            queryset = queryset.filter(created_by=user)
-
-        # Approvers can see all pending requests and ones they've reviewed
-        elif user.role in ['approver-level-1', 'approver-level-2']:
-            queryset = queryset.filter(
-                models.Q(status='pending') | models.Q(approvals__approver=user)
-            ).distinct()
-
-        # Finance can see all requests
-        elif user.role == 'finance':
-            queryset = queryset.all()
+        if self.action in ('list', 'totals') and self.request.query_params.get('archived') == 'true':
+            queryset = ArchivedPurchaseRequest.objects.visible_to(self.request.user)
+        else:
+            queryset = PurchaseRequest.objects.visible_to(self.request.user)
 
         # Filter by status if provided
         status_filter = self.request.query_params.get('status', None)
         if status_filter:
             queryset = queryset.filter(status=status_filter)
+        if self.request.query_params.get('overdue') == 'true':
+            queryset = sla.overdue(queryset)
 
         return queryset.select_related('created_by').prefetch_related('approvals__approver')
 
-    @transaction.atomic
-    def perform_create(self, serializer):
-        purchase_request = serializer.save(created_by=self.request.user)
+    def get_object(self):
+        try:
+            return super().get_object()
+        except Http404:
+            if self.action not in self.ARCHIVE_ACTIONS:
+                raise
+        archived = ArchivedPurchaseRequest.objects.visible_to(self.request.user).select_related(
+            'created_by'
+        ).prefetch_related('approvals__approver').filter(pk=self.kwargs['pk']).first()
+        if archived is None:
+            raise Http404('No PurchaseRequest matches the given query.')
+        self.check_object_permissions(self.request, archived)
+        return archived
+
+    def represent(self, purchase_request, approvals_changed=False):
+        """The read payload of `purchase_request` once an action has changed it"""
+        if approvals_changed:
+            # The approvals get_object() prefetched miss those the action wrote
+            purchase_request._prefetched_objects_cache.pop('approvals', None)
+            prefetch_related_objects(
+                [purchase_request], Prefetch('approvals', queryset=Approval.objects.select_related('approver'))
+            )
+        return PurchaseRequestReadSerializer(purchase_request, context=self.get_serializer_context()).data
+
+    def replay_data(self, pk):
+        """The payload of an Idempotency-Key replay, rebuilt so its document URLs are fresh"""
+        purchase_request = PurchaseRequest.objects.select_related('created_by') \
+            .prefetch_related('approvals__approver').filter(pk=pk).first()
+        if purchase_request is None:
+            return None
+        if self.action == 'create':
+            return self.get_serializer(purchase_request).data
+        return self.represent(purchase_request)
+
+    def get_throttles(self):
+        # Only creating with a proforma runs extraction
+        if self.action == 'create' and 'proforma' in self.request.FILES:
+            return [throttle() for throttle in DOCUMENT_THROTTLES]
+        return super().get_throttles()
+
+    def check_throttles(self, request):
+        # Replays and duplicates of an Idempotency-Key don't run the action again
+        throttles = self.get_throttles()
+        if throttles and has_outcome(request):
+            return
+        # Stop at the first refusal, so an over-limit user doesn't hold an extraction slot
+        for throttle in throttles:
+            if not throttle.allow_request(request, self):
+                self.throttled(request, throttle.wait())
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        release_extraction_slot(request)
+        return super().finalize_response(request, response, *args, **kwargs)
+
+    @idempotent
+    def create(self, request, *args, **kwargs):
+        return super().create(request, *args, **kwargs)
 
-        # Extract proforma data if proforma is uploaded
-        if purchase_request.proforma:
+    def perform_create(self, serializer):
+        user = self.request.user
+        amount = serializer.validated_data['amount']
+        currency = serializer.validated_data.get('currency') or fx.base_currency()
+        amount_base = fx.to_base(amount, currency)
+        if amount_base is None:
+            # Rates only dated after today; routing must not compare the foreign amount
+            raise ValidationError({'currency': [f"No exchange rate for {currency} on {timezone.localdate()}"]})
+        decision = routing.decide(user.department, amount_base)
+        deadlines = sla.schedule(decision.levels, timezone.now())
+
+        # Read the proforma before writing the request: the first write reserves the
+        # change sequence (see procurement.sync), which every other writer waits on
+        # until this transaction commits
+        extracted = {}
+        text = signature = None
+        if serializer.validated_data.get('proforma'):
+            proforma = PurchaseRequest().proforma
+            upload = serializer.validated_data['proforma']
+            proforma.save(upload.name, upload, save=False)
+            extracted['proforma'] = proforma.name
             try:
-                extracted_data = extract_proforma_data(purchase_request.proforma)
-                purchase_request.proforma_data = extracted_data
-                purchase_request.save()
-            except Exception as e:
-                print(f"Error extracting proforma data: {e}")
+                text = extract_document_text(proforma)
+                extracted_data = extract_proforma_data(proforma, text=text)
+                extracted['proforma_data'] = extracted_data
+                extracted['proforma_vendor_id'] = extracted_data.get('vendor_id')
+            except Exception:
+                logger.exception("Error extracting proforma data", extra={'file': proforma.name})
+            signature = minhash(text)
+
+        with transaction.atomic():
+            purchase_request = serializer.save(
+                created_by=user, currency=currency, amount_base=amount_base, approval_levels=list(decision.levels),
+                sla_deadlines=deadlines, sla_due_at=sla.due_at(deadlines, ()), **extracted,
+            )
+            routing.write_routes(purchase_request, decision)
+
+            if signature is not None:
+                try:
+                    if index_document(purchase_request, 'proforma', text, signature=signature):
+                        purchase_request.save()
+                except Exception:
+                    logger.exception("Error checking proforma for duplicates", extra={'request_id': purchase_request.pk})
+
+            audit.record(
+                purchase_request, 'request.created', actor=self.request.user,
+                title=purchase_request.title, amount=purchase_request.amount, currency=purchase_request.currency,
+                approval_levels=purchase_request.approval_levels, routing_rule=decision.rule_id,
+            )
+            if purchase_request.proforma:
+                audit.record(
+                    purchase_request, 'document.uploaded', actor=self.request.user,
+                    kind='proforma', name=purchase_request.proforma.name,
+                    duplicates=[duplicate['id'] for duplicate in purchase_request.duplicate_candidates],
+                )
+            publish_event(purchase_request, 'request.created', actor=self.request.user)
+            notifications.notify(purchase_request, 'request.created')
 
-    @action(detail=True, methods=['patch'], permission_classes=[IsAuthenticated, CanApproveRequest])
+    @transaction.atomic
+    def perform_update(self, serializer):
+        before = audit.snapshot(serializer.instance, serializer.validated_data)
+        purchase_request = serializer.save()
+        changes = audit.changes(before, purchase_request)
+        if changes:
+            audit.record(purchase_request, 'request.updated', actor=self.request.user, changes=changes)
+        if 'amount' in changes or 'currency' in changes:
+            # Converted at the creation date's rate, like when it was created
+            purchase_request.currency = purchase_request.currency or fx.base_currency()
+            purchase_request.amount_base = fx.to_base(
+                purchase_request.amount, purchase_request.currency, purchase_request.created_at
+            )
+            if purchase_request.amount_base is None:
+                raise ValidationError({'currency': [
+                    f"No exchange rate for {purchase_request.currency} on {timezone.localdate(purchase_request.created_at)}"
+                ]})
+            # A new amount may fall under another routing rule
+            decision = routing.decide(purchase_request.created_by.department, purchase_request.routing_amount())
+            purchase_request.approval_levels = list(decision.levels)
+            sla.apply_many([purchase_request])
+            purchase_request.save(update_fields=[
+                'currency', 'amount_base', 'approval_levels', 'sla_deadlines', 'sla_due_at', 'escalated_at',
+                'updated_at',
+            ])
+            routing.write_routes(purchase_request, decision)
+
+    @action(detail=True, methods=['patch'], permission_classes=[IsAuthenticated, CanApproveRequest],
+            throttle_classes=DOCUMENT_THROTTLES)
+    @idempotent
     @transaction.atomic
     def approve(self, request, pk=None):
         purchase_request = self.get_object()
@@ -103,7 +249,7 @@ class PurchaseRequestViewSet(viewsets.ModelViewSet):
             )
 
         # Check if user role can approve
-        if request.user.role not in ['approver-level-1', 'approver-level-2']:
+        if request.user.role not in purchase_request.get_required_approval_levels():
             return Response(
                 {'error': 'You do not have permission to approve'},
                 status=status.HTTP_403_FORBIDDEN
@@ -113,42 +259,68 @@ class PurchaseRequestViewSet(viewsets.ModelViewSet):
         comments = serializer.validated_data.get('comments', '')
 
         # Create or update approval
+        decision = {'approved': approved, 'comments': comments, 'approved_at': timezone.now()}
         approval, created = Approval.objects.get_or_create(
             purchase_request=purchase_request,
-            approver=request.user
+            approver=request.user,
+            defaults=decision,
+        )
+        if not created:
+            for field, value in decision.items():
+                setattr(approval, field, value)
+            approval.save()
+        audit.record(
+            purchase_request, 'approval.recorded', actor=request.user,
+            level=request.user.role, approved=approved, comments=comments,
         )
-        approval.approved = approved
-        approval.comments = comments
-        approval.approved_at = timezone.now()
-        approval.save()
 
         # If rejected, update purchase request status
         if not approved:
             purchase_request.status = 'rejected'
             purchase_request.rejection_reason = comments
             purchase_request.save()
+            audit.record(purchase_request, 'request.rejected', actor=request.user, reason=comments)
+            publish_event(purchase_request, 'request.rejected', actor=request.user, level=request.user.role)
+            routing.clear_routes(purchase_request)
+            notifications.notify(purchase_request, 'request.rejected', reason=comments)
             return Response(
-                PurchaseRequestSerializer(purchase_request).data,
+                self.represent(purchase_request, approvals_changed=True),
                 status=status.HTTP_200_OK
             )
 
         # Check if all required approvals are met
-        if purchase_request.check_approval_status():
+        fully_approved = purchase_request.check_approval_status()
+        if fully_approved:
+            audit.record(purchase_request, 'request.approved', actor=request.user)
+        publish_event(
+            purchase_request, 'request.approved', actor=request.user,
+            level=request.user.role, final=fully_approved
+        )
+        if fully_approved:
+            routing.clear_routes(purchase_request)
+            notifications.notify(purchase_request, 'request.approved')
             # All approvals received, generate PO
             try:
                 po_file, po_data = generate_purchase_order(purchase_request)
                 purchase_request.purchase_order = po_file
                 purchase_request.purchase_order_data = po_data
                 purchase_request.save()
-            except Exception as e:
-                print(f"Error generating PO: {e}")
+                if po_file:
+                    audit.record(
+                        purchase_request, 'document.generated', kind='purchase_order',
+                        name=purchase_request.purchase_order.name, po_number=po_data['po_number'],
+                    )
+                    publish_event(purchase_request, 'request.po_generated', po_number=po_data['po_number'])
+            except Exception:
+                logger.exception("Error generating PO", extra={'request_id': purchase_request.pk})
 
         return Response(
-            PurchaseRequestSerializer(purchase_request).data,
+            self.represent(purchase_request, approvals_changed=True),
             status=status.HTTP_200_OK
         )
 
     @action(detail=True, methods=['patch'], permission_classes=[IsAuthenticated, CanApproveRequest])
+    @idempotent
     @transaction.atomic
     def reject(self, request, pk=None):
         request_data = request.data.copy()
@@ -156,7 +328,9 @@ class PurchaseRequestViewSet(viewsets.ModelViewSet):
         request._full_data = request_data
         return self.approve(request, pk)
 
-    @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
+    @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated],
+            throttle_classes=DOCUMENT_THROTTLES)
+    @idempotent
     @transaction.atomic
     def submit_receipt(self, request, pk=None):
         purchase_request = self.get_object()
@@ -179,30 +353,250 @@ class PurchaseRequestViewSet(viewsets.ModelViewSet):
         if not serializer.is_valid():
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-        purchase_request.receipt = serializer.validated_data['receipt']
+        # Store the upload before reading it; extraction works on the stored file
+        receipt = serializer.validated_data['receipt']
+        purchase_request.receipt.save(receipt.name, receipt, save=False)
 
         # Validate receipt against PO
+        text = None
         try:
+            text = extract_document_text(purchase_request.receipt)
             receipt_data, validation_result = validate_receipt(
                 purchase_request.receipt,
-                purchase_request.purchase_order_data
+                purchase_request.purchase_order_data,
+                po_vendor_id=purchase_request.proforma_vendor_id,
+                text=text,
             )
             purchase_request.receipt_data = receipt_data
+            purchase_request.receipt_vendor_id = receipt_data.get('vendor_id')
             purchase_request.receipt_validation = validation_result
         except Exception as e:
-            print(f"Error validating receipt: {e}")
+            logger.exception("Error validating receipt", extra={'request_id': purchase_request.pk})
             purchase_request.receipt_validation = {
                 'status': 'error',
                 'message': str(e)
             }
+        try:
+            index_document(purchase_request, 'receipt', text)
+        except Exception:
+            logger.exception("Error checking receipt for duplicates", extra={'request_id': purchase_request.pk})
 
         purchase_request.save()
+        audit.record(
+            purchase_request, 'document.uploaded', actor=request.user,
+            kind='receipt', name=purchase_request.receipt.name,
+            duplicates=[duplicate['id'] for duplicate in purchase_request.duplicate_candidates
+                        if duplicate['kind'] == 'receipt'],
+        )
+        audit.record(
+            purchase_request, 'receipt.validated', actor=request.user,
+            validation_status=purchase_request.receipt_validation.get('status'),
+            discrepancies=len(purchase_request.receipt_validation.get('discrepancies', [])),
+        )
+        publish_event(
+            purchase_request, 'request.receipt_validated', actor=request.user,
+            validation_status=purchase_request.receipt_validation.get('status')
+        )
 
         return Response(
-            PurchaseRequestSerializer(purchase_request).data,
+            self.represent(purchase_request),
             status=status.HTTP_200_OK
         )
 
+    @action(detail=True, methods=['get'])
+    def history(self, request, pk=None):
+        """The request's audit trail, oldest first"""
+        purchase_request = self.get_object()
+        events = AuditEvent.objects.filter(purchase_request_id=purchase_request.pk).order_by('created_at', 'id')
+        return Response(AuditEventSerializer(events, many=True).data)
+
+    @action(detail=True, methods=['get'], url_path=r'documents/(?P<kind>[a-z_]+)')
+    def document(self, request, pk=None, kind=None):
+        """Redirect to a signed download URL for one of the request's documents"""
+        if kind not in DOCUMENT_FIELDS:
+            raise Http404('Unknown document')
+        purchase_request = self.get_object()
+        document = getattr(purchase_request, kind)
+        if not document:
+            raise Http404('Document not uploaded')
+        return HttpResponseRedirect(document_url(document, request))
+
+    @action(detail=True, methods=['get'], url_path=r'documents/(?P<kind>[a-z_]+)/preview')
+    def preview(self, request, pk=None, kind=None):
+        """Thumbnail of a document page, cacheable for as long as the document is unchanged"""
+        if kind not in DOCUMENT_FIELDS:
+            raise Http404('Unknown document')
+        try:
+            size = int(request.query_params.get('size', settings.PREVIEW_SIZES[0]))
+            page = int(request.query_params.get('page', 1))
+        except ValueError:
+            size = page = None
+        if size not in settings.PREVIEW_SIZES or not page or not 1 <= page <= settings.PREVIEW_PAGES:
+            return Response(
+                {'error': f'size must be one of {list(settings.PREVIEW_SIZES)} and page at most {settings.PREVIEW_PAGES}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        purchase_request = self.get_object()
+        document = getattr(purchase_request, kind)
+        if not document or not is_previewable(document.name):
+            raise Http404('No previewable document')
+
+        # Versioned URLs never change content; send clients to the current version
+        key = preview_key(document.name)
+        if request.query_params.get('v') != key:
+            params = request.query_params.copy()
+            params['v'] = key
+            response = HttpResponseRedirect(f"{request.path}?{params.urlencode()}")
+            response['Cache-Control'] = 'no-cache'
+            return response
+
+        etag = f'"{key}-{size}-{page}"'
+        if etag in request.headers.get('If-None-Match', ''):
+            response = HttpResponse(status=304)
+            response['ETag'] = etag
+            return response
+
+        path = default_storage.path(preview_name(key, size, page))
+        if not os.path.exists(path):
+            if page > 1 and default_storage.exists(preview_name(key, size)):
+                raise Http404('Document has fewer pages')
+            schedule_previews(document.name)
+            response = Response({'status': 'pending'}, status=status.HTTP_202_ACCEPTED)
+            response['Retry-After'] = '2'
+            return response
+
+        response = FileResponse(open(path, 'rb'), content_type='image/jpeg')
+        response['Cache-Control'] = 'private, max-age=31536000, immutable'
+        response['ETag'] = etag
+        return response
+
+    @action(detail=False, methods=['get'])
+    def overdue(self, request):
+        """How many of the visible pending requests are past their approval deadline"""
+        return Response({'overdue': sla.overdue(PurchaseRequest.objects.visible_to(request.user)).count()})
+
+    @action(detail=False, methods=['get'])
+    def totals(self, request):
+        """Counts and amounts of the visible requests per currency, and their total in the base currency"""
+        queryset = self.get_queryset().order_by()
+        by_currency = list(
+            queryset.values('currency').annotate(
+                count=models.Count('id'), amount=models.Sum('amount'), amount_base=models.Sum('amount_base'),
+            ).order_by('currency')
+        )
+        total_base = sum((row['amount_base'] or 0 for row in by_currency), Decimal(0))
+
+        # Rows written before their currency had a rate: convert them now, a chunk at a time
+        unconverted = 0
+        missing = queryset.filter(amount_base__isnull=True).values_list('amount', 'currency', 'created_at')
+        rows = missing.iterator(chunk_size=2000)
+        while chunk := list(islice(rows, 2000)):
+            for amount_base in fx.convert_many(chunk):
+                if amount_base is None:
+                    unconverted += 1
+                else:
+                    total_base += amount_base
+
+        return Response({
+            'base_currency': fx.base_currency(),
+            'total_base': '{:f}'.format(total_base.quantize(fx.CENT)),
+            'unconverted': unconverted,
+            'by_currency': [
+                {**row, 'currency': row['currency'] or fx.base_currency(),
+                 'amount': '{:f}'.format(row['amount']),
+                 'amount_base': '{:f}'.format(row['amount_base']) if row['amount_base'] is not None else None}
+                for row in by_currency
+            ],
+        })
+
+    @action(detail=False, methods=['get'])
+    def changes(self, request):
+        """Requests, approvals and deletions stamped after the `since` cursor"""
+        try:
+            since = int(request.query_params.get('since', 0))
+            limit = min(max(int(request.query_params.get('limit', 500)), 1), 1000)
+        except ValueError:
+            return Response(
+                {'error': 'since and limit must be integers'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        # Tombstones before the pruning watermark are gone, so the client can't catch up
+        if since and since < current_change_seq(PRUNED_COUNTER):
+            return Response(
+                {'error': 'Cursor expired, a full resync is required'},
+                status=status.HTTP_410_GONE
+            )
+
+        user = request.user
+        changed_requests = PurchaseRequest.objects.filter(change_seq__gt=since)
+        changed_approvals = Approval.objects.filter(change_seq__gt=since)
+        tombstones = Tombstone.objects.filter(change_seq__gt=since)
+        if user.role == 'staff':
+            changed_requests = changed_requests.filter(created_by=user)
+            changed_approvals = changed_approvals.filter(purchase_request__created_by=user)
+        if user.role != 'finance':
+            # Each deletion, or loss of access, is addressed to the users who could see the request
+            tombstones = tombstones.filter(owner_id=user.id)
+
+        # Everything up to `until` is committed; shrink it so no stream returns more than `limit` rows
+        until = current_change_seq()
+        has_more = False
+        for stream in (changed_requests, changed_approvals, tombstones):
+            boundary = list(
+                stream.filter(change_seq__lte=until).order_by('change_seq')
+                .values_list('change_seq', flat=True)[limit - 1:limit + 1]
+            )
+            if len(boundary) > 1:
+                until = boundary[0]
+                has_more = True
+
+        request_ids = set(changed_requests.filter(change_seq__lte=until).values_list('id', flat=True))
+        approvals = list(
+            changed_approvals.filter(change_seq__lte=until)
+            .select_related('approver').order_by('change_seq')
+        )
+        visible_ids = set(
+            PurchaseRequest.objects.visible_to(user)
+            .filter(id__in=request_ids | {approval.purchase_request_id for approval in approvals})
+            .values_list('id', flat=True)
+        )
+
+        # Changed requests the user can't see are left out: they were never theirs, or a
+        # tombstone addressed to them reports the loss of access
+        deleted = {'requests': {}, 'approvals': {}}
+        for model_name, object_id in (
+            tombstones.filter(change_seq__lte=until).order_by('change_seq').values_list('model_name', 'object_id')
+        ):
+            deleted['requests' if model_name == 'purchaserequest' else 'approvals'][object_id] = None
+        if deleted['requests']:
+            # Lost and regained since, or (for finance) lost by someone else
+            still_visible = set(
+                PurchaseRequest.objects.visible_to(user).filter(id__in=deleted['requests']).values_list('id', flat=True)
+            )
+            deleted['requests'] = {pk: None for pk in deleted['requests'] if pk not in still_visible}
+        deleted = {key: list(ids) for key, ids in deleted.items()}
+
+        purchase_requests = (
+            PurchaseRequest.objects.filter(id__in=request_ids & visible_ids)
+            .select_related('created_by').prefetch_related('approvals__approver')
+            .order_by('change_seq')
+        )
+        users = {}
+        return Response({
+            'cursor': until,
+            'has_more': has_more,
+            'requests': PurchaseRequestReadSerializer(
+                purchase_requests, many=True, context=self.get_serializer_context()
+            ).data,
+            'approvals': [
+                represent_approval(approval, users)
+                for approval in approvals if approval.purchase_request_id in visible_ids
+            ],
+            'deleted': deleted,
+        })
+
 
 class ApprovalViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Approval.objects.all()
@@ -214,3 +608,10 @@ class ApprovalViewSet(viewsets.ReadOnlyModelViewSet):
         if user.role in ['approver-level-1', 'approver-level-2']:
             return Approval.objects.filter(approver=user)
         return Approval.objects.none()
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def event_stream_ticket(request):
+    """Ticket for opening /api/events/stream/?ticket=... (see procurement.streaming)"""
+    return Response({'ticket': issue_ticket(request.user, request.auth)})
@@ -0,0 +1,45 @@
+import { useState, useEffect } from 'react';
+import { requestsAPI } from '../services/api';
+
+// Thumbnail of a request document; the server answers 202 while it is still rendering
+const DocumentPreview = ({ requestId, kind, href, size = 512 }) => {
+  const [src, setSrc] = useState(null);
+
+  useEffect(() => {
+    let cancelled = false;
+    let objectUrl = null;
+    let timer = null;
+
+    const load = async (attempt) => {
+      try {
+        const response = await requestsAPI.preview(requestId, kind, size);
+        if (cancelled) return;
+        if (response.status === 202) {
+          if (attempt < 5) timer = setTimeout(() => load(attempt + 1), 2000);
+          return;
+        }
+        objectUrl = URL.createObjectURL(response.data);
+        setSrc(objectUrl);
+      } catch {
+        // No preview for this document; the link below still works
+      }
+    };
+
+    load(0);
+    return () => {
+      cancelled = true;
+      clearTimeout(timer);
+      if (objectUrl) URL.revokeObjectURL(objectUrl);
+    };
+  }, [requestId, kind, size]);
+
+  if (!src) return null;
+
+  return (
+    <a href={href} target="_blank" rel="noopener noreferrer" className="document-preview">
+      <img src={src} alt={`${kind} preview`} />
+    </a>
+  );
+};
+
+export default DocumentPreview;
@@ -1,6 +1,6 @@
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef } from 'react';
 import { useNavigate } from 'react-router-dom';
-import { requestsAPI } from '../services/api';
+import { eventsAPI, requestsAPI } from '../services/api';
 import { useAuth } from '../contexts/AuthContext';
 import './RequestList.css';
 
@@ -12,13 +12,22 @@ const RequestList = () => {
   const { user } = useAuth();
   const navigate = useNavigate();
 
+  const reload = useRef(null);
+
   useEffect(() => {
     loadRequests();
+    reload.current = () => loadRequests(false);
   }, [filter]);
 
-  const loadRequests = async () => {
+  // Refresh quietly when a visible request changes elsewhere
+  useEffect(() => {
+    if (!user) return undefined;
+    return eventsAPI.subscribe(() => reload.current?.());
+  }, [user]);
+
+  const loadRequests = async (showLoading = true) => {
     try {
-      setLoading(true);
+      if (showLoading) setLoading(true);
       const params = filter !== 'all' ? { status: filter } : {};
       const response = await requestsAPI.list(params);
       setRequests(response.data.results || response.data);
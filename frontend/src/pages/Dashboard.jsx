@@ -1,11 +1,21 @@
+import { useEffect, useState } from 'react';
 import { useAuth } from '../contexts/AuthContext';
 import { useNavigate } from 'react-router-dom';
 import RequestList from '../components/RequestList';
+import { requestsAPI } from '../services/api';
 import './Dashboard.css';
 
 const Dashboard = () => {
   const { user, logout } = useAuth();
   const navigate = useNavigate();
+  const [overdue, setOverdue] = useState(0);
+
+  useEffect(() => {
+    if (!user) return;
+    requestsAPI.overdue()
+      .then(response => setOverdue(response.data.overdue))
+      .catch(() => setOverdue(0));
+  }, [user]);
 
   const handleLogout = () => {
     logout();
@@ -47,6 +57,11 @@ const Dashboard = () => {
               {user.role === 'approver-level-2' && 'You can review and approve Level 2 requests.'}
               {user.role === 'finance' && 'You have full access to all requests and data.'}
             </p>
+            {overdue > 0 && (
+              <p className="overdue-count">
+                {overdue} pending {overdue === 1 ? 'request is' : 'requests are'} past their approval deadline
+              </p>
+            )}
           </div>
 
           {user.role === 'staff' && (
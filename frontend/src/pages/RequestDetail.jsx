@@ -1,7 +1,8 @@
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef } from 'react';
 import { useParams, useNavigate } from 'react-router-dom';
-import { requestsAPI } from '../services/api';
+import { requestsAPI, newIdempotencyKey } from '../services/api';
 import { useAuth } from '../contexts/AuthContext';
+import DocumentPreview from '../components/DocumentPreview';
 import './RequestDetail.css';
 
 const RequestDetail = () => {
@@ -14,6 +15,11 @@ const RequestDetail = () => {
   const [actionLoading, setActionLoading] = useState(false);
   const [comments, setComments] = useState('');
   const [receiptFile, setReceiptFile] = useState(null);
+  // One key per action and payload, kept until the server settles it, so a
+  // retry after a timeout or network error doesn't run the action twice
+  const approveKey = useRef(newIdempotencyKey());
+  const rejectKey = useRef(newIdempotencyKey());
+  const receiptKey = useRef(newIdempotencyKey());
 
   useEffect(() => {
     loadRequest();
@@ -33,16 +39,38 @@ const RequestDetail = () => {
     }
   };
 
+  // A retry with the same key may still replay or finish the action, unless the
+  // server answered it for good: a success, or a refusal other than 409 (in progress)
+  const settle = (key, err) => {
+    const status = err?.response?.status;
+    if (!err || (status && status < 500 && status !== 409)) {
+      key.current = newIdempotencyKey();
+    }
+  };
+
+  const handleCommentsChange = (e) => {
+    approveKey.current = newIdempotencyKey();
+    rejectKey.current = newIdempotencyKey();
+    setComments(e.target.value);
+  };
+
+  const handleReceiptChange = (e) => {
+    receiptKey.current = newIdempotencyKey();
+    setReceiptFile(e.target.files[0]);
+  };
+
   const handleApprove = async () => {
     if (!window.confirm('Are you sure you want to approve this request?')) return;
 
     setActionLoading(true);
     try {
-      await requestsAPI.approve(id, comments);
+      await requestsAPI.approve(id, comments, approveKey.current);
+      settle(approveKey);
       await loadRequest();
       setComments('');
       alert('Request approved successfully');
     } catch (err) {
+      settle(approveKey, err);
       alert(err.response?.data?.error || 'Failed to approve request');
     } finally {
       setActionLoading(false);
@@ -59,11 +87,13 @@ const RequestDetail = () => {
 
     setActionLoading(true);
     try {
-      await requestsAPI.reject(id, comments);
+      await requestsAPI.reject(id, comments, rejectKey.current);
+      settle(rejectKey);
       await loadRequest();
       setComments('');
       alert('Request rejected');
     } catch (err) {
+      settle(rejectKey, err);
       alert(err.response?.data?.error || 'Failed to reject request');
     } finally {
       setActionLoading(false);
@@ -78,11 +108,13 @@ const RequestDetail = () => {
 
     setActionLoading(true);
     try {
-      await requestsAPI.submitReceipt(id, receiptFile);
+      await requestsAPI.submitReceipt(id, receiptFile, receiptKey.current);
+      settle(receiptKey);
       await loadRequest();
       setReceiptFile(null);
       alert('Receipt uploaded successfully');
     } catch (err) {
+      settle(receiptKey, err);
       alert(err.response?.data?.error || 'Failed to upload receipt');
     } finally {
       setActionLoading(false);
@@ -91,7 +123,7 @@ const RequestDetail = () => {
 
   const canApprove = () => {
     if (!user || !request) return false;
-    const isApprover = user.role === 'approver-level-1' || user.role === 'approver-level-2';
+    const isApprover = request.approval_levels?.includes(user.role);
     const isPending = request.status === 'pending';
     const hasNotApproved = !request.approvals?.some(a => a.approver.id === user.id);
     return isApprover && isPending && hasNotApproved;
@@ -150,7 +182,10 @@ const RequestDetail = () => {
             </div>
             <div className="info-item">
               <label>Amount:</label>
-              <span>${parseFloat(request.amount).toFixed(2)}</span>
+              <span>
+                {request.currency} {parseFloat(request.amount).toFixed(2)}
+                {request.amount_base && request.amount_base !== request.amount && ` (${request.amount_base} in base currency)`}
+              </span>
             </div>
             <div className="info-item">
               <label>Created By:</label>
@@ -170,6 +205,7 @@ const RequestDetail = () => {
         {request.proforma && (
           <section className="detail-section">
             <h2>Proforma Invoice</h2>
+            <DocumentPreview requestId={request.id} kind="proforma" href={request.proforma} />
             <a href={request.proforma} target="_blank" rel="noopener noreferrer" className="file-link">
               View Proforma Document
             </a>
@@ -214,6 +250,7 @@ const RequestDetail = () => {
         {request.receipt && (
           <section className="detail-section">
             <h2>Receipt</h2>
+            <DocumentPreview requestId={request.id} kind="receipt" href={request.receipt} />
             <a href={request.receipt} target="_blank" rel="noopener noreferrer" className="file-link">
               View Receipt
             </a>
@@ -246,7 +283,7 @@ const RequestDetail = () => {
               <textarea
                 id="comments"
                 value={comments}
-                onChange={(e) => setComments(e.target.value)}
+                onChange={handleCommentsChange}
                 rows="3"
                 placeholder="Add your comments here..."
                 disabled={actionLoading}
@@ -279,7 +316,7 @@ const RequestDetail = () => {
               <input
                 id="receipt"
                 type="file"
-                onChange={(e) => setReceiptFile(e.target.files[0])}
+                onChange={handleReceiptChange}
                 accept=".pdf,.jpg,.jpeg,.png"
                 disabled={actionLoading}
               />
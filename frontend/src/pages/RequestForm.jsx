@@ -1,6 +1,6 @@
-import { useState } from 'react';
+import { useRef, useState } from 'react';
 import { useNavigate } from 'react-router-dom';
-import { requestsAPI } from '../services/api';
+import { requestsAPI, newIdempotencyKey } from '../services/api';
 import './RequestForm.css';
 
 const RequestForm = () => {
@@ -11,15 +11,20 @@ const RequestForm = () => {
     title: '',
     description: '',
     amount: '',
+    currency: 'USD',
     proforma: null,
   });
+  // One key per version of the form, so a double submit creates one request
+  const idempotencyKey = useRef(newIdempotencyKey());
 
   const handleChange = (e) => {
     const { name, value } = e.target;
+    idempotencyKey.current = newIdempotencyKey();
     setFormData(prev => ({ ...prev, [name]: value }));
   };
 
   const handleFileChange = (e) => {
+    idempotencyKey.current = newIdempotencyKey();
     setFormData(prev => ({ ...prev, proforma: e.target.files[0] }));
   };
 
@@ -29,7 +34,7 @@ const RequestForm = () => {
     setError('');
 
     try {
-      await requestsAPI.create(formData);
+      await requestsAPI.create(formData, idempotencyKey.current);
       navigate('/dashboard');
     } catch (err) {
       setError(err.response?.data?.detail || 'Failed to create request');
@@ -80,7 +85,7 @@ const RequestForm = () => {
         </div>
 
         <div className="form-group">
-          <label htmlFor="amount">Amount (USD) *</label>
+          <label htmlFor="amount">Amount *</label>
           <input
             id="amount"
             type="number"
@@ -95,6 +100,20 @@ const RequestForm = () => {
           />
         </div>
 
+        <div className="form-group">
+          <label htmlFor="currency">Currency</label>
+          <input
+            id="currency"
+            type="text"
+            name="currency"
+            value={formData.currency}
+            onChange={handleChange}
+            disabled={loading}
+            maxLength="3"
+            placeholder="USD"
+          />
+        </div>
+
         <div className="form-group">
           <label htmlFor="proforma">Proforma Invoice/Quotation</label>
           <input
@@ -53,6 +53,14 @@ api.interceptors.response.use(
   }
 );
 
+// Sent with actions the server must not run twice. Callers pass the key and
+// keep it for retries of the same action, including a user's retry after a
+// timeout; the retry after a token refresh reuses it too
+export const newIdempotencyKey = () =>
+  window.crypto?.randomUUID?.() ?? `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+
+const idempotent = (key) => ({ 'Idempotency-Key': key });
+
 // Auth API
 export const authAPI = {
   login: (username, password) =>
@@ -73,7 +81,19 @@ export const requestsAPI = {
   get: (id) =>
     api.get(`/requests/${id}/`),
 
-  create: (data) => {
+  preview: (id, kind, size) =>
+    api.get(`/requests/${id}/documents/${kind}/preview/`, {
+      params: { size },
+      responseType: 'blob',
+    }),
+
+  overdue: () =>
+    api.get('/requests/overdue/'),
+
+  changes: (since, limit) =>
+    api.get('/requests/changes/', { params: { since, limit } }),
+
+  create: (data, idempotencyKey) => {
     const formData = new FormData();
     Object.keys(data).forEach(key => {
       if (data[key] !== null && data[key] !== undefined) {
@@ -81,28 +101,100 @@ export const requestsAPI = {
       }
     });
     return api.post('/requests/', formData, {
-      headers: { 'Content-Type': 'multipart/form-data' },
+      headers: { 'Content-Type': 'multipart/form-data', ...idempotent(idempotencyKey) },
     });
   },
 
   update: (id, data) =>
     api.put(`/requests/${id}/`, data),
 
-  approve: (id, comments) =>
-    api.patch(`/requests/${id}/approve/`, { approved: true, comments }),
+  approve: (id, comments, idempotencyKey) =>
+    api.patch(`/requests/${id}/approve/`, { approved: true, comments }, {
+      headers: idempotent(idempotencyKey),
+    }),
 
-  reject: (id, comments) =>
-    api.patch(`/requests/${id}/reject/`, { approved: false, comments }),
+  reject: (id, comments, idempotencyKey) =>
+    api.patch(`/requests/${id}/reject/`, { approved: false, comments }, {
+      headers: idempotent(idempotencyKey),
+    }),
 
-  submitReceipt: (id, receiptFile) => {
+  submitReceipt: (id, receiptFile, idempotencyKey) => {
     const formData = new FormData();
     formData.append('receipt', receiptFile);
     return api.post(`/requests/${id}/submit_receipt/`, formData, {
-      headers: { 'Content-Type': 'multipart/form-data' },
+      headers: { 'Content-Type': 'multipart/form-data', ...idempotent(idempotencyKey) },
     });
   },
 };
 
+// Server-sent request events
+const EVENT_TYPES = [
+  'request.created', 'request.approved', 'request.rejected', 'request.po_generated', 'request.receipt_validated',
+];
+// Reconnects back off exponentially from the first delay up to the ceiling,
+// and stop after this many failures in a row
+const RECONNECT_DELAY = 1000;
+const MAX_RECONNECT_DELAY = 60000;
+const MAX_FAILURES = 8;
+
+export const eventsAPI = {
+  ticket: () =>
+    api.post('/events/ticket/'),
+
+  // Calls onEvent(type, data) for each event the user may see; returns a
+  // function that closes the stream. The stream ends when the access token
+  // expires, so it reconnects with a fresh ticket and resumes after the
+  // last event it received. A server without the stream (e.g. one serving
+  // WSGI only) is given up on after MAX_FAILURES attempts.
+  subscribe: (onEvent) => {
+    let source = null;
+    let retry = null;
+    let lastEventId = null;
+    let failures = 0;
+    let closed = false;
+
+    const connect = async () => {
+      try {
+        const { data } = await eventsAPI.ticket();
+        if (closed) return;
+        const params = new URLSearchParams({ ticket: data.ticket });
+        if (lastEventId) params.set('last_event_id', lastEventId);
+        source = new EventSource(`${API_BASE_URL}/events/stream/?${params}`);
+        source.onopen = () => {
+          failures = 0;
+        };
+        EVENT_TYPES.forEach((type) => source.addEventListener(type, (event) => {
+          lastEventId = event.lastEventId;
+          onEvent(type, JSON.parse(event.data));
+        }));
+        source.onerror = () => {
+          source.close();
+          reconnect();
+        };
+      } catch {
+        reconnect();
+      }
+    };
+    const reconnect = () => {
+      if (closed) return;
+      failures += 1;
+      if (failures > MAX_FAILURES) {
+        console.error('Request events unavailable, giving up');
+        return;
+      }
+      const delay = Math.min(RECONNECT_DELAY * 2 ** (failures - 1), MAX_RECONNECT_DELAY);
+      retry = setTimeout(connect, delay);
+    };
+
+    connect();
+    return () => {
+      closed = true;
+      clearTimeout(retry);
+      source?.close();
+    };
+  },
+};
+
 // Approvals API
 export const approvalsAPI = {
   list: () =>